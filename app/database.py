@@ -1,24 +1,102 @@
 # app/database.py
 
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from dotenv import load_dotenv
 
+from app.metrics import MongoCommandMetrics
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGO_URI = os.getenv("MONGO_URI")
+# Conexiones por proceso: las mínimas se abren al arrancar y se mantienen abiertas
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+# "memory" usa colecciones en memoria (app/memory_db.py) para pruebas y benchmarks sin MongoDB;
+# MEMORY_DB_LATENCY_MS simula lo que tardaría cada operación contra el servidor
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "mongo")
+MEMORY_DB_LATENCY_MS = float(os.getenv("MEMORY_DB_LATENCY_MS", "0"))
+
+if DATABASE_BACKEND == "memory":
+    from app.memory_db import MemoryDatabase, MemoryGridFSBucket
+
+    client = None
+    db = MemoryDatabase(latency=MEMORY_DB_LATENCY_MS / 1000)
+    logger.info("Usando la base de datos en memoria (DATABASE_BACKEND=memory).")
+else:
+    # Crear el cliente no abre conexiones: la primera se abre en `connect()`, al arrancar la aplicación.
+    # Configuramos un timeout para evitar que se congele; el listener mide cada comando para /metrics
+    client = AsyncIOMotorClient(
+        MONGO_URI,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        event_listeners=[MongoCommandMetrics()],
+    )
+    db = client.intellidocs_db
+
+
+async def ping(timeout: float | None = None) -> float:
+    """Comprueba que MongoDB responde. Devuelve lo que tardó, en segundos."""
+    start = time.perf_counter()
+    if client is not None:
+        await asyncio.wait_for(client.admin.command("ping"), timeout)
+    return time.perf_counter() - start
 
-# Configuramos la conexión con un timeout para evitar que se congele
-client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=5000)
 
-try:
-    # Comprobar la conexión al iniciar
-    client.admin.command('ping')
-    print("Successfully connected to MongoDB.")
-except Exception as e:
-    print(f"Failed to connect to MongoDB: {e}")
+async def connect() -> None:
+    """Abre el pool de conexiones comprobando que el servidor responde; falla si no lo hace."""
+    try:
+        seconds = await ping()
+    except Exception as e:
+        logger.error("No se pudo conectar con MongoDB: %s", e)
+        raise
+    if client is not None:
+        logger.info("Conectado a MongoDB en %.0f ms (pool %d-%d).", seconds * 1000,
+                    MONGO_MIN_POOL_SIZE, MONGO_MAX_POOL_SIZE)
+
+
+def close() -> None:
+    if client is not None:
+        client.close()
+
+def stored_datetime(value: datetime) -> datetime:
+    """
+    La fecha tal como la devuelve MongoDB al leerla: UTC sin zona y con precisión de
+    milisegundos. Los registros que se devuelven recién creados, sin volver a leerlos,
+    la usan para serializarse igual que cuando se leen después.
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
 
 
-db = client.intellidocs_db
 document_collection = db.get_collection("documents")
-user_collection = db.get_collection("users")
\ No newline at end of file
+user_collection = db.get_collection("users")
+analysis_cache_collection = db.get_collection("analysis_cache")
+job_collection = db.get_collection("ingestion_jobs")
+search_index_collection = db.get_collection("search_index")
+document_text_collection = db.get_collection("document_texts")
+reanalysis_job_collection = db.get_collection("reanalysis_jobs")
+user_stats_collection = db.get_collection("user_stats")
+
+# Los PDF pendientes de procesar se guardan en GridFS hasta que termina su trabajo
+_upload_bucket = MemoryGridFSBucket() if DATABASE_BACKEND == "memory" else None
+
+
+def get_upload_bucket():
+    """
+    Bucket de GridFS de las subidas. Se crea en el primer uso: crearlo al importar ataría
+    el cliente de Motor al event loop que hubiera entonces, no al de la aplicación.
+    """
+    global _upload_bucket
+    if _upload_bucket is None:
+        _upload_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="uploads")
+    return _upload_bucket
@@ -1,14 +1,118 @@
 # app/main.py
 
+import time
+# Antes que nada: el tiempo de importar la aplicación es parte del arranque en frío
+_import_started = time.perf_counter()
+
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager, contextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 # 1. Importamos el middleware de CORS
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import documents, auth
+from app import database
+from app.routers import documents, auth, system, health
+from app.services.ingestion import ingestion_pool
+from app.services.reanalysis import reanalysis_runner, ensure_reanalysis_indexes
+from app.services.user_stats import stats_reconciler
+from app.security import password_hasher
+from app.services.pdf_extraction import pdf_extractor
+from app.services.search import search_index
+from app.services.document_listing import ensure_document_indexes
+from app.repositories import user_repository
+from app.uploads import UploadSizeLimitMiddleware, MAX_BATCH_UPLOAD_BYTES
+from app.serialization import FastJSONResponse
+from app.metrics import MetricsMiddleware, registry, event_loop_monitor, profiler, startup_seconds
+from app.services.llm_scheduler import llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Con muchos workers que arrancan y paran a menudo, puede bastar con que cree los índices uno solo
+ENSURE_INDEXES_ON_STARTUP = os.getenv("ENSURE_INDEXES_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+
+async def ensure_indexes() -> None:
+    """Todos los índices, una vez por arranque y en paralelo (createIndex no hace nada si ya existe)."""
+    await asyncio.gather(
+        search_index.ensure_indexes(),
+        # Índice (owner_id, created_at, _id) que sirve el listado paginado de documentos
+        ensure_document_indexes(),
+        user_repository.ensure_indexes(),
+        ensure_reanalysis_indexes(),
+    )
+
+
+@contextmanager
+def _phase(phases: dict[str, float], name: str):
+    start = time.perf_counter()
+    yield
+    phases[name] = time.perf_counter() - start
+    startup_seconds.set(phases[name], phase=name)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque y parada del proceso. Al arrancar, en orden: conexión con MongoDB (si no
+    responde, el proceso no arranca), índices, workers en segundo plano (ingesta y
+    reanálisis, que retoman los trabajos pendientes, y reconciliación de estadísticas)
+    e instrumentación. Cada fase se
+    mide y se publica en el log, en /metrics y en /health/ready. Al parar, en orden inverso.
+    """
+    phases = {"import": _import_seconds}
+    startup_seconds.set(_import_seconds, phase="import")
+    app.state.ready = False
+
+    with _phase(phases, "connect"):
+        await database.connect()
+    if ENSURE_INDEXES_ON_STARTUP:
+        with _phase(phases, "indexes"):
+            await ensure_indexes()
+    with _phase(phases, "workers"):
+        await ingestion_pool.start()
+        await reanalysis_runner.start()
+        stats_reconciler.start()
+        # Mide el retraso del event loop y, si está activado, perfila las peticiones lentas
+        event_loop_monitor.start()
+        profiler.start()
+
+    phases["total"] = sum(phases.values())
+    startup_seconds.set(phases["total"], phase="total")
+    app.state.startup = {name: round(seconds, 4) for name, seconds in phases.items()}
+    app.state.ready = True
+    logger.info("Arranque completado en %.0f ms: %s", phases["total"] * 1000,
+                ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in phases.items() if name != "total"))
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        await event_loop_monitor.stop()
+        profiler.stop()
+        await stats_reconciler.stop()
+        await reanalysis_runner.stop()
+        await ingestion_pool.stop()
+        pdf_extractor.shutdown()
+        password_hasher.shutdown()
+        database.close()
+
 
 app = FastAPI(
     title="IntelliDocs AI API",
     description="API para la gestión inteligente de documentos con IA.",
     version="1.0.0",
+    lifespan=lifespan,
+    # orjson en todas las respuestas JSON
+    default_response_class=FastJSONResponse,
+)
+
+# Rechaza con 413 los cuerpos demasiado grandes sin llegar a leerlos enteros.
+# Se añade antes que CORS para que sus respuestas también lleven las cabeceras CORS.
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    path_limits={"/api/v1/documents/batch": MAX_BATCH_UPLOAD_BYTES},
 )
 
 # 2. Añadimos el middleware de CORS a la aplicación
@@ -19,13 +123,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Permite todos los métodos (GET, POST, etc.)
     allow_headers=["*"],  # Permite todas las cabeceras
+    expose_headers=["X-Next-Cursor", "Server-Timing"],  # Legibles desde el frontend: cursor de la página siguiente y tiempos
 )
 
+# Métricas y Server-Timing: el último middleware añadido es el más externo, así mide la petición completa
+app.add_middleware(MetricsMiddleware)
+
+# Estado de las colas internas, para planificar capacidad
+registry.gauge("intellidocs_llm_scheduler_in_flight", "Llamadas a la IA en curso.",
+               function=lambda: llm_scheduler.in_flight)
+registry.gauge("intellidocs_llm_scheduler_queue_depth", "Llamadas a la IA esperando turno.",
+               function=lambda: llm_scheduler.stats()["queue_depth"])
+registry.gauge("intellidocs_llm_scheduler_concurrency_limit", "Límite de concurrencia actual hacia la IA.",
+               function=lambda: llm_scheduler.limit)
+registry.gauge("intellidocs_ingestion_queue_depth", "Trabajos de ingesta esperando un worker.",
+               function=lambda: ingestion_pool.queue_depth)
+registry.gauge("intellidocs_password_hash_pending", "Operaciones de Argon2 en curso o en cola.",
+               function=lambda: password_hasher.pending)
+
 # Incluir los routers
 app.include_router(auth.router)
 app.include_router(documents.router)
+app.include_router(system.router)
+app.include_router(health.router)
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Métricas en formato de texto de Prometheus."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/", tags=["Root"])
 def read_root():
     """Endpoint de bienvenida para verificar que la API está en línea."""
-    return {"message": "Welcome to IntelliDocs AI API"}
\ No newline at end of file
+    return {"message": "Welcome to IntelliDocs AI API"}
+
+_import_seconds = time.perf_counter() - _import_started
@@ -0,0 +1,504 @@
+# app/memory_db.py
+
+import copy
+import time
+import asyncio
+from collections import Counter
+from datetime import datetime, timezone
+
+import bson
+from bson import ObjectId
+from gridfs.errors import NoFile
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+from app.metrics import mongo_command_seconds
+
+# Sustituto en memoria de las colecciones de Motor (DATABASE_BACKEND=memory) para
+# probar y medir la API sin un servidor MongoDB. Implementa solo las operaciones y
+# operadores que usa la aplicación. Los documentos pasan por BSON al guardarse,
+# como en Mongo: las fechas pierden la zona horaria y se quedan en milisegundos.
+
+_MISSING = object()
+
+
+def _bson_copy(document: dict) -> dict:
+    return bson.decode(bson.encode(document))
+
+
+def _normalize(value):
+    """Fechas comparables entre sí: las que tienen zona se pasan a UTC sin zona, como las guarda Mongo."""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _get_path(document: dict, path: str):
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+    return value
+
+
+def _set_path(document: dict, path: str, value) -> None:
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+def _unset_path(document: dict, path: str) -> None:
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(last, None)
+
+
+def _compare(value, operator: str, operand) -> bool:
+    value, operand = _normalize(value), _normalize(operand)
+    if value is _MISSING or value is None or operand is None:
+        return False
+    try:
+        if operator == "$lt":
+            return value < operand
+        if operator == "$lte":
+            return value <= operand
+        if operator == "$gt":
+            return value > operand
+        return value >= operand
+    except TypeError:
+        # Mongo solo compara valores del mismo tipo
+        return False
+
+
+def _equals(value, operand) -> bool:
+    if value is _MISSING:
+        return operand is None
+    if isinstance(value, list) and not isinstance(operand, list):
+        return any(_normalize(item) == _normalize(operand) for item in value)
+    return _normalize(value) == _normalize(operand)
+
+
+def _match_condition(value, condition) -> bool:
+    if not (isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition)):
+        return _equals(value, condition)
+    for operator, operand in condition.items():
+        if operator == "$eq":
+            matched = _equals(value, operand)
+        elif operator == "$ne":
+            matched = not _equals(value, operand)
+        elif operator == "$in":
+            matched = any(_equals(value, item) for item in operand)
+        elif operator == "$nin":
+            matched = not any(_equals(value, item) for item in operand)
+        elif operator == "$exists":
+            matched = (value is not _MISSING) == bool(operand)
+        elif operator in ("$lt", "$lte", "$gt", "$gte"):
+            matched = _compare(value, operator, operand)
+        else:
+            raise NotImplementedError(f"Operador no soportado en memoria: {operator}")
+        if not matched:
+            return False
+    return True
+
+
+def matches(document: dict, query: dict | None) -> bool:
+    """Si el documento cumple el filtro (subconjunto del lenguaje de consultas de Mongo)."""
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(document, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(document, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, sub) for sub in condition):
+                return False
+        elif not _match_condition(_get_path(document, key), condition):
+            return False
+    return True
+
+
+def _project(document: dict, projection: dict | None) -> dict:
+    if not projection:
+        return document
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if fields and all(fields.values()):
+        projected: dict = {}
+        for path in fields:
+            value = _get_path(document, path)
+            if value is not _MISSING:
+                _set_path(projected, path, value)
+    else:
+        projected = copy.deepcopy(document)
+        for path in fields:
+            _unset_path(projected, path)
+    if include_id and "_id" in document:
+        projected["_id"] = document["_id"]
+    else:
+        projected.pop("_id", None)
+    return projected
+
+
+def _sort_key(document: dict, fields: list[tuple[str, int]]):
+    key = []
+    for path, direction in fields:
+        value = _normalize(_get_path(document, path))
+        present = value is not _MISSING and value is not None
+        item = (present, value if present else 0)
+        key.append(item if direction > 0 else _Reversed(item))
+    return tuple(key)
+
+
+class _Reversed:
+    __slots__ = ("item",)
+
+    def __init__(self, item):
+        self.item = item
+
+    def __lt__(self, other: "_Reversed") -> bool:
+        return other.item < self.item
+
+    def __eq__(self, other) -> bool:
+        return self.item == other.item
+
+
+def _sort_fields(key_or_list, direction=None) -> list[tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    return [(key, value) for key, value in key_or_list]
+
+
+def _apply_update(document: dict, update: dict, inserting: bool) -> None:
+    for operator, fields in update.items():
+        if operator == "$set" or (operator == "$setOnInsert" and inserting):
+            for path, value in fields.items():
+                _set_path(document, path, copy.deepcopy(value))
+        elif operator == "$unset":
+            for path in fields:
+                _unset_path(document, path)
+        elif operator == "$inc":
+            for path, amount in fields.items():
+                current = _get_path(document, path)
+                _set_path(document, path, (0 if current is _MISSING else current) + amount)
+        elif operator != "$setOnInsert":
+            raise NotImplementedError(f"Operador de actualización no soportado en memoria: {operator}")
+
+
+def _upsert_base(query: dict) -> dict:
+    """Campos de igualdad del filtro, que Mongo copia en el documento insertado por un upsert."""
+    base: dict = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and any(op.startswith("$") for op in condition):
+            if "$eq" in condition:
+                _set_path(base, key, condition["$eq"])
+            continue
+        _set_path(base, key, condition)
+    return base
+
+
+class MemoryCursor:
+    """Cursor de `find`: admite sort, skip y limit encadenados, `to_list` y `async for`."""
+
+    def __init__(self, collection: "MemoryCollection", query: dict | None, projection: dict | None):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: list[tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: list[dict] | None = None
+
+    def sort(self, key_or_list, direction=None) -> "MemoryCursor":
+        self._sort = _sort_fields(key_or_list, direction)
+        return self
+
+    def skip(self, count: int) -> "MemoryCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MemoryCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "MemoryCursor":
+        return self
+
+    async def _fetch(self) -> list[dict]:
+        if self._results is None:
+            await self._collection._round_trip("find")
+            documents = [document for document in self._collection._documents.values() if matches(document, self._query)]
+            if self._sort:
+                documents.sort(key=lambda document: _sort_key(document, self._sort))
+            documents = documents[self._skip:]
+            if self._limit:
+                documents = documents[:self._limit]
+            self._results = [_project(copy.deepcopy(document), self._projection) for document in documents]
+        return self._results
+
+    async def to_list(self, length: int | None = None) -> list[dict]:
+        results = await self._fetch()
+        return results[:length] if length else list(results)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in await self._fetch():
+            yield document
+
+
+class MemoryCollection:
+    """
+    Colección en memoria con la interfaz asíncrona de Motor que usa la aplicación.
+    `calls` cuenta las operaciones (los viajes de ida y vuelta que haría con Mongo) y
+    `latency` simula lo que tarda cada uno.
+    """
+
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self._documents: dict = {}
+        self._unique: list[list[str]] = []
+
+    async def _round_trip(self, operation: str) -> None:
+        self.calls[operation] += 1
+        start = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)
+        mongo_command_seconds.observe(time.perf_counter() - start, command=operation, outcome="ok")
+
+    def _check_unique(self, document: dict, replacing=None) -> None:
+        for fields in self._unique:
+            key = [_normalize(_get_path(document, field)) for field in fields]
+            for other_id, other in self._documents.items():
+                if other_id != replacing and [_normalize(_get_path(other, field)) for field in fields] == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {fields}")
+
+    def _insert(self, document: dict) -> None:
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self._documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+        stored = _bson_copy(document)
+        self._check_unique(stored)
+        self._documents[stored["_id"]] = stored
+
+    def _first(self, query: dict | None, sort=None) -> dict | None:
+        candidates = (document for document in self._documents.values() if matches(document, query))
+        if sort:
+            return min(candidates, key=lambda document: _sort_key(document, _sort_fields(sort)), default=None)
+        return next(candidates, None)
+
+    def _store(self, document: dict, replacing=None) -> None:
+        stored = _bson_copy(document)
+        self._check_unique(stored, replacing)
+        self._documents[stored["_id"]] = stored
+
+    async def create_index(self, keys, unique: bool = False, **kwargs) -> str:
+        fields = [name for name, _ in _sort_fields(keys)]
+        if unique and fields not in self._unique:
+            self._unique.append(fields)
+        return "_".join(f"{name}_{direction}" for name, direction in _sort_fields(keys))
+
+    async def find_one(self, query: dict | None = None, projection: dict | None = None, sort=None) -> dict | None:
+        await self._round_trip("find_one")
+        document = self._first(query, sort)
+        return None if document is None else _project(copy.deepcopy(document), projection)
+
+    def find(self, query: dict | None = None, projection: dict | None = None, batch_size: int | None = None) -> MemoryCursor:
+        return MemoryCursor(self, query, projection)
+
+    async def count_documents(self, query: dict) -> int:
+        await self._round_trip("count_documents")
+        return sum(1 for document in self._documents.values() if matches(document, query))
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        await self._round_trip("insert_one")
+        self._insert(document)
+        return InsertOneResult(document["_id"], acknowledged=True)
+
+    async def insert_many(self, documents: list[dict], ordered: bool = True) -> InsertManyResult:
+        await self._round_trip("insert_many")
+        errors = []
+        for index, document in enumerate(documents):
+            try:
+                self._insert(document)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(documents) - len(errors)})
+        return InsertManyResult([document["_id"] for document in documents], acknowledged=True)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        await self._round_trip("update_one")
+        document = self._first(query)
+        if document is None:
+            if not upsert:
+                return UpdateResult({"n": 0, "nModified": 0}, acknowledged=True)
+            document = _upsert_base(query)
+            _apply_update(document, update, inserting=True)
+            self._insert(document)
+            return UpdateResult({"n": 1, "nModified": 0, "upserted": document["_id"]}, acknowledged=True)
+        updated = copy.deepcopy(document)
+        _apply_update(updated, update, inserting=False)
+        self._store(updated, replacing=document["_id"])
+        return UpdateResult({"n": 1, "nModified": 1}, acknowledged=True)
+
+    async def find_one_and_update(
+        self,
+        query: dict,
+        update: dict,
+        projection: dict | None = None,
+        sort=None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+    ) -> dict | None:
+        await self._round_trip("find_one_and_update")
+        document = self._first(query, sort)
+        if document is None:
+            if not upsert:
+                return None
+            created = _upsert_base(query)
+            _apply_update(created, update, inserting=True)
+            self._insert(created)
+            if return_document == ReturnDocument.AFTER:
+                return _project(copy.deepcopy(self._documents[created["_id"]]), projection)
+            return None
+        updated = copy.deepcopy(document)
+        _apply_update(updated, update, inserting=False)
+        self._store(updated, replacing=document["_id"])
+        result = self._documents[document["_id"]] if return_document == ReturnDocument.AFTER else document
+        return _project(copy.deepcopy(result), projection)
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False) -> UpdateResult:
+        await self._round_trip("replace_one")
+        document = self._first(query)
+        if document is None:
+            if not upsert:
+                return UpdateResult({"n": 0, "nModified": 0}, acknowledged=True)
+            created = {**_upsert_base(query), **replacement}
+            self._insert(created)
+            return UpdateResult({"n": 1, "nModified": 0, "upserted": created["_id"]}, acknowledged=True)
+        self._store({**replacement, "_id": document["_id"]}, replacing=document["_id"])
+        return UpdateResult({"n": 1, "nModified": 1}, acknowledged=True)
+
+    async def delete_one(self, query: dict) -> DeleteResult:
+        await self._round_trip("delete_one")
+        document = self._first(query)
+        if document is None:
+            return DeleteResult({"n": 0}, acknowledged=True)
+        del self._documents[document["_id"]]
+        return DeleteResult({"n": 1}, acknowledged=True)
+
+    async def find_one_and_delete(self, query: dict, projection: dict | None = None, sort=None) -> dict | None:
+        await self._round_trip("find_one_and_delete")
+        document = self._first(query, sort)
+        if document is None:
+            return None
+        del self._documents[document["_id"]]
+        return _project(document, projection)
+
+    async def delete_many(self, query: dict) -> DeleteResult:
+        await self._round_trip("delete_many")
+        doomed = [key for key, document in self._documents.items() if matches(document, query)]
+        for key in doomed:
+            del self._documents[key]
+        return DeleteResult({"n": len(doomed)}, acknowledged=True)
+
+
+class MemoryDatabase:
+    """Base de datos en memoria: crea las colecciones al pedirlas, como Mongo."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._collections: dict[str, MemoryCollection] = {}
+
+    def get_collection(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name, self.latency)
+        return self._collections[name]
+
+    def calls(self) -> Counter:
+        """Operaciones hechas en todas las colecciones."""
+        total: Counter[str] = Counter()
+        for collection in self._collections.values():
+            total.update(collection.calls)
+        return total
+
+
+class MemoryGridIn:
+    """Fichero de GridFS en escritura: se guarda en el bucket al cerrarlo."""
+
+    def __init__(self, bucket: "MemoryGridFSBucket", filename: str, metadata: dict | None):
+        self._id = ObjectId()
+        self._bucket = bucket
+        self._filename = filename
+        self._metadata = metadata
+        self._chunks: list[bytes] = []
+
+    async def write(self, data: bytes) -> None:
+        self._chunks.append(data)
+
+    async def close(self) -> None:
+        self._bucket._files[self._id] = (self._filename, b"".join(self._chunks), self._metadata)
+
+    async def abort(self) -> None:
+        self._chunks.clear()
+
+
+class MemoryGridOut:
+    """Fichero de GridFS en lectura, por bloques."""
+
+    def __init__(self, data: bytes):
+        self._data = data
+        self._position = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        end = len(self._data) if size < 0 else self._position + size
+        chunk = self._data[self._position:end]
+        self._position += len(chunk)
+        return chunk
+
+
+class MemoryGridFSBucket:
+    """Sustituto de AsyncIOMotorGridFSBucket para los PDF pendientes de ingesta."""
+
+    def __init__(self):
+        self._files: dict[ObjectId, tuple[str, bytes, dict | None]] = {}
+
+    async def upload_from_stream(self, filename: str, source, metadata: dict | None = None) -> ObjectId:
+        data = source if isinstance(source, bytes) else source.read()
+        file_id = ObjectId()
+        self._files[file_id] = (filename, data, metadata)
+        return file_id
+
+    async def download_to_stream(self, file_id: ObjectId, destination) -> None:
+        if file_id not in self._files:
+            raise NoFile(f"no file in gridfs with _id {file_id!r}")
+        destination.write(self._files[file_id][1])
+
+    def open_upload_stream(self, filename: str, metadata: dict | None = None) -> MemoryGridIn:
+        return MemoryGridIn(self, filename, metadata)
+
+    async def open_download_stream(self, file_id: ObjectId) -> MemoryGridOut:
+        if file_id not in self._files:
+            raise NoFile(f"no file in gridfs with _id {file_id!r}")
+        return MemoryGridOut(self._files[file_id][1])
+
+    async def delete(self, file_id: ObjectId) -> None:
+        if self._files.pop(file_id, None) is None:
+            raise NoFile(f"no file in gridfs with _id {file_id!r}")
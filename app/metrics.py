@@ -0,0 +1,462 @@
+# app/metrics.py
+
+import os
+import sys
+import math
+import time
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se mide el retraso del event loop
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+# Perfilado por muestreo de las peticiones más lentas que este umbral (0 = desactivado)
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_MAX_KEPT = int(os.getenv("PROFILE_MAX_KEPT", "20"))
+# Muestras que se guardan como máximo (las más antiguas se descartan)
+PROFILE_BUFFER_SECONDS = 120
+
+INF = math.inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, INF)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, INF)
+
+
+# --- Métricas en formato de texto de Prometheus ---
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == INF:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        # Las observaciones llegan también desde hilos (p. ej. el listener de Mongo)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class CounterMetric(_Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class GaugeMetric(_Metric):
+    """Valor instantáneo; con `function` se calcula al exportar (p. ej. el tamaño de una cola)."""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function: Callable[[], float] | None = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                return [(self.name, {}, float(self._function()))]
+            except Exception as e:
+                logger.warning("No se pudo calcular la métrica %s: %s", self.name, e)
+                return []
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class HistogramMetric(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) if buckets[-1] == INF else (*buckets, INF)
+        # Por combinación de etiquetas: cuentas por cubeta (no acumuladas), suma y total
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    result.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+                result.append((f"{self.name}_sum", labels, total))
+                result.append((f"{self.name}_count", labels, count))
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"La métrica {metric.name} ya está registrada.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> CounterMetric:
+        return self._register(CounterMetric(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+              function: Callable[[], float] | None = None) -> GaugeMetric:
+        return self._register(GaugeMetric(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> HistogramMetric:
+        return self._register(HistogramMetric(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_seconds = registry.histogram(
+    "intellidocs_http_request_duration_seconds", "Duración de las peticiones HTTP.", ("method", "route", "status"),
+)
+http_requests_in_flight = registry.gauge("intellidocs_http_requests_in_flight", "Peticiones HTTP en curso.")
+stage_seconds = registry.histogram(
+    "intellidocs_stage_duration_seconds", "Duración de cada etapa del procesamiento (extracción, IA, base de datos...).",
+    ("stage",),
+)
+llm_request_seconds = registry.histogram(
+    "intellidocs_llm_request_duration_seconds", "Duración de cada llamada a un proveedor de IA.",
+    ("provider", "outcome"),
+)
+llm_first_chunk_seconds = registry.histogram(
+    "intellidocs_llm_time_to_first_chunk_seconds", "Tiempo hasta el primer fragmento de las respuestas en streaming.",
+    ("provider",),
+)
+llm_prompt_chars = registry.histogram(
+    "intellidocs_llm_prompt_chars", "Tamaño de los prompts enviados (caracteres).", ("provider",), SIZE_BUCKETS,
+)
+llm_response_chars = registry.histogram(
+    "intellidocs_llm_response_chars", "Tamaño de las respuestas recibidas (caracteres).", ("provider",), SIZE_BUCKETS,
+)
+mongo_command_seconds = registry.histogram(
+    "intellidocs_mongo_command_duration_seconds", "Duración de los comandos de MongoDB.", ("command", "outcome"),
+)
+startup_seconds = registry.gauge(
+    "intellidocs_startup_seconds", "Duración de cada fase del arranque del proceso.", ("phase",),
+)
+event_loop_lag_seconds = registry.histogram(
+    "intellidocs_event_loop_lag_seconds", "Retraso del event loop al despertar un temporizador.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, INF),
+)
+
+
+# --- Etapas de cada petición (Server-Timing) ---
+
+# Etapas medidas en la petición en curso; las tareas y los hilos que lanza heredan la misma lista
+_request_timings: ContextVar[list[tuple[str, float]] | None] = ContextVar("request_timings", default=None)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Anota la duración de una etapa en su histograma y en el Server-Timing de la petición."""
+    stage_seconds.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    """Mide el bloque como una etapa: `with stage("extraction"): ...`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def timed_stage(name: str):
+    """Decorador para medir una función asíncrona completa como una etapa."""
+    def decorator(function):
+        @wraps(function)
+        async def wrapper(*args, **kwargs):
+            with stage(name):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing_header(timings: list[tuple[str, float]], total: float) -> str:
+    """Cabecera Server-Timing: las etapas repetidas (p. ej. varias llamadas a la IA) se suman."""
+    totals: dict[str, list] = {}
+    for name, seconds in timings:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    parts = []
+    for name, (seconds, count) in totals.items():
+        description = f';desc="x{count}"' if count > 1 else ""
+        parts.append(f"{name}{description};dur={seconds * 1000:.1f}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# --- MongoDB ---
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Listener de comandos de pymongo: duración de cada comando por nombre y resultado."""
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name, outcome="ok")
+
+    def failed(self, event) -> None:
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name, outcome="error")
+
+
+# --- Retraso del event loop ---
+
+class EventLoopLagMonitor:
+    """
+    Tarea de fondo que duerme un intervalo fijo y mide cuánto tarda de más en
+    despertar: si algo bloquea el loop (CPU, llamadas síncronas), el retraso sube.
+    """
+
+    def __init__(self, interval: float = EVENT_LOOP_LAG_INTERVAL_SECONDS):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            event_loop_lag_seconds.observe(lag)
+
+
+event_loop_monitor = EventLoopLagMonitor()
+registry.gauge(
+    "intellidocs_event_loop_lag_last_seconds", "Último retraso medido del event loop.",
+    function=lambda: event_loop_monitor.last_lag,
+)
+
+
+# --- Perfilado de peticiones lentas ---
+
+class SlowRequestProfiler:
+    """
+    Perfilador por muestreo, opcional (PROFILE_SLOW_REQUEST_MS > 0). Un hilo toma la
+    pila del hilo del event loop cada pocos milisegundos; cuando una petición supera
+    el umbral, se agregan las muestras tomadas mientras duraba en pilas "colapsadas"
+    (formato de flame graph). Las muestras incluyen el trabajo de otras peticiones
+    simultáneas: sirve para ver qué ocupa el loop mientras la petición es lenta.
+    """
+
+    def __init__(self, threshold_ms: float = PROFILE_SLOW_REQUEST_MS,
+                 interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS, max_kept: int = PROFILE_MAX_KEPT):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.profiles: deque[dict] = deque(maxlen=max_kept)
+        self._samples: deque[tuple[float, tuple[str, ...]]] = deque(
+            maxlen=max(1, int(PROFILE_BUFFER_SECONDS / max(self.interval, 0.001)))
+        )
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._target_thread_id: int | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def start(self) -> None:
+        """Empieza a muestrear el hilo que lo llama (el del event loop)."""
+        if not self.enabled or self._thread is not None:
+            return
+        self._target_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _sample_loop(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            # El loop esperando en el selector está ocioso, no es tiempo de CPU
+            if stack[0].startswith("selectors.py:"):
+                continue
+            self._samples.append((time.perf_counter(), tuple(reversed(stack))))
+
+    def capture(self, method: str, path: str, start: float, end: float) -> None:
+        """Guarda el perfil de una petición lenta (llamar al terminarla)."""
+        if not self.enabled or end - start < self.threshold:
+            return
+        stacks = Counter(";".join(stack) for when, stack in list(self._samples) if start <= when <= end)
+        profile = {
+            "method": method,
+            "path": path,
+            "duration_ms": round((end - start) * 1000, 1),
+            "busy_samples": sum(stacks.values()),
+            "sample_interval_ms": self.interval * 1000,
+            "stacks": [{"stack": stack, "samples": count} for stack, count in stacks.most_common(50)],
+        }
+        self.profiles.append(profile)
+        top = "; ".join(f"{entry['samples']}x {entry['stack'].rsplit(';', 1)[-1]}" for entry in profile["stacks"][:5])
+        logger.warning("Petición lenta %s %s: %.0f ms, %d muestras ocupadas. %s",
+                       method, path, profile["duration_ms"], profile["busy_samples"], top)
+
+
+profiler = SlowRequestProfiler()
+
+
+# --- Middleware ---
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mide cada petición: histograma por método, ruta y estado,
+    cabecera Server-Timing con las etapas medidas hasta enviar las cabeceras
+    (incluida la lectura del cuerpo) y perfil de las peticiones lentas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: list[tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        body_seconds = 0.0
+        status_code = 500
+
+        async def timed_receive():
+            nonlocal body_seconds
+            started = time.perf_counter()
+            message = await receive()
+            if message["type"] == "http.request":
+                body_seconds += time.perf_counter() - started
+            return message
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                stages = [("body", body_seconds)] + timings if body_seconds else timings
+                header = server_timing_header(stages, time.perf_counter() - start)
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode("latin-1"))]}
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, timed_receive, send_with_timing)
+        finally:
+            end = time.perf_counter()
+            http_requests_in_flight.dec()
+            _request_timings.reset(token)
+            if body_seconds:
+                stage_seconds.observe(body_seconds, stage="body")
+            route = scope.get("route")
+            # Plantilla de la ruta (/api/v1/documents/{id}) para no crear una serie por cada id
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_request_seconds.observe(end - start, method=scope["method"], route=route_path, status=status_code)
+            profiler.capture(scope["method"], scope["path"], start, end)
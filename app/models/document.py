@@ -29,6 +29,11 @@ class DocumentModel(BaseModel):
     analysis: DocumentAnalysis
     owner_id: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Versión de prompt/modelo con la que se generó el análisis (None en documentos antiguos)
+    analysis_version: Optional[str] = None
+    # Tamaño del texto extraído, para las estadísticas del usuario (None en documentos antiguos)
+    page_count: Optional[int] = None
+    char_count: Optional[int] = None
 
 class DocumentResponse(DocumentModel):
     """Modelo para las respuestas de la API, incluye el ID."""
@@ -42,6 +47,27 @@ class DocumentResponse(DocumentModel):
             datetime: lambda dt: dt.isoformat(),
         }
 
+class DocumentSearchResult(DocumentResponse):
+    """Documento encontrado en una búsqueda, con su puntuación de relevancia."""
+    score: float
+
+class PartialDocumentAnalysis(BaseModel):
+    """Análisis con solo los campos pedidos en un listado."""
+    title: Optional[str] = None
+    summary: Optional[str] = None
+    keywords: Optional[List[str]] = None
+
+class DocumentListItem(BaseModel):
+    """Documento de un listado: completo o solo con los campos pedidos en `fields`."""
+    id: PyObjectId = Field(alias="_id")
+    created_at: datetime
+    filename: Optional[str] = None
+    analysis: Optional[PartialDocumentAnalysis] = None
+    owner_id: Optional[str] = None
+
+    class Config:
+        populate_by_name = True
+
 class UpdateDocumentModel(BaseModel):
     """Modelo para actualizar un documento. Todos los campos son opcionales."""
     title: Optional[str] = None
@@ -0,0 +1,43 @@
+# app/models/job.py
+
+from enum import Enum
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+class JobState(str, Enum):
+    """Estados por los que pasa un trabajo de ingesta."""
+    queued = "queued"
+    extracting = "extracting"
+    analyzing = "analyzing"
+    done = "done"
+    failed = "failed"
+
+class JobResponse(BaseModel):
+    """Modelo para las respuestas de la API sobre trabajos de ingesta."""
+    id: str
+    state: JobState
+    filename: str
+    document_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class ReanalysisJobState(str, Enum):
+    """Estados de un trabajo de reanálisis."""
+    queued = "queued"
+    running = "running"
+    done = "done"
+
+class ReanalysisJobResponse(BaseModel):
+    """Modelo para las respuestas de la API sobre trabajos de reanálisis."""
+    id: str
+    state: ReanalysisJobState
+    analysis_version: str
+    total: int
+    processed: int
+    failed: int
+    skipped: int
+    created_at: datetime
+    updated_at: datetime
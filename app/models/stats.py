@@ -0,0 +1,24 @@
+# app/models/stats.py
+
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+class KeywordCount(BaseModel):
+    """Una palabra clave y cuántos documentos la tienen."""
+    keyword: str
+    count: int
+
+class MonthCount(BaseModel):
+    """Documentos subidos en un mes (AAAA-MM)."""
+    month: str
+    count: int
+
+class UserStatsResponse(BaseModel):
+    """Estadísticas de la biblioteca de un usuario."""
+    documents: int
+    pages: int
+    chars: int
+    keywords: List[KeywordCount]
+    months: List[MonthCount]
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,133 @@
+# app/repositories.py
+
+import logging
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from app.database import document_collection, user_collection, stored_datetime
+from app.metrics import timed_stage
+
+# Acceso a documentos y usuarios para los routers. Cada operación es un único viaje
+# a la base de datos: la comprobación de propietario va en el propio filtro y los
+# registros insertados se devuelven tal y como se construyeron, sin volver a leerlos.
+
+logger = logging.getLogger(__name__)
+
+
+def _as_stored(document: dict) -> dict:
+    """Pasa las fechas del registro a como las guarda Mongo, para devolverlo igual que se leerá."""
+    for key, value in document.items():
+        if isinstance(value, datetime):
+            document[key] = stored_datetime(value)
+    return document
+
+
+class EmailAlreadyRegistered(Exception):
+    """Ya existe un usuario con ese email."""
+
+
+class DocumentRepository:
+    """Documentos analizados, siempre filtrados por su propietario."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @timed_stage("db")
+    async def create(self, document: dict) -> dict:
+        """Inserta el documento y lo devuelve con su `_id` (insert_one lo añade al dict)."""
+        await self.collection.insert_one(_as_stored(document))
+        return document
+
+    @timed_stage("db")
+    async def create_many(self, documents: list[dict]) -> None:
+        """
+        Inserta varios documentos en una sola llamada (insert_many añade el `_id` a cada dict).
+        No se detiene en el primer error: los que fallan vienen en el BulkWriteError.
+        """
+        await self.collection.insert_many([_as_stored(document) for document in documents], ordered=False)
+
+    @timed_stage("db")
+    async def get(self, document_id: str | ObjectId, owner_id: str) -> dict | None:
+        return await self.collection.find_one({"_id": ObjectId(document_id), "owner_id": owner_id})
+
+    @timed_stage("db")
+    async def get_many(self, document_ids: list[str], owner_id: str) -> dict[str, dict]:
+        """Documentos del usuario con esos ids, por id; los que no existen no aparecen."""
+        cursor = self.collection.find({"_id": {"$in": [ObjectId(doc_id) for doc_id in document_ids]}, "owner_id": owner_id})
+        return {str(doc["_id"]): doc async for doc in cursor}
+
+    @timed_stage("db")
+    async def update_analysis(self, document_id: str | ObjectId, owner_id: str,
+                              fields: dict) -> tuple[dict, dict] | None:
+        """
+        Cambia campos del análisis. Devuelve el documento antes y después del cambio
+        (el de después se construye aplicando el $set, sin volver a leerlo), o None si no es del usuario.
+        """
+        before = await self.collection.find_one_and_update(
+            {"_id": ObjectId(document_id), "owner_id": owner_id},
+            {"$set": {f"analysis.{field}": value for field, value in fields.items()}},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if before is None:
+            return None
+        return before, {**before, "analysis": {**before["analysis"], **fields}}
+
+    @timed_stage("db")
+    async def set_analysis(self, document_id: str | ObjectId, owner_id: str, analysis: dict,
+                           analysis_version: str) -> tuple[dict, dict] | None:
+        """Sustituye el análisis completo (reanálisis). Devuelve el documento antes y después del cambio."""
+        before = await self.collection.find_one_and_update(
+            {"_id": ObjectId(document_id), "owner_id": owner_id},
+            {"$set": {"analysis": analysis, "analysis_version": analysis_version}},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if before is None:
+            return None
+        return before, {**before, "analysis": analysis, "analysis_version": analysis_version}
+
+    @timed_stage("db")
+    async def delete(self, document_id: str | ObjectId, owner_id: str) -> dict | None:
+        """Borra el documento si es del usuario. Devuelve el documento borrado, o None si no existía."""
+        return await self.collection.find_one_and_delete({"_id": ObjectId(document_id), "owner_id": owner_id})
+
+
+class UserRepository:
+    """Usuarios, identificados por su email."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        # Además de acelerar el login, impide registrar dos veces el mismo email a la vez
+        try:
+            await self.collection.create_index("email", unique=True)
+        except OperationFailure as e:
+            logger.warning("No se pudo crear el índice único de emails (¿hay duplicados?): %s", e)
+
+    @timed_stage("db")
+    async def get_by_email(self, email: str) -> dict | None:
+        return await self.collection.find_one({"email": email})
+
+    @timed_stage("db")
+    async def create(self, email: str, hashed_password: str) -> dict:
+        user = {
+            "email": email,
+            "hashed_password": hashed_password,
+            "created_at": stored_datetime(datetime.now(timezone.utc)),
+        }
+        try:
+            await self.collection.insert_one(user)
+        except DuplicateKeyError:
+            raise EmailAlreadyRegistered(email) from None
+        return user
+
+    @timed_stage("db")
+    async def set_password_hash(self, user_id: ObjectId, hashed_password: str) -> None:
+        await self.collection.update_one({"_id": user_id}, {"$set": {"hashed_password": hashed_password}})
+
+
+document_repository = DocumentRepository(document_collection)
+user_repository = UserRepository(user_collection)
@@ -2,11 +2,12 @@
 
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
-from datetime import datetime, timezone
 
 from app.models.user import UserInCreate, UserInResponse
-from app.database import user_collection
-from app.security import get_password_hash, verify_password, create_access_token
+from app.repositories import user_repository, EmailAlreadyRegistered
+from app.security import (
+    password_hasher, PasswordHashingOverloaded, create_access_token, invalidate_user,
+)
 
 router = APIRouter(
     prefix="/api/v1/auth",
@@ -20,24 +21,28 @@ async def register_user(user_data: UserInCreate):
     - Verifica si el email ya existe.
     - Hashea la contraseña antes de guardarla.
     """
-    existing_user = await user_collection.find_one({"email": user_data.email})
+    # Se comprueba antes de calcular el hash para no gastar CPU en emails repetidos
+    existing_user = await user_repository.get_by_email(user_data.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="El email ya está registrado."
         )
 
-    hashed_password = get_password_hash(user_data.password)
+    try:
+        hashed_password = await password_hasher.hash(user_data.password)
+    except PasswordHashingOverloaded as e:
+        raise _overloaded(e)
     
-    new_user_data = {
-        "email": user_data.email,
-        "hashed_password": hashed_password,
-        "created_at": datetime.now(timezone.utc)
-    }
+    try:
+        created_user = await user_repository.create(user_data.email, hashed_password)
+    except EmailAlreadyRegistered:
+        # Otro registro con el mismo email se adelantó (índice único)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El email ya está registrado."
+        )
 
-    result = await user_collection.insert_one(new_user_data)
-    created_user = await user_collection.find_one({"_id": result.inserted_id})
-    
     # --- CAMBIO IMPORTANTE AQUÍ ---
     # Creamos manualmente el campo 'id' a partir del '_id' de MongoDB
     # para que coincida con nuestro modelo de respuesta Pydantic.
@@ -52,17 +57,42 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     """
     Autentica al usuario y devuelve un token de acceso JWT.
     """
-    user = await user_collection.find_one({"email": form_data.username})
-    
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    try:
+        password_hasher.check_capacity()
+    except PasswordHashingOverloaded as e:
+        raise _overloaded(e)
+
+    user = await user_repository.get_by_email(form_data.username)
+
+    valid = False
+    if user:
+        try:
+            valid, new_hash = await password_hasher.verify_and_update(form_data.password, user["hashed_password"])
+        except PasswordHashingOverloaded as e:
+            raise _overloaded(e)
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # El hash se generó con otros parámetros de Argon2: se guarda el nuevo
+    if new_hash:
+        await user_repository.set_password_hash(user["_id"], new_hash)
+        invalidate_user(user["email"])
     
     access_token = create_access_token(
         data={"sub": user["email"]}
     )
     
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+def _overloaded(error: PasswordHashingOverloaded) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": "1"},
+    )
@@ -1,15 +1,36 @@
 # app/routers/documents.py
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from typing import List
+import asyncio
+from contextlib import AsyncExitStack
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Response, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from typing import List, Literal, Optional
 from bson import ObjectId
-import fitz  # PyMuPDF
 
-from app.models.document import DocumentResponse, UpdateDocumentModel, DocumentModel
+from app.models.document import DocumentResponse, DocumentListItem, DocumentSearchResult, UpdateDocumentModel
+from app.models.job import JobResponse, ReanalysisJobResponse, ReanalysisJobState
 from app.models.user import UserModel
-from app.database import document_collection
+from app.models.stats import UserStatsResponse
+from app.repositories import document_repository
 from app.security import get_current_user
-from app.services.gemini_service import get_gemini_analysis
+from app.uploads import spool_upload, UploadTooLarge, MAX_BATCH_FILES
+from app.services.pipeline import DocumentProcessingError, process_pdf, stream_pdf
+from app.services.batch import process_batch
+from app.serialization import FastJSONResponse, dumps
+from app.services.document_listing import (
+    list_owner_documents, export_owner_documents, projection_for,
+    DOCUMENTS_PAGE_SIZE, DOCUMENTS_MAX_PAGE_SIZE, EXPORT_PROJECTION,
+)
+from app.services.search import search_index
+from app.services.vector_index import vector_index
+from app.services.ingestion import create_job, get_job
+from app.services.text_store import text_store
+from app.services import user_stats
+from app.services.user_stats import get_user_stats, USER_STATS_TOP_KEYWORDS
+from app.services.reanalysis import (
+    reanalyze_document, reanalysis_runner, create_reanalysis_job, get_reanalysis_job, MissingDocumentText,
+)
 
 router = APIRouter(
     prefix="/api/v1/documents",
@@ -28,39 +49,313 @@ async def upload_document(
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Solo se aceptan archivos PDF.")
 
     try:
-        pdf_bytes = await file.read()
-        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-            extracted_text = "".join(page.get_text() for page in doc)
-
-        if not extracted_text.strip():
-            raise HTTPException(status.HTTP_400_BAD_REQUEST, "El PDF no contiene texto.")
-
-        analysis_result = await get_gemini_analysis(extracted_text)
-        if not analysis_result:
-            raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "El análisis de IA falló.")
-        
-        document_data = DocumentModel(
-            filename=file.filename,
-            analysis=analysis_result,
-            owner_id=str(current_user.id)
-        )
-        
-        result = await document_collection.insert_one(document_data.model_dump())
-        created_document = await document_collection.find_one({"_id": result.inserted_id})
-        
+        async with spool_upload(file) as upload:
+            created_document = await process_pdf(upload, str(current_user.id))
         return DocumentResponse(**created_document)
 
+    except UploadTooLarge as e:
+        raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, str(e))
+    except DocumentProcessingError as e:
+        raise HTTPException(e.status_code, e.message)
     except Exception as e:
         raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, f"Error al procesar el archivo: {e}")
 
 
-@router.get("/", response_model=List[DocumentResponse])
-async def list_documents(current_user: UserModel = Depends(get_current_user)):
+@router.post("/stream")
+async def upload_document_stream(
+    file: UploadFile = File(...),
+    current_user: UserModel = Depends(get_current_user)
+):
     """
-    Lista todos los documentos que pertenecen al usuario autenticado.
+    Sube, analiza y guarda un nuevo documento informando del progreso con Server-Sent Events. Endpoint protegido.
+    Eventos: `progress` (etapa y, al extraer, páginas procesadas), `summary` con cada trozo del resumen
+    según lo escribe el modelo, y al final `document` con el documento creado o `error` con `status` y `detail`.
     """
-    documents = await document_collection.find({"owner_id": str(current_user.id)}).to_list(100)
-    return [DocumentResponse(**doc) for doc in documents]
+    if file.content_type != "application/pdf":
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Solo se aceptan archivos PDF.")
+
+    # Como en los lotes, el PDF se vuelca a disco antes de volver del endpoint y se borra al terminar la respuesta
+    spools = AsyncExitStack()
+    try:
+        upload = await spools.enter_async_context(spool_upload(file))
+    except UploadTooLarge as e:
+        raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, str(e))
+
+    async def events():
+        try:
+            async for event, data in stream_pdf(upload, str(current_user.id)):
+                if event == "document":
+                    data = DocumentResponse(**data).model_dump(mode="json", by_alias=True)
+                yield _sse_event(event, data)
+        except DocumentProcessingError as e:
+            yield _sse_event("error", {"status": e.status_code, "detail": e.message})
+        except Exception as e:
+            yield _sse_event("error", {"status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                       "detail": f"Error al procesar el archivo: {e}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Sin caché ni buffer en proxies (nginx): cada evento debe llegar en cuanto se emite
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(spools.aclose),
+    )
+
+
+def _sse_event(event: str, data: dict) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+@router.post("/batch")
+async def upload_documents_batch(
+    files: List[UploadFile] = File(...),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Sube, analiza y guarda varios PDFs en una sola petición. Endpoint protegido.
+    La respuesta es NDJSON: una línea por archivo en cuanto termina, con su posición
+    en la petición (`index`), el código de estado y el documento creado o el error.
+    """
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Se admiten como máximo {MAX_BATCH_FILES} archivos por lote.")
+
+    # Los archivos del formulario se cierran al volver del endpoint: se vuelcan antes a disco
+    # y los temporales se borran cuando termina la respuesta (o se desconecta el cliente).
+    spools = AsyncExitStack()
+    rejected, accepted = [], []
+    try:
+        for index, file in enumerate(files):
+            if file.content_type != "application/pdf":
+                rejected.append(_batch_line(index, file.filename, status.HTTP_400_BAD_REQUEST,
+                                            error="Solo se aceptan archivos PDF."))
+                continue
+            try:
+                accepted.append((index, await spools.enter_async_context(spool_upload(file))))
+            except UploadTooLarge as e:
+                rejected.append(_batch_line(index, file.filename, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                            error=str(e)))
+    except BaseException:
+        await spools.aclose()
+        raise
+
+    async def results():
+        for line in rejected:
+            yield line
+        async for result in process_batch([upload for _, upload in accepted], str(current_user.id)):
+            document = None
+            if result.document is not None:
+                document = DocumentResponse(**result.document).model_dump(mode="json", by_alias=True)
+            yield _batch_line(accepted[result.position][0], result.filename, result.status_code,
+                              document=document, error=result.error)
+
+    return StreamingResponse(
+        results(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(spools.aclose),
+    )
+
+
+def _batch_line(index: int, filename: str, status_code: int, document: dict | None = None,
+                error: str | None = None) -> bytes:
+    line = {"index": index, "filename": filename, "status": status_code}
+    if document is not None:
+        line["document"] = document
+    if error is not None:
+        line["error"] = error
+    return dumps(line) + b"\n"
+
+
+@router.post("/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_ingestion_job(
+    response: Response,
+    file: UploadFile = File(...),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Guarda el PDF y lo encola para procesarlo en segundo plano. Endpoint protegido.
+    Devuelve inmediatamente el trabajo; su estado se consulta en /jobs/{id}.
+    """
+    if file.content_type != "application/pdf":
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Solo se aceptan archivos PDF.")
+
+    try:
+        async with spool_upload(file) as upload:
+            job = await create_job(upload, str(current_user.id))
+    except UploadTooLarge as e:
+        raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, str(e))
+    response.headers["Location"] = f"{router.prefix}/jobs/{job['_id']}"
+    return _job_response(job)
+
+
+@router.get("/jobs/{id}", response_model=JobResponse)
+async def get_ingestion_job(id: str, current_user: UserModel = Depends(get_current_user)):
+    """
+    Obtiene el estado de un trabajo de ingesta (queued/extracting/analyzing/done/failed).
+    """
+    if not ObjectId.is_valid(id):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "ID de trabajo inválido.")
+
+    job = await get_job(id, str(current_user.id))
+    if not job:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Trabajo no encontrado.")
+    return _job_response(job)
+
+
+def _job_response(job: dict) -> JobResponse:
+    return JobResponse(
+        id=str(job["_id"]),
+        state=job["state"],
+        filename=job["filename"],
+        document_id=job.get("document_id"),
+        error=job.get("error"),
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+    )
+
+
+@router.post("/reanalysis", response_model=ReanalysisJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_reanalysis(response: Response, current_user: UserModel = Depends(get_current_user)):
+    """
+    Encola el reanálisis de los documentos del usuario cuyo análisis es de otra versión
+    de prompt/modelo. Usa el texto guardado, sin volver a procesar los PDF. Endpoint protegido.
+    Si ya hay un reanálisis sin terminar, devuelve ese; su avance se consulta en /reanalysis/{id}.
+    """
+    job = await create_reanalysis_job(str(current_user.id))
+    if job["state"] == ReanalysisJobState.queued.value:
+        reanalysis_runner.submit(job["_id"])
+    response.headers["Location"] = f"{router.prefix}/reanalysis/{job['_id']}"
+    return _reanalysis_job_response(job)
+
+
+@router.get("/reanalysis/{id}", response_model=ReanalysisJobResponse)
+async def get_reanalysis(id: str, current_user: UserModel = Depends(get_current_user)):
+    """
+    Obtiene el avance de un trabajo de reanálisis (documentos procesados, fallidos y sin texto guardado).
+    """
+    if not ObjectId.is_valid(id):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "ID de trabajo inválido.")
+
+    job = await get_reanalysis_job(id, str(current_user.id))
+    if not job:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Trabajo no encontrado.")
+    return _reanalysis_job_response(job)
+
+
+def _reanalysis_job_response(job: dict) -> ReanalysisJobResponse:
+    return ReanalysisJobResponse(id=str(job["_id"]), **job)
+
+
+@router.get("/", response_model=List[DocumentListItem], response_model_exclude_unset=True)
+async def list_documents(
+    limit: int = Query(DOCUMENTS_PAGE_SIZE, ge=1, le=DOCUMENTS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Campos separados por comas: filename,title,summary,keywords"),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Lista los documentos del usuario autenticado, de más reciente a más antiguo.
+    Si hay más páginas, la cabecera `X-Next-Cursor` trae el valor de `cursor` para pedir la siguiente.
+    Con `fields` solo se devuelven esos campos (además de `id` y `created_at`).
+    """
+    try:
+        documents, next_cursor = await list_owner_documents(str(current_user.id), limit, cursor, _split_fields(fields))
+    except ValueError as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
+
+    # Los documentos salen de la base de datos con la forma de DocumentListItem (la proyección
+    # del listado): se serializan directamente con orjson, sin validar cada uno con Pydantic
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return FastJSONResponse(documents, headers=headers)
+
+
+@router.get("/export")
+async def export_documents(
+    fields: Optional[str] = Query(None, description="Campos separados por comas: filename,title,summary,keywords"),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Exporta todos los documentos del usuario autenticado en NDJSON (un documento por línea),
+    de más reciente a más antiguo. La respuesta se genera a medida que se lee la base de datos.
+    Con `fields` solo se exportan esos campos (además de `_id` y `created_at`).
+    """
+    try:
+        projection = projection_for(_split_fields(fields), default=EXPORT_PROJECTION)
+    except ValueError as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
+
+    return StreamingResponse(
+        export_owner_documents(str(current_user.id), projection),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="documentos.ndjson"'},
+    )
+
+
+@router.get("/stats", response_model=UserStatsResponse)
+async def get_documents_stats(
+    keywords: int = Query(USER_STATS_TOP_KEYWORDS, ge=0, le=1000, description="Palabras clave más frecuentes a devolver"),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Estadísticas de la biblioteca del usuario autenticado: documentos, páginas y caracteres
+    en total, las palabras clave con más documentos (sin distinguir mayúsculas ni tildes)
+    y los documentos subidos por mes. Se mantienen al día con cada cambio, sin recorrer los documentos.
+    """
+    return await get_user_stats(str(current_user.id), keywords)
+
+
+def _split_fields(fields: str | None) -> list[str] | None:
+    return [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+
+@router.get("/search", response_model=List[DocumentSearchResult])
+async def search_documents(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    mode: Literal["keyword", "semantic"] = "keyword",
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Busca en los documentos del usuario autenticado y los ordena por relevancia.
+    - keyword: BM25 sobre el título, el resumen, las palabras clave y el texto extraído.
+    - semantic: similitud coseno entre el embedding de la consulta y el de cada documento.
+    """
+    owner_id = str(current_user.id)
+    if mode == "semantic":
+        hits = await vector_index.search(owner_id, q, limit)
+    else:
+        hits = await search_index.search(owner_id, q, limit)
+    return await _ranked_documents(hits, owner_id)
+
+
+@router.get("/{id}/similar", response_model=List[DocumentSearchResult])
+async def get_similar_documents(
+    id: str,
+    limit: int = Query(10, ge=1, le=100),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Devuelve los documentos del usuario más parecidos a uno dado, por similitud coseno de sus embeddings.
+    """
+    if not ObjectId.is_valid(id):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "ID de documento inválido.")
+
+    owner_id = str(current_user.id)
+    hits = await vector_index.similar(owner_id, id, limit)
+    if hits is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Documento no encontrado.")
+    return await _ranked_documents(hits, owner_id)
+
+
+async def _ranked_documents(hits: list[tuple[str, float]], owner_id: str) -> List[DocumentSearchResult]:
+    """Carga los documentos de una lista (id, puntuación) conservando el orden."""
+    if not hits:
+        return []
+    documents = await document_repository.get_many([doc_id for doc_id, _ in hits], owner_id)
+    return [
+        DocumentSearchResult(**documents[doc_id], score=round(score, 4))
+        for doc_id, score in hits
+        if doc_id in documents
+    ]
 
 
 @router.get("/{id}", response_model=DocumentResponse)
@@ -71,12 +366,10 @@ async def get_document_by_id(id: str, current_user: UserModel = Depends(get_curr
     if not ObjectId.is_valid(id):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "ID de documento inválido.")
     
-    doc = await document_collection.find_one({"_id": ObjectId(id)})
-    
-    if doc and doc["owner_id"] == str(current_user.id):
-        return DocumentResponse(**doc)
-    
-    raise HTTPException(status.HTTP_404_NOT_FOUND, "Documento no encontrado.")
+    doc = await document_repository.get(id, str(current_user.id))
+    if doc is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Documento no encontrado.")
+    return DocumentResponse(**doc)
 
 
 @router.put("/{id}", response_model=DocumentResponse)
@@ -87,28 +380,38 @@ async def update_document_by_id(id: str, doc_update: UpdateDocumentModel, curren
     if not ObjectId.is_valid(id):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "ID de documento inválido.")
     
-    doc = await document_collection.find_one({"_id": ObjectId(id)})
-    
-    if not doc or doc["owner_id"] != str(current_user.id):
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Documento no encontrado.")
-
     update_data = doc_update.model_dump(exclude_unset=True)
-    
-    # El modelo de actualización puede contener campos de nivel superior o dentro de 'analysis'
-    update_query = {}
-    if "title" in update_data:
-        update_query["analysis.title"] = update_data["title"]
-    if "summary" in update_data:
-        update_query["analysis.summary"] = update_data["summary"]
-    if "keywords" in update_data:
-        update_query["analysis.keywords"] = update_data["keywords"]
-
-    if not update_query:
+    if not update_data:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "No hay datos para actualizar.")
 
-    await document_collection.update_one({"_id": ObjectId(id)}, {"$set": update_query})
-    
-    updated_doc = await document_collection.find_one({"_id": ObjectId(id)})
+    # Los campos editables están dentro de 'analysis'; la comprobación de propietario va en el filtro
+    changed = await document_repository.update_analysis(id, str(current_user.id), update_data)
+    if changed is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Documento no encontrado.")
+
+    before, updated_doc = changed
+    await asyncio.gather(search_index.update_document(updated_doc), user_stats.record_changed(before, updated_doc))
+    return DocumentResponse(**updated_doc)
+
+
+@router.post("/{id}/reanalyze", response_model=DocumentResponse)
+async def reanalyze_document_by_id(id: str, current_user: UserModel = Depends(get_current_user)):
+    """
+    Vuelve a analizar un documento con su texto guardado, sin subir de nuevo el PDF,
+    ignorando el análisis en caché. Sirve para corregir un resumen malo.
+    """
+    if not ObjectId.is_valid(id):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "ID de documento inválido.")
+
+    doc = await document_repository.get(id, str(current_user.id))
+    if doc is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Documento no encontrado.")
+    try:
+        updated_doc = await reanalyze_document(doc, refresh=True)
+    except MissingDocumentText:
+        raise HTTPException(status.HTTP_409_CONFLICT, "El documento no tiene el texto guardado; vuelve a subir el PDF.")
+    except DocumentProcessingError as e:
+        raise HTTPException(e.status_code, e.message)
     return DocumentResponse(**updated_doc)
 
 
@@ -120,14 +423,14 @@ async def delete_document_by_id(id: str, current_user: UserModel = Depends(get_c
     if not ObjectId.is_valid(id):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "ID de documento inválido.")
     
-    doc = await document_collection.find_one({"_id": ObjectId(id)})
-    
-    if not doc or doc["owner_id"] != str(current_user.id):
+    deleted = await document_repository.delete(id, str(current_user.id))
+    if deleted is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Documento no encontrado.")
-        
-    delete_result = await document_collection.delete_one({"_id": ObjectId(id)})
-    
-    if delete_result.deleted_count == 0:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Documento no encontrado para eliminar.")
+
+    await asyncio.gather(
+        search_index.remove_document(str(current_user.id), ObjectId(id)),
+        text_store.delete(ObjectId(id)),
+        user_stats.record_removed(deleted),
+    )
     
     return
\ No newline at end of file
@@ -0,0 +1,46 @@
+# app/routers/health.py
+
+import os
+
+from fastapi import APIRouter, Request, Response, status
+
+from app import database
+
+# Lo que puede tardar el ping a MongoDB antes de dar el proceso por no preparado
+HEALTH_PING_TIMEOUT_SECONDS = float(os.getenv("HEALTH_PING_TIMEOUT_SECONDS", "1"))
+
+router = APIRouter(
+    prefix="/health",
+    tags=["Health"]
+)
+
+@router.get("/live")
+async def liveness():
+    """
+    Sonda de vida: el proceso responde. No consulta nada externo, para que un fallo
+    de MongoDB no haga reiniciar procesos que están bien.
+    """
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness(request: Request, response: Response):
+    """
+    Sonda de disponibilidad: 200 si el arranque terminó y MongoDB responde a un ping;
+    503 mientras arranca, al parar o si la base de datos no responde.
+    Incluye lo que tardó cada fase del arranque.
+    """
+    if not getattr(request.app.state, "ready", False):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "starting"}
+
+    try:
+        seconds = await database.ping(HEALTH_PING_TIMEOUT_SECONDS)
+    except Exception as e:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "unavailable", "detail": f"MongoDB no responde: {e or type(e).__name__}"}
+    return {
+        "status": "ready",
+        "mongo_ms": round(seconds * 1000, 2),
+        "startup_seconds": request.app.state.startup,
+    }
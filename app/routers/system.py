@@ -0,0 +1,80 @@
+# app/routers/system.py
+
+from fastapi import APIRouter
+
+from app.metrics import profiler, event_loop_monitor
+from app.security import auth_cache, password_hasher
+from app.services.analysis_cache import analysis_cache
+from app.services.analysis import chunk_cache, llm
+from app.services.llm_scheduler import llm_scheduler
+from app.services.search import search_index
+from app.services.vector_index import vector_index
+
+router = APIRouter(
+    prefix="/api/v1/system",
+    tags=["System"]
+)
+
+@router.get("/cache")
+async def get_cache_stats():
+    """
+    Devuelve los contadores de las cachés de análisis (aciertos, fallos y desalojos):
+    la de documentos completos y la de fragmentos del análisis map-reduce.
+    """
+    return {
+        "documents": analysis_cache.stats(),
+        "chunks": chunk_cache.stats(),
+    }
+
+
+@router.get("/llm")
+async def get_llm_stats():
+    """
+    Devuelve el estado de los proveedores de IA: circuito, fallos, latencias y coberturas.
+    """
+    return llm.stats()
+
+
+@router.get("/scheduler")
+async def get_scheduler_stats():
+    """
+    Devuelve el estado del planificador de llamadas al modelo: cola, esperas y límites.
+    """
+    return llm_scheduler.stats()
+
+
+@router.get("/search")
+async def get_search_stats():
+    """
+    Devuelve el tamaño de los índices de búsqueda cargados en este proceso (texto y vectores).
+    """
+    return {
+        "text": search_index.stats(),
+        "vectors": vector_index.stats(),
+    }
+
+
+@router.get("/auth")
+async def get_auth_cache_stats():
+    """
+    Devuelve los contadores de la caché de autenticación (tokens y usuarios)
+    y del pool de hashing de contraseñas.
+    """
+    return {
+        "cache": auth_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+    }
+
+
+@router.get("/profiles")
+async def get_slow_request_profiles():
+    """
+    Devuelve los perfiles por muestreo de las últimas peticiones lentas (pilas colapsadas,
+    aptas para un flame graph). Solo hay perfiles con PROFILE_SLOW_REQUEST_MS > 0.
+    """
+    return {
+        "enabled": profiler.enabled,
+        "threshold_ms": profiler.threshold * 1000,
+        "event_loop_max_lag_seconds": round(event_loop_monitor.max_lag, 4),
+        "profiles": list(profiler.profiles),
+    }
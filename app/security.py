@@ -1,14 +1,19 @@
 # app/security.py
 
 import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from cachetools import TLRUCache, TTLCache
 from dotenv import load_dotenv
-from app.database import user_collection
+from app.repositories import user_repository
 from app.models.user import UserModel
+from app.metrics import stage
 
 load_dotenv()
 
@@ -17,9 +22,31 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Usuarios autenticados que se guardan en memoria y durante cuánto tiempo.
+# Los cambios de un usuario se invalidan al momento en este proceso (`invalidate_user`);
+# en los demás se ven como mucho pasado este tiempo.
+AUTH_CACHE_MAX_USERS = int(os.getenv("AUTH_CACHE_MAX_USERS", "10000"))
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_TOKENS = int(os.getenv("AUTH_CACHE_MAX_TOKENS", "10000"))
+
+# Coste de Argon2 (memoria en KiB). Al cambiarlo, los hashes antiguos se regeneran en el siguiente login.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+
+# Hilos dedicados a Argon2 (libera el GIL) y cuántas operaciones pueden esperar antes de rechazar más
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 8)))
+
 # --- CAMBIO IMPORTANTE AQUÍ ---
 # Cambiamos el esquema de hashing a 'argon2', que es más moderno y seguro.
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
 # -----------------------------
 
 # El resto del archivo permanece igual
@@ -35,6 +62,90 @@ def get_password_hash(password: str) -> str:
     """Genera un hash seguro para una contraseña."""
     return pwd_context.hash(password)
 
+class PasswordHashingOverloaded(Exception):
+    """Hay demasiadas operaciones de hashing pendientes: la petición se rechaza sin esperar."""
+
+
+class PasswordHasher:
+    """
+    Ejecuta Argon2 en un pool de hilos propio para no bloquear el event loop: cada
+    hash o verificación cuesta decenas de milisegundos de CPU. Si ya hay
+    `max_pending` operaciones en curso o en cola, rechaza la nueva al instante en
+    lugar de dejar que la cola crezca durante una avalancha de logins.
+    """
+
+    def __init__(self, max_workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="argon2")
+        return self._executor
+
+    def check_capacity(self) -> None:
+        """Rechaza la petición antes de hacer ningún trabajo si el pool está saturado."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHashingOverloaded("Demasiadas operaciones de autenticación en curso.")
+
+    async def _run(self, function, *args):
+        self.check_capacity()
+        loop = asyncio.get_running_loop()
+        future = self._get_executor().submit(function, *args)
+        # Se descuenta cuando termina el hilo, aunque la petición se haya cancelado antes
+        self.pending += 1
+        future.add_done_callback(lambda _: self._finished_threadsafe(loop))
+        with stage("password_hash"):
+            return await asyncio.wrap_future(future)
+
+    def _finished_threadsafe(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            loop.call_soon_threadsafe(self._finished)
+        except RuntimeError:
+            pass  # El event loop ya se cerró (apagado del servidor)
+
+    def _finished(self) -> None:
+        self.pending -= 1
+        self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """
+        Verifica la contraseña y, si el hash se generó con otros parámetros,
+        devuelve también el nuevo hash para guardarlo.
+        """
+        valid, new_hash = await self._run(pwd_context.verify_and_update, password, hashed_password)
+        if new_hash is not None:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+
 def create_access_token(data: dict) -> str:
     """Crea un nuevo token de acceso JWT."""
     to_encode = data.copy()
@@ -43,26 +154,123 @@ def create_access_token(data: dict) -> str:
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+class AuthCache:
+    """
+    Caché de autenticación en dos partes:
+    - Tokens ya verificados y su usuario (`sub`), hasta que caduca cada token.
+    - Usuarios por email (LRU con TTL), para no leer la colección en cada petición.
+    Las lecturas de Mongo que empiezan antes de una invalidación no se guardan,
+    así que un cambio no se pierde aunque coincida con una petición en curso.
+    """
+
+    def __init__(self, max_users: int = AUTH_CACHE_MAX_USERS, ttl: int = AUTH_CACHE_TTL_SECONDS,
+                 max_tokens: int = AUTH_CACHE_MAX_TOKENS):
+        self._users: TTLCache[str, UserModel] = TTLCache(maxsize=max_users, ttl=ttl)
+        self._tokens: TLRUCache[str, tuple[str, float]] = TLRUCache(
+            maxsize=max_tokens, ttu=self._token_expiry, timer=time.monotonic,
+        )
+        self.version = 0
+        self.token_hits = 0
+        self.token_misses = 0
+        self.user_hits = 0
+        self.user_misses = 0
+
+    @staticmethod
+    def _token_expiry(token: str, value: tuple[str, float], now: float) -> float:
+        # `exp` es una hora UNIX; la caché mide el tiempo con el reloj monotónico
+        return now + (value[1] - time.time())
+
+    def subject(self, token: str) -> str | None:
+        """Email de un token ya verificado y aún vigente, o None."""
+        cached = self._tokens.get(token)
+        if cached is None:
+            self.token_misses += 1
+            return None
+        self.token_hits += 1
+        return cached[0]
+
+    def remember_token(self, token: str, email: str, exp: float | None) -> None:
+        self._tokens[token] = (email, exp if exp is not None else time.time() + self._users.ttl)
+
+    def user(self, email: str) -> UserModel | None:
+        user = self._users.get(email)
+        if user is None:
+            self.user_misses += 1
+        else:
+            self.user_hits += 1
+        return user
+
+    def remember_user(self, user: UserModel, version: int) -> None:
+        """Guarda el usuario leído si no hubo invalidaciones desde que empezó la lectura."""
+        if version == self.version:
+            self._users[user.email] = user
+
+    def invalidate_user(self, email: str) -> None:
+        """Olvida el usuario tras cambiarlo o borrarlo; la siguiente petición lo vuelve a leer."""
+        self.version += 1
+        self._users.pop(email, None)
+
+    def clear(self) -> None:
+        self.version += 1
+        self._users.clear()
+        self._tokens.clear()
+
+    def stats(self) -> dict:
+        """Aciertos y fallos de tokens y usuarios, y ocupación de la caché."""
+        lookups = self.user_hits + self.user_misses
+        return {
+            "token_hits": self.token_hits,
+            "token_misses": self.token_misses,
+            "user_hits": self.user_hits,
+            "user_misses": self.user_misses,
+            "hit_ratio": self.user_hits / lookups if lookups else 0.0,
+            "users": len(self._users),
+            "tokens": len(self._tokens),
+            "max_users": self._users.maxsize,
+            "ttl_seconds": self._users.ttl,
+        }
+
+
+auth_cache = AuthCache()
+
+
+def invalidate_user(email: str) -> None:
+    """Debe llamarse al modificar o borrar un usuario."""
+    auth_cache.invalidate_user(email)
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserModel:
     """
     Decodifica el token JWT para obtener el usuario actual.
     Esta función se usará como una dependencia en los endpoints protegidos.
+    Los tokens verificados y los usuarios se guardan en `auth_cache`, así que en el
+    caso habitual no se verifica la firma ni se consulta MongoDB.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    email = auth_cache.subject(token)
+    if email is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = await user_collection.find_one({"email": email})
-    if user is None:
+        auth_cache.remember_token(token, email, payload.get("exp"))
+
+    user = auth_cache.user(email)
+    if user is not None:
+        return user
+
+    version = auth_cache.version
+    user_doc = await user_repository.get_by_email(email)
+    if user_doc is None:
         raise credentials_exception
-    
-    return UserModel(**user)
\ No newline at end of file
+
+    user = UserModel(**user_doc)
+    auth_cache.remember_user(user, version)
+    return user
@@ -0,0 +1,27 @@
+# app/serialization.py
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+
+def _default(value):
+    """Tipos de MongoDB que orjson no conoce (datetime lo serializa él en ISO 8601)."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Tipo no serializable a JSON: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Respuesta JSON serializada con orjson. Admite directamente documentos de MongoDB
+    (ObjectId, datetime): las rutas que leen datos de confianza con una proyección que ya
+    tiene la forma de la respuesta la devuelven tal cual, sin validar cada documento con Pydantic.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
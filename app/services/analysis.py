@@ -0,0 +1,90 @@
+# app/services/analysis.py
+
+import os
+import hashlib
+import logging
+from functools import partial
+
+from starlette.concurrency import run_in_threadpool
+
+from app.database import analysis_cache_collection
+from app.services.analysis_cache import AnalysisCache
+from app.services.prompts import build_analysis_prompt, parse_analysis, MAX_PROMPT_CHARS, PROMPT_VERSION
+from app.services.map_reduce import MapReduceAnalyzer, MAP_REDUCE_VERSION
+from app.services.condensation import condense, CONDENSE_ENABLED, CONDENSE_CHUNK_CHARS
+from app.services.llm_providers import build_llm, LLMError, TextCallback
+from app.services.llm_scheduler import llm_scheduler, estimate_tokens
+from app.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# "map_reduce": los documentos que no caben en un prompt se analizan por fragmentos.
+# "single": se analiza solo el principio del texto, como hasta ahora.
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "map_reduce")
+
+# Cliente de IA con timeouts, reintentos, circuito y fallback entre proveedores.
+# Sus 429 reducen la concurrencia del planificador.
+llm = build_llm(on_rate_limit=llm_scheduler.record_rate_limit)
+
+# Versión global del análisis: cambia si cambia el prompt, el modelo, el modo o la condensación
+ANALYSIS_VERSION = hashlib.sha256(
+    f"{ANALYSIS_MODE}|{PROMPT_VERSION}|{MAP_REDUCE_VERSION}|"
+    f"{CONDENSE_ENABLED}|{CONDENSE_CHUNK_CHARS}|{llm.version}".encode("utf-8")
+).hexdigest()[:16]
+
+# Caché de análisis parciales por fragmento (comparte colección con la de documentos)
+chunk_cache = AnalysisCache(analysis_cache_collection)
+
+map_reduce_analyzer = MapReduceAnalyzer(
+    llm.generate,
+    cache=chunk_cache,
+    model_version=llm.version,
+    condense_chars=CONDENSE_CHUNK_CHARS if CONDENSE_ENABLED else None,
+)
+
+
+async def generate_for_owner(owner_id: str | None, prompt: str, on_text: TextCallback | None = None) -> str:
+    """
+    Llamada al modelo pasando por el planificador (concurrencia, tokens y turnos por usuario).
+    Con `on_text`, la respuesta llega en streaming y se entrega fragmento a fragmento.
+    Cada intento espera su turno por separado: un reintento no retiene el hueco durante su espera.
+    """
+    # Incluye la espera en el planificador, que se mide aparte como "llm_queue"
+    with stage("llm"):
+        return await llm.generate(prompt, on_text, gate=partial(llm_scheduler.run, owner_id, estimate_tokens(prompt)))
+
+
+async def _analyze_single_pass(text: str, owner_id: str | None, on_text: TextCallback | None = None) -> dict | None:
+    try:
+        return parse_analysis(await generate_for_owner(owner_id, build_analysis_prompt(text), on_text))
+    except LLMError:
+        # Proveedor caído, saturado o con el circuito abierto: quien llama decide si reintenta
+        raise
+    except Exception as e:
+        logger.warning("Falló el análisis de IA: %s", e)
+        return None
+
+
+async def analyze_document_text(
+    text: str,
+    page_offsets: list[int] | None = None,
+    owner_id: str | None = None,
+    on_text: TextCallback | None = None,
+) -> dict | None:
+    """
+    Analiza el texto de un documento con el modo configurado.
+    Con la condensación activada, antes de llamar al modelo se seleccionan las frases
+    más representativas en lugar de cortar por el principio: de cada fragmento en
+    map-reduce y de todo el texto en el modo "single". En map-reduce, un texto que cabe
+    en un prompt se analiza entero en una pasada, sin condensar.
+    `on_text` recibe la respuesta del modelo en streaming en el análisis de una pasada
+    (en map-reduce no hay una única respuesta que transmitir y no se llama).
+    Devuelve un diccionario con title, summary y keywords, o None si falla.
+    Si el modelo no responde (LLMError), la excepción se propaga: el fallo es transitorio.
+    """
+    if ANALYSIS_MODE == "map_reduce" and len(text) > MAX_PROMPT_CHARS:
+        return await map_reduce_analyzer.analyze(text, page_offsets, partial(generate_for_owner, owner_id))
+
+    if ANALYSIS_MODE == "single" and CONDENSE_ENABLED and len(text) > MAX_PROMPT_CHARS:
+        text = await run_in_threadpool(condense, text, MAX_PROMPT_CHARS)
+    return await _analyze_single_pass(text, owner_id, on_text)
@@ -0,0 +1,136 @@
+# app/services/analysis_cache.py
+
+import os
+import re
+import hashlib
+import logging
+from datetime import datetime, timezone
+
+from cachetools import TTLCache
+
+from app.database import analysis_cache_collection
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "3600"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza el texto extraído para que diferencias de espaciado no cambien la clave."""
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+def make_cache_key(pdf_sha256: str, text: str) -> str:
+    """
+    Construye la clave de caché a partir del hash del PDF y del texto normalizado.
+    La clave no depende de la versión del prompt: la versión se guarda en la entrada.
+    """
+    text_sha256 = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{pdf_sha256}:{text_sha256}".encode("ascii")).hexdigest()
+
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache que cuenta los desalojos por tamaño y por expiración."""
+
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize, ttl)
+        self.evictions = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        self.evictions += len(expired)
+        return expired
+
+
+class AnalysisCache:
+    """
+    Caché de análisis en dos niveles:
+    - Un nivel en memoria (LRU con TTL) para aciertos en milisegundos.
+    - Un nivel persistente en MongoDB compartido entre procesos y reinicios.
+    Cada entrada guarda la versión de prompt/modelo con la que se generó.
+    Con `collection=None` solo se usa el nivel en memoria.
+    """
+
+    def __init__(self, collection, maxsize: int = CACHE_MAX_ENTRIES, ttl: int = CACHE_TTL_SECONDS):
+        self._collection = collection
+        self._memory = _CountingTTLCache(maxsize=maxsize, ttl=ttl)
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    async def get(self, key: str, version: str) -> dict | None:
+        """Devuelve el análisis guardado para la clave si coincide la versión."""
+        stale = False
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry["version"] == version:
+                self.memory_hits += 1
+                return entry["analysis"]
+            self._memory.pop(key, None)
+            stale = True
+
+        doc = None
+        if self._collection is not None:
+            try:
+                doc = await self._collection.find_one({"_id": key})
+            except Exception as e:
+                logger.warning("No se pudo leer la caché de análisis en MongoDB: %s", e)
+
+        if doc is not None:
+            if doc.get("version") == version:
+                self.persistent_hits += 1
+                self._memory[key] = {"version": version, "analysis": doc["analysis"]}
+                return doc["analysis"]
+            stale = True
+
+        if stale:
+            self.stale += 1
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, version: str, analysis: dict) -> None:
+        """Guarda el análisis en ambos niveles, sustituyendo versiones anteriores."""
+        self._memory[key] = {"version": version, "analysis": analysis}
+        if self._collection is None:
+            return
+        try:
+            await self._collection.replace_one(
+                {"_id": key},
+                {
+                    "_id": key,
+                    "version": version,
+                    "analysis": analysis,
+                    "created_at": datetime.now(timezone.utc),
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning("No se pudo guardar la caché de análisis en MongoDB: %s", e)
+
+    def stats(self) -> dict:
+        """Contadores de aciertos, fallos y desalojos de la caché."""
+        hits = self.memory_hits + self.persistent_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self._memory.evictions,
+            "memory_entries": len(self._memory),
+            "memory_max_entries": self._memory.maxsize,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
+
+
+analysis_cache = AnalysisCache(analysis_cache_collection)
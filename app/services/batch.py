@@ -0,0 +1,133 @@
+# app/services/batch.py
+
+import os
+import asyncio
+import logging
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from fastapi import status
+from pymongo.errors import BulkWriteError
+
+from app.models.document import DocumentModel
+from app.repositories import DocumentRepository, document_repository
+from app.uploads import SpooledUpload
+from app.services.analysis import ANALYSIS_VERSION
+from app.services.pipeline import DocumentProcessingError, extract_document, analyze_text, finish_document
+
+logger = logging.getLogger(__name__)
+
+# Análisis simultáneos de un mismo lote (el planificador de IA limita además el total)
+BATCH_ANALYSIS_CONCURRENCY = int(os.getenv("BATCH_ANALYSIS_CONCURRENCY", "4"))
+BATCH_INSERT_SIZE = int(os.getenv("BATCH_INSERT_SIZE", "50"))
+
+
+@dataclass
+class BatchItemResult:
+    """Resultado de un archivo del lote: el documento guardado o el error."""
+    position: int
+    filename: str
+    status_code: int = status.HTTP_201_CREATED
+    document: dict | None = None
+    error: str | None = None
+
+
+class BatchWriter:
+    """
+    Agrupa las inserciones de documentos en llamadas a `insert_many`.
+    Mientras se escribe un grupo, los documentos que van llegando esperan y se
+    insertan juntos en el siguiente, así que con poca carga no añade latencia.
+    """
+
+    def __init__(self, repository: DocumentRepository, batch_size: int = BATCH_INSERT_SIZE):
+        self.repository = repository
+        self.batch_size = batch_size
+        self.insert_calls = 0
+        self._queue: asyncio.Queue[tuple[dict, asyncio.Future]] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    async def __aenter__(self) -> "BatchWriter":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+
+    async def write(self, document: dict) -> dict:
+        """Encola el documento y devuelve el registro guardado, ya con su `_id`."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((document, future))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[tuple[dict, asyncio.Future]]) -> None:
+        failed: dict[int, str] = {}
+        try:
+            # insert_many añade el `_id` a cada documento: no hace falta volver a leerlos
+            await self.repository.create_many([document for document, _ in batch])
+        except BulkWriteError as e:
+            failed = {error["index"]: error.get("errmsg", "") for error in e.details.get("writeErrors", [])}
+        except Exception as e:
+            logger.exception("Falló la inserción de %d documentos.", len(batch))
+            failed = {index: str(e) for index in range(len(batch))}
+        self.insert_calls += 1
+
+        for index, (document, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in failed:
+                future.set_exception(DocumentProcessingError(f"No se pudo guardar el documento: {failed[index]}"))
+            else:
+                future.set_result(document)
+
+
+async def process_batch(uploads: list[SpooledUpload], owner_id: str) -> AsyncIterator[BatchItemResult]:
+    """
+    Procesa varios PDFs a la vez y devuelve cada resultado en cuanto está listo:
+    la extracción va en paralelo en el pool de procesos, el análisis con un límite
+    de concurrencia y el guardado agrupado en `insert_many`.
+    """
+    semaphore = asyncio.Semaphore(BATCH_ANALYSIS_CONCURRENCY)
+
+    async with BatchWriter(document_repository) as writer:
+
+        async def process_one(position: int, upload: SpooledUpload) -> BatchItemResult:
+            result = BatchItemResult(position=position, filename=upload.filename)
+            try:
+                extracted = await extract_document(upload.path)
+                async with semaphore:
+                    analysis = await analyze_text(upload.sha256, extracted.text, extracted.page_offsets, owner_id)
+                document = DocumentModel(filename=upload.filename, analysis=analysis, owner_id=owner_id,
+                                         analysis_version=ANALYSIS_VERSION, page_count=extracted.page_count,
+                                         char_count=extracted.char_count)
+                result.document = await writer.write(document.model_dump())
+                await finish_document(result.document, extracted, upload.sha256)
+            except DocumentProcessingError as e:
+                result.status_code, result.error = e.status_code, e.message
+            except Exception as e:
+                logger.exception("Error al procesar %s del lote.", upload.filename)
+                result.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+                result.error = f"Error al procesar el archivo: {e}"
+            return result
+
+        tasks = [asyncio.create_task(process_one(position, upload)) for position, upload in enumerate(uploads)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Si el cliente se desconecta, no se sigue procesando el resto del lote
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,109 @@
+# app/services/condensation.py
+
+import os
+import re
+
+import numpy as np
+
+CONDENSE_ENABLED = os.getenv("CONDENSE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Presupuesto de cada fragmento del map-reduce: se condensa después de trocear, así las
+# fronteras de los fragmentos (y la caché por fragmento) no cambian al editar otra parte.
+CONDENSE_CHUNK_CHARS = int(os.getenv("CONDENSE_CHUNK_CHARS", "4000"))
+CONDENSE_SEGMENTS = int(os.getenv("CONDENSE_SEGMENTS", "16"))
+
+MIN_SENTENCE_CHARS = 25
+MAX_SENTENCE_CHARS = 1000
+
+# Fin de frase: puntuación latina o de ancho completo (chino, japonés) o salto de línea
+_SENTENCE_RE = re.compile(r"[^.!?。！？\n]+(?:[.!?。！？]+|\n|$)")
+_TOKEN_RE = re.compile(r"\w{3,}")
+
+
+def split_sentences(text: str) -> list[str]:
+    """Divide el texto en frases (o líneas sueltas) sin espacios sobrantes."""
+    return [s for s in (m.group(0).strip() for m in _SENTENCE_RE.finditer(text)) if s]
+
+
+def _split_long_sentence(sentence: str, max_chars: int) -> list[str]:
+    """Corta una frase más larga que `max_chars`, por un espacio si lo hay cerca del límite."""
+    pieces = []
+    while len(sentence) > max_chars:
+        cut = sentence.rfind(" ", max_chars // 2, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(sentence[:cut].strip())
+        sentence = sentence[cut:].strip()
+    pieces.append(sentence)
+    return [piece for piece in pieces if piece]
+
+
+def score_sentences(sentences: list[str]) -> np.ndarray:
+    """
+    Puntúa cada frase por la similitud coseno entre su vector TF-IDF y el centroide
+    TF-IDF del documento: las frases más representativas del conjunto puntúan más.
+    """
+    vocabulary: dict[str, int] = {}
+    sentence_ids, term_ids = [], []
+    for index, sentence in enumerate(sentences):
+        for token in _TOKEN_RE.findall(sentence.lower()):
+            sentence_ids.append(index)
+            term_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+
+    n_sentences = len(sentences)
+    if not term_ids:
+        return np.zeros(n_sentences)
+
+    # Pares (frase, término) únicos con su frecuencia, sin construir la matriz densa
+    pairs = np.asarray(sentence_ids, dtype=np.int64) * len(vocabulary) + np.asarray(term_ids, dtype=np.int64)
+    pairs, counts = np.unique(pairs, return_counts=True)
+    rows, cols = np.divmod(pairs, len(vocabulary))
+
+    document_frequency = np.bincount(cols, minlength=len(vocabulary))
+    idf = np.log((1 + n_sentences) / (1 + document_frequency)) + 1.0
+    weights = (1.0 + np.log(counts)) * idf[cols]
+
+    centroid = np.bincount(cols, weights=weights, minlength=len(vocabulary))
+    centroid /= np.linalg.norm(centroid) or 1.0
+
+    dots = np.bincount(rows, weights=weights * centroid[cols], minlength=n_sentences)
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=n_sentences))
+    return np.divide(dots, norms, out=np.zeros(n_sentences), where=norms > 0)
+
+
+def condense(text: str, max_chars: int = CONDENSE_CHUNK_CHARS, segments: int = CONDENSE_SEGMENTS) -> str:
+    """
+    Selecciona las frases más representativas del texto completo sin pasar de `max_chars`.
+    Primero se toma la mejor frase de cada tramo del documento (cobertura) y después las
+    mejores del conjunto. Las frases se devuelven en su orden original.
+    """
+    if len(text) <= max_chars:
+        return text
+
+    # Las frases enormes (texto sin puntuación reconocible) se trocean para que siempre
+    # haya algo que quepa en el presupuesto
+    piece_chars = min(MAX_SENTENCE_CHARS, max_chars - 1)
+    sentences = split_sentences(text)
+    if piece_chars > 0:
+        sentences = [piece for s in sentences for piece in _split_long_sentence(s, piece_chars)]
+    lengths = np.fromiter((len(s) + 1 for s in sentences), dtype=np.int64, count=len(sentences))
+    scores = score_sentences(sentences)
+    scores[lengths <= MIN_SENTENCE_CHARS] *= 0.1
+
+    order = np.argsort(-scores, kind="stable")
+    segment_of = np.arange(len(sentences)) * segments // max(len(sentences), 1)
+    _, first_per_segment = np.unique(segment_of[order], return_index=True)
+    candidates = np.concatenate([order[first_per_segment], order])
+
+    selected = np.zeros(len(sentences), dtype=bool)
+    used = 0
+    for index in candidates:
+        if selected[index] or used + lengths[index] > max_chars:
+            continue
+        selected[index] = True
+        used += lengths[index]
+        if used >= max_chars - MIN_SENTENCE_CHARS:
+            break
+
+    if not selected.any():
+        return text[:max_chars]
+    return "\n".join(s for s, keep in zip(sentences, selected) if keep)
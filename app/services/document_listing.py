@@ -0,0 +1,122 @@
+# app/services/document_listing.py
+
+import os
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import AsyncIterator
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.database import document_collection
+from app.metrics import timed_stage
+from app.serialization import dumps
+
+DOCUMENTS_PAGE_SIZE = int(os.getenv("DOCUMENTS_PAGE_SIZE", "50"))
+DOCUMENTS_MAX_PAGE_SIZE = int(os.getenv("DOCUMENTS_MAX_PAGE_SIZE", "500"))
+# Documentos por lote del cursor de la exportación (y por trozo de la respuesta)
+DOCUMENTS_EXPORT_BATCH_SIZE = int(os.getenv("DOCUMENTS_EXPORT_BATCH_SIZE", "500"))
+
+# Campos que se pueden pedir en el listado; `_id` y `created_at` van siempre porque forman el cursor
+LIST_FIELDS = {
+    "filename": "filename",
+    "title": "analysis.title",
+    "summary": "analysis.summary",
+    "keywords": "analysis.keywords",
+}
+
+# Campos del listado sin `fields` y de la exportación: exactamente los de la respuesta, que se
+# serializa tal cual sale de la base de datos
+LIST_PROJECTION = {"_id": 1, "created_at": 1, "owner_id": 1, **{path: 1 for path in LIST_FIELDS.values()}}
+EXPORT_PROJECTION = {**LIST_PROJECTION, "analysis_version": 1}
+
+# Orden del listado (más recientes primero) y el índice que lo sirve sin ordenar en memoria
+LIST_SORT = [("created_at", -1), ("_id", -1)]
+LIST_INDEX = [("owner_id", 1), *LIST_SORT]
+
+
+class InvalidCursor(ValueError):
+    """El cursor de paginación no es válido."""
+
+
+async def ensure_document_indexes() -> None:
+    await document_collection.create_index(LIST_INDEX)
+
+
+def encode_cursor(document: dict) -> str:
+    """Cursor opaco con la posición del último documento de la página."""
+    position = {"c": document["created_at"].isoformat(), "i": str(document["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(position["c"]), ObjectId(position["i"])
+    except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError, InvalidId):
+        raise InvalidCursor("Cursor de paginación inválido.")
+
+
+def projection_for(fields: list[str] | None, default: dict = LIST_PROJECTION) -> dict:
+    """Proyección de Mongo para los campos pedidos (sin campos, la de `default`)."""
+    if not fields:
+        return default
+    unknown = set(fields) - LIST_FIELDS.keys()
+    if unknown:
+        raise ValueError(f"Campos no válidos: {', '.join(sorted(unknown))}.")
+    projection = {"_id": 1, "created_at": 1}
+    projection.update({LIST_FIELDS[field]: 1 for field in fields})
+    return projection
+
+
+@timed_stage("db")
+async def list_owner_documents(
+    owner_id: str,
+    limit: int = DOCUMENTS_PAGE_SIZE,
+    cursor: str | None = None,
+    fields: list[str] | None = None,
+) -> tuple[list[dict], str | None]:
+    """
+    Una página de documentos del usuario, de más reciente a más antiguo, y el cursor
+    de la siguiente (None si es la última). Paginación por clave: cada página continúa
+    en el índice desde el último documento de la anterior, así que cuesta lo mismo
+    la primera que la número diez mil (con skip, Mongo recorre todas las anteriores).
+    """
+    query: dict = {"owner_id": owner_id}
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}},
+        ]
+
+    # Se pide uno de más para saber si hay otra página
+    documents = await (
+        document_collection.find(query, projection_for(fields))
+        .sort(LIST_SORT)
+        .limit(limit + 1)
+        .to_list(limit + 1)
+    )
+    if len(documents) <= limit:
+        return documents, None
+    documents = documents[:limit]
+    return documents, encode_cursor(documents[-1])
+
+
+async def export_owner_documents(owner_id: str, projection: dict = EXPORT_PROJECTION) -> AsyncIterator[bytes]:
+    """
+    Todos los documentos del usuario en NDJSON (un documento JSON por línea), de más reciente
+    a más antiguo. Se leen con un cursor por lotes y cada lote sale en cuanto se serializa:
+    la memoria usada no depende del tamaño de la biblioteca.
+    """
+    cursor = document_collection.find({"owner_id": owner_id}, projection, batch_size=DOCUMENTS_EXPORT_BATCH_SIZE)
+    lines: list[bytes] = []
+    async for document in cursor.sort(LIST_SORT):
+        lines.append(dumps(document))
+        if len(lines) >= DOCUMENTS_EXPORT_BATCH_SIZE:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
@@ -1,49 +1,36 @@
 # app/services/gemini_service.py
 
 import os
-import re
-import json
-import google.generativeai as genai
+from functools import cache
+
 from dotenv import load_dotenv
 
-load_dotenv()
+MODEL_NAME = os.getenv("GEMINI_MODEL", "models/gemini-pro-latest")
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
-async def get_gemini_analysis(text: str) -> dict | None:
+@cache
+def _model():
+    """
+    Cliente de Gemini, creado en la primera llamada: el SDK tarda en importarse
+    y los procesos que no usan Gemini no deberían pagarlo al arrancar.
     """
-    Envía el texto extraído a la API de Gemini para su análisis.
-    Devuelve un diccionario con el análisis o None si falla.
+    import google.generativeai as genai
+
+    load_dotenv()
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return genai.GenerativeModel(MODEL_NAME)
+
+async def generate_text(prompt: str) -> str:
     """
-    prompt = f"""
-    Analiza el siguiente texto y devuelve EXCLUSIVAMENTE un objeto JSON válido con la siguiente estructura:
-    - "title": Un título adecuado y conciso para el documento.
-    - "summary": Un resumen ejecutivo de 3 o 4 frases clave.
-    - "keywords": una lista de 5 a 7 palabras clave importantes.
-
-    NO incluyas "
-json" ni "
-" en la respuesta. La respuesta debe ser solo el JSON.
-
-    Texto del documento:
-    ---
-    {text[:8000]}
-    ---
+    Envía un prompt a la API de Gemini y devuelve el texto de la respuesta.
+    Los errores se propagan para que la capa de proveedores pueda reintentar o cambiar de proveedor.
     """
-    try:
-        model = genai.GenerativeModel('models/gemini-pro-latest')
-        response = await model.generate_content_async(prompt)
-        result_text = response.text.strip()
-
-        # Extraer el bloque JSON de la respuesta para mayor robustez
-        json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-        if not json_match:
-            print(f"Error: No se encontró JSON en la respuesta de Gemini. Respuesta: {result_text}")
-            return None
-            
-        json_string = json_match.group(0)
-        return json.loads(json_string)
-
-    except Exception as e:
-        print(f"Error durante la llamada o procesamiento de Gemini: {e}")
-        return None
\ No newline at end of file
+    response = await _model().generate_content_async(prompt)
+    return response.text.strip()
+
+
+async def stream_text(prompt: str):
+    """Como `generate_text`, pero devuelve los fragmentos de la respuesta según los genera el modelo."""
+    response = await _model().generate_content_async(prompt, stream=True)
+    async for chunk in response:
+        yield chunk.text
@@ -0,0 +1,373 @@
+# app/services/ingestion.py
+
+import os
+import asyncio
+import logging
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+
+from app.database import job_collection, get_upload_bucket, stored_datetime
+from app.models.job import JobState
+from app.repositories import document_repository
+from app.uploads import SpooledUpload, UPLOAD_CHUNK_BYTES, UPLOAD_SPOOL_DIR
+from app.services.pipeline import (
+    AnalysisUnavailable,
+    DocumentProcessingError,
+    extract_document,
+    analyze_text,
+    save_document,
+)
+
+logger = logging.getLogger(__name__)
+
+INGESTION_CONCURRENCY = int(os.getenv("INGESTION_CONCURRENCY", "4"))
+JOB_LEASE_SECONDS = int(os.getenv("INGESTION_JOB_LEASE_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("INGESTION_JOB_MAX_ATTEMPTS", "3"))
+# Espera antes de reintentar un trabajo cuyo análisis falló porque la IA no respondía (se duplica en cada intento)
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("INGESTION_JOB_RETRY_BACKOFF_SECONDS", "30"))
+# Cada cuánto se buscan trabajos pendientes que no estén en la cola de este proceso
+# (concesiones expiradas de otro proceso caído, trabajos que encoló otro proceso que se paró)
+JOB_SWEEP_INTERVAL_SECONDS = float(os.getenv("INGESTION_JOB_SWEEP_INTERVAL_SECONDS", "60"))
+
+IN_PROGRESS_STATES = [JobState.extracting.value, JobState.analyzing.value]
+
+
+class LeaseLost(Exception):
+    """Otra ejecución reclamó el trabajo al expirar la concesión de esta."""
+
+
+def _claimable_filter(now: datetime) -> dict:
+    """
+    Trabajos en cola (pasada su espera de reintento, si la tienen), o en curso cuyo proceso
+    dueño dejó expirar la concesión (p. ej. tras un reinicio).
+    """
+    return {
+        "$or": [
+            {"state": JobState.queued.value, "$or": [{"retry_at": None}, {"retry_at": {"$lte": now}}]},
+            {"state": {"$in": IN_PROGRESS_STATES}, "lease_until": {"$lt": now}},
+        ]
+    }
+
+
+async def _upload_file(path: str, filename: str, metadata: dict) -> ObjectId:
+    """Sube el fichero a GridFS por bloques; las lecturas de disco se hacen en un hilo."""
+    source = await run_in_threadpool(open, path, "rb")
+    grid_in = get_upload_bucket().open_upload_stream(filename, metadata=metadata)
+    try:
+        while chunk := await run_in_threadpool(source.read, UPLOAD_CHUNK_BYTES):
+            await grid_in.write(chunk)
+    except BaseException:
+        await grid_in.abort()
+        raise
+    finally:
+        await run_in_threadpool(source.close)
+    await grid_in.close()
+    return grid_in._id
+
+
+async def _download_file(file_id: ObjectId) -> str:
+    """
+    Vuelca el fichero de GridFS a un temporal por bloques y devuelve su ruta (la borra quien llama).
+    Las escrituras en disco se hacen en un hilo.
+    """
+    grid_out = await get_upload_bucket().open_download_stream(file_id)
+    spool = await run_in_threadpool(
+        tempfile.NamedTemporaryFile, dir=UPLOAD_SPOOL_DIR, suffix=".pdf", delete=False
+    )
+    try:
+        try:
+            while chunk := await grid_out.read(UPLOAD_CHUNK_BYTES):
+                await run_in_threadpool(spool.write, chunk)
+        finally:
+            await run_in_threadpool(spool.close)
+    except BaseException:
+        os.unlink(spool.name)
+        raise
+    return spool.name
+
+
+class IngestionWorkerPool:
+    """
+    Pool acotado de workers asyncio que procesa los trabajos de ingesta.
+    Los trabajos viven en MongoDB: cada worker reclama el suyo de forma atómica,
+    así que varios procesos pueden compartir la cola sin procesar nada dos veces.
+    Al parar, los trabajos a medias vuelven a la cola; los de un proceso caído se
+    retoman cuando expira su concesión, en el siguiente barrido.
+    Si el análisis falla porque la IA no responde, el trabajo vuelve a la cola con una
+    espera creciente y conserva su PDF hasta agotar los intentos.
+    """
+
+    def __init__(self, concurrency: int = INGESTION_CONCURRENCY,
+                 sweep_interval: float = JOB_SWEEP_INTERVAL_SECONDS):
+        self.concurrency = concurrency
+        self.sweep_interval = sweep_interval
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self._sweeper: asyncio.Task | None = None
+        # Trabajos en la cola local (para no encolarlos dos veces) y en curso en este proceso
+        self._pending: set[ObjectId] = set()
+        self._running: dict[ObjectId, dict] = {}
+        # Reintentos programados en este proceso, que se encolan al acabar su espera
+        self._delayed: dict[ObjectId, asyncio.TimerHandle] = {}
+
+    async def start(self) -> None:
+        """Arranca los workers y el barrido, y reencola los trabajos pendientes de ejecuciones anteriores."""
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        await self.resume_pending()
+        if self.sweep_interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self) -> None:
+        """Detiene los workers y devuelve a la cola los trabajos que tenían a medias."""
+        # Los trabajos que terminen mientras se cancela no se tocan: _release solo cambia los que siguen en curso
+        running = list(self._running.values())
+        tasks = [*self._workers, *([self._sweeper] if self._sweeper else [])]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers, self._sweeper = [], None
+        await self._release(running)
+        for handle in self._delayed.values():
+            handle.cancel()
+        self._delayed.clear()
+        self._pending.clear()
+
+    async def _release(self, jobs: list[dict]) -> None:
+        """Devuelve los trabajos a la cola sin gastar un intento, si la concesión sigue siendo nuestra."""
+        for job in jobs:
+            try:
+                await job_collection.update_one(
+                    {"_id": job["_id"], "state": {"$in": IN_PROGRESS_STATES}, "lease_token": job["lease_token"]},
+                    {"$set": {"state": JobState.queued.value, "lease_token": None, "lease_until": None,
+                              "updated_at": datetime.now(timezone.utc)},
+                     "$inc": {"attempts": -1}},
+                )
+            except Exception as e:
+                logger.warning("No se pudo devolver a la cola el trabajo %s: %s", job["_id"], e)
+        if jobs:
+            logger.info("Devueltos a la cola %d trabajos de ingesta a medias.", len(jobs))
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, job_id: ObjectId) -> None:
+        """Encola un trabajo para que lo procese el siguiente worker libre."""
+        # Si lo encuentra antes el barrido, el reintento programado ya no hace falta
+        delayed = self._delayed.pop(job_id, None)
+        if delayed is not None:
+            delayed.cancel()
+        if job_id in self._pending or job_id in self._running:
+            return
+        self._pending.add(job_id)
+        self._queue.put_nowait(job_id)
+
+    async def resume_pending(self) -> int:
+        """Encola los trabajos reclamables que no estén ya en este proceso. Devuelve cuántos encoló."""
+        now = datetime.now(timezone.utc)
+        resumed = 0
+        cursor = job_collection.find(_claimable_filter(now), {"_id": 1}).sort("created_at", 1)
+        async for job in cursor:
+            if job["_id"] not in self._pending and job["_id"] not in self._running:
+                self.submit(job["_id"])
+                resumed += 1
+        if resumed:
+            logger.info("Reanudando %d trabajos de ingesta pendientes.", resumed)
+        return resumed
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.resume_pending()
+            except Exception as e:
+                logger.warning("Falló el barrido de trabajos de ingesta pendientes: %s", e)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._pending.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception:
+                logger.exception("Error inesperado procesando el trabajo %s", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _claim(self, job_id: ObjectId) -> dict | None:
+        now = datetime.now(timezone.utc)
+        return await job_collection.find_one_and_update(
+            {"_id": job_id, **_claimable_filter(now)},
+            {
+                "$set": {
+                    "state": JobState.extracting.value,
+                    "updated_at": now,
+                    # El token identifica esta ejecución: si otra reclama el trabajo, esta ya no puede escribir
+                    "lease_token": ObjectId(),
+                    "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "retry_at": None,
+                },
+                "$inc": {"attempts": 1},
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _set_state(self, job: dict, state: JobState | None = None, **fields) -> bool:
+        """
+        Cambia el estado (o solo renueva la concesión, sin `state`) si el trabajo sigue siendo
+        de esta ejecución. Devuelve False si otra lo reclamó al expirar la concesión.
+        """
+        now = datetime.now(timezone.utc)
+        update = {"updated_at": now, "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS), **fields}
+        if state is not None:
+            update["state"] = state.value
+        result = await job_collection.update_one({"_id": job["_id"], "lease_token": job["lease_token"]}, {"$set": update})
+        return result.matched_count == 1
+
+    async def _keep_lease(self, job: dict, processing: asyncio.Task) -> None:
+        """Renueva la concesión mientras dura el trabajo (una espera larga al modelo no la deja expirar)."""
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                renewed = await self._set_state(job)
+            except Exception as e:
+                logger.warning("No se pudo renovar la concesión del trabajo %s: %s", job["_id"], e)
+                continue
+            if not renewed:
+                job["lease_lost"] = True
+                processing.cancel()
+                return
+
+    async def _run(self, job_id: ObjectId) -> None:
+        job = await self._claim(job_id)
+        if job is None:
+            # Otro worker (o proceso) ya lo reclamó o ya terminó
+            return
+
+        self._running[job_id] = job
+        processing = asyncio.create_task(self._process(job))
+        keeper = asyncio.create_task(self._keep_lease(job, processing))
+        try:
+            # Con `await processing`, la cancelación del worker (al parar) se le pasa al procesamiento,
+            # y si este la pierde (p. ej. un wait_for que termina a la vez) el worker seguiría vivo.
+            # Esperándolo con asyncio.wait, la cancelación le llega siempre al worker.
+            await asyncio.wait([processing])
+        except asyncio.CancelledError:
+            processing.cancel()
+            await asyncio.wait([processing])
+            raise
+        finally:
+            keeper.cancel()
+            self._running.pop(job_id, None)
+
+        if processing.cancelled():
+            # Solo lo cancela _keep_lease, al perder la concesión
+            logger.warning("El trabajo %s lo ha reclamado otra ejecución; se abandona.", job_id)
+            return
+        processing.result()
+
+    async def _process(self, job: dict) -> None:
+        job_id = job["_id"]
+        # El documento se crea con el _id del trabajo: si ya existe, un intento anterior llegó a guardarlo
+        if await document_repository.get(job_id, job["owner_id"]) is not None:
+            await self._finish(job, JobState.done, document_id=str(job_id), error=None)
+            return
+
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            await self._finish(job, JobState.failed, error="Se agotaron los reintentos del trabajo.")
+            return
+
+        try:
+            # El PDF se vuelca de GridFS a disco por bloques; la extracción lo abre por ruta
+            path = await _download_file(job["file_id"])
+            try:
+                extracted = await extract_document(path)
+            finally:
+                os.unlink(path)
+
+            if not await self._set_state(job, JobState.analyzing):
+                raise LeaseLost()
+            analysis = await analyze_text(
+                job["pdf_sha256"], extracted.text, extracted.page_offsets, job["owner_id"]
+            )
+
+            if not await self._set_state(job):
+                raise LeaseLost()
+            try:
+                await save_document(job["filename"], analysis, job["owner_id"], extracted, job["pdf_sha256"],
+                                    document_id=job_id)
+            except DuplicateKeyError:
+                # Otra ejecución del mismo trabajo lo guardó antes
+                pass
+        except LeaseLost:
+            logger.warning("El trabajo %s lo ha reclamado otra ejecución; se abandona.", job_id)
+        except AnalysisUnavailable as e:
+            await self._retry_later(job, e.message)
+        except DocumentProcessingError as e:
+            await self._finish(job, JobState.failed, error=e.message)
+        except Exception as e:
+            await self._finish(job, JobState.failed, error=f"Error al procesar el archivo: {e}")
+        else:
+            await self._finish(job, JobState.done, document_id=str(job_id), error=None)
+
+    async def _retry_later(self, job: dict, error: str) -> None:
+        """Devuelve el trabajo a la cola con una espera creciente, o lo da por fallido si no le quedan intentos."""
+        if job["attempts"] >= JOB_MAX_ATTEMPTS:
+            await self._finish(job, JobState.failed, error=error)
+            return
+
+        delay = JOB_RETRY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1)
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        # Sin token ni concesión, pero con el PDF: lo reclamará quien lo encuentre pasado `retry_at`
+        if not await self._set_state(job, JobState.queued, lease_token=None, lease_until=None,
+                                     retry_at=retry_at, error=error):
+            return
+        logger.warning("El análisis del trabajo %s falló (%s); reintento en %g s.", job["_id"], error, delay)
+        self._delayed[job["_id"]] = asyncio.get_running_loop().call_later(delay, self.submit, job["_id"])
+
+    async def _finish(self, job: dict, state: JobState, **fields) -> None:
+        if not await self._set_state(job, state, lease_token=None, lease_until=None, **fields):
+            # Ya no es nuestro: el PDF lo necesita la ejecución que lo tiene ahora
+            return
+        try:
+            await get_upload_bucket().delete(job["file_id"])
+        except Exception as e:
+            logger.warning("No se pudo borrar el PDF del trabajo %s: %s", job["_id"], e)
+
+
+ingestion_pool = IngestionWorkerPool()
+
+
+async def create_job(upload: SpooledUpload, owner_id: str) -> dict:
+    """Guarda el PDF en GridFS, registra el trabajo en cola y lo envía al pool."""
+    file_id = await _upload_file(upload.path, upload.filename, {"owner_id": owner_id})
+    now = stored_datetime(datetime.now(timezone.utc))
+    job = {
+        "owner_id": owner_id,
+        "filename": upload.filename,
+        "file_id": file_id,
+        "pdf_sha256": upload.sha256,
+        "state": JobState.queued.value,
+        "attempts": 0,
+        "document_id": None,
+        "error": None,
+        "lease_token": None,
+        "lease_until": None,
+        "retry_at": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    result = await job_collection.insert_one(job)
+    job["_id"] = result.inserted_id
+    ingestion_pool.submit(job["_id"])
+    return job
+
+
+async def get_job(job_id: str, owner_id: str) -> dict | None:
+    """Devuelve el trabajo si existe y pertenece al usuario."""
+    return await job_collection.find_one({"_id": ObjectId(job_id), "owner_id": owner_id})
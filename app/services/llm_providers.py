@@ -0,0 +1,530 @@
+# app/services/llm_providers.py
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import Counter, deque
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable
+
+from app.metrics import llm_first_chunk_seconds, llm_prompt_chars, llm_request_seconds, llm_response_chars
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración de la capa de proveedores ---
+LLM_PRIMARY = os.getenv("LLM_PRIMARY", "gemini")
+LLM_SECONDARY = os.getenv("LLM_SECONDARY", "")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+
+# Muestras necesarias antes de fiarse del percentil para disparar la petición cubierta
+MIN_LATENCY_SAMPLES = 20
+
+# Receptor de los fragmentos de una respuesta en streaming
+TextCallback = Callable[[str], None]
+# Ejecuta una llamada a un proveedor; p. ej. esperando antes turno en el planificador
+Gate = Callable[[Callable[[], Awaitable[str]]], Awaitable[str]]
+
+
+class LLMError(Exception):
+    """Error base de la capa de proveedores de IA."""
+
+
+class ProviderTimeout(LLMError):
+    """El proveedor no respondió dentro de su tiempo máximo."""
+
+
+class RateLimitError(LLMError):
+    """El proveedor rechazó la petición por límite de uso o cuota (HTTP 429)."""
+
+
+class CircuitOpenError(LLMError):
+    """El circuito del proveedor está abierto y no se le envían peticiones."""
+
+
+class AllProvidersFailed(LLMError):
+    """Ningún proveedor pudo completar la petición."""
+
+
+class CircuitBreaker:
+    """
+    Circuito por proveedor: tras `failure_threshold` fallos seguidos se abre y
+    rechaza peticiones durante `reset_timeout` segundos; después deja pasar una
+    sola petición de prueba que decide si se cierra o se vuelve a abrir.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def is_available(self) -> bool:
+        """Indica si aceptaría una petición ahora, sin reservar la de prueba."""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probe_in_flight)
+
+    def allow(self) -> bool:
+        """Reserva el paso de una petición. En semiabierto solo pasa una a la vez."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release(self) -> None:
+        """Libera la petición de prueba sin resultado (p. ej. si se canceló)."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probe_in_flight or self._failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+        self._probe_in_flight = False
+
+
+class LatencyTracker:
+    """Ventana deslizante de latencias de las últimas llamadas correctas."""
+
+    def __init__(self, size: int = 200):
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, quantile: float) -> float | None:
+        if len(self._samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class LLMProvider:
+    """
+    Proveedor de IA: recibe un prompt y devuelve el texto generado.
+    Cada llamada tiene un tiempo máximo y pasa por el circuito del proveedor.
+    Las subclases implementan `_generate` y, si el proveedor lo permite, `_stream`.
+    """
+
+    name = "base"
+
+    def __init__(self, model: str, timeout: float = LLM_TIMEOUT_SECONDS):
+        self.model = model
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rate_limited = 0
+        self.prompt_chars = 0
+        self.response_chars = 0
+
+    @property
+    def version(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    async def _generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def _stream(self, prompt: str) -> AsyncIterator[str]:
+        """Respuesta por fragmentos. Sin streaming nativo, un único fragmento con la respuesta completa."""
+        yield await self._generate(prompt)
+
+    async def _collect(self, prompt: str, on_text: TextCallback) -> str:
+        start = time.perf_counter()
+        chunks: list[str] = []
+        async for chunk in self._stream(prompt):
+            if not chunk:
+                continue
+            if not chunks:
+                llm_first_chunk_seconds.observe(time.perf_counter() - start, provider=self.name)
+            chunks.append(chunk)
+            on_text(chunk)
+        return "".join(chunks)
+
+    async def generate(self, prompt: str, on_text: TextCallback | None = None) -> str:
+        """
+        Texto generado para el prompt. Con `on_text`, la respuesta se pide en streaming
+        y cada fragmento se entrega en cuanto llega; el resultado es el mismo texto completo.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuito abierto para {self.name}.")
+
+        self.calls += 1
+        self.prompt_chars += len(prompt)
+        llm_prompt_chars.observe(len(prompt), provider=self.name)
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            call = self._generate(prompt) if on_text is None else self._collect(prompt, on_text)
+            result = await asyncio.wait_for(call, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            self.timeouts += 1
+            self.failures += 1
+            self.breaker.record_failure()
+            raise ProviderTimeout(f"{self.name} no respondió en {self.timeout:g} s.") from None
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            self.breaker.release()
+            raise
+        except RateLimitError:
+            # Un 429 no indica que el proveedor esté caído: lo gestiona el planificador
+            outcome = "rate_limited"
+            self.failures += 1
+            self.rate_limited += 1
+            self.breaker.release()
+            raise
+        except Exception:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise
+        else:
+            outcome = "ok"
+        finally:
+            llm_request_seconds.observe(time.perf_counter() - start, provider=self.name, outcome=outcome)
+
+        self.breaker.record_success()
+        self.latency.record(time.perf_counter() - start)
+        self.response_chars += len(result)
+        llm_response_chars.observe(len(result), provider=self.name)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.name,
+            "model": self.model,
+            "circuit": self.breaker.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rate_limited": self.rate_limited,
+            "p50_seconds": self.latency.percentile(0.5),
+            "p95_seconds": self.latency.percentile(0.95),
+            "prompt_chars": self.prompt_chars,
+            "response_chars": self.response_chars,
+        }
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, timeout: float = LLM_TIMEOUT_SECONDS):
+        from app.services import gemini_service
+        super().__init__(gemini_service.MODEL_NAME, timeout)
+        self._service = gemini_service
+
+    async def _generate(self, prompt: str) -> str:
+        from google.api_core.exceptions import ResourceExhausted
+        try:
+            return await self._service.generate_text(prompt)
+        except ResourceExhausted as e:
+            raise RateLimitError(str(e)) from e
+
+    async def _stream(self, prompt: str) -> AsyncIterator[str]:
+        from google.api_core.exceptions import ResourceExhausted
+        try:
+            async for chunk in self._service.stream_text(prompt):
+                yield chunk
+        except ResourceExhausted as e:
+            raise RateLimitError(str(e)) from e
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, timeout: float = LLM_TIMEOUT_SECONDS):
+        from app.services import openai_service
+        super().__init__(openai_service.MODEL_NAME, timeout)
+        self._service = openai_service
+
+    async def _generate(self, prompt: str) -> str:
+        import openai
+        try:
+            return await self._service.generate_text(prompt)
+        except openai.RateLimitError as e:
+            raise RateLimitError(str(e)) from e
+
+    async def _stream(self, prompt: str) -> AsyncIterator[str]:
+        import openai
+        try:
+            async for chunk in self._service.stream_text(prompt):
+                yield chunk
+        except openai.RateLimitError as e:
+            raise RateLimitError(str(e)) from e
+
+
+class FakeProvider(LLMProvider):
+    """
+    Proveedor local para pruebas y benchmarks. Responde con un JSON de análisis
+    plausible tras una latencia configurable (log-normal si `latency_sigma` > 0)
+    e inyecta errores y límites de uso con las probabilidades indicadas.
+    """
+
+    name = "fake"
+    # En streaming, parte de la latencia que pasa hasta el primer fragmento
+    first_chunk_fraction = 0.2
+    stream_chunk_chars = 16
+
+    def __init__(
+        self,
+        latency: float = 0.3,
+        per_kchar_latency: float = 0.0,
+        latency_sigma: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        seed: int | None = None,
+        name: str = "fake",
+    ):
+        super().__init__("fake-model", timeout)
+        self.name = name
+        self.base_latency = latency
+        self.per_kchar_latency = per_kchar_latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def from_env(cls, timeout: float = LLM_TIMEOUT_SECONDS) -> "FakeProvider":
+        return cls(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0.3")),
+            per_kchar_latency=float(os.getenv("FAKE_LLM_PER_KCHAR_LATENCY", "0")),
+            latency_sigma=float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            rate_limit_rate=float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0")),
+            timeout=timeout,
+        )
+
+    def sample_latency(self, prompt: str) -> float:
+        latency = self.base_latency + self.per_kchar_latency * len(prompt) / 1000
+        if self.latency_sigma > 0:
+            # Log-normal con la misma media: cola larga como la de un proveedor real
+            latency *= self._rng.lognormvariate(-self.latency_sigma ** 2 / 2, self.latency_sigma)
+        return latency
+
+    async def _generate(self, prompt: str) -> str:
+        await asyncio.sleep(self.sample_latency(prompt))
+        return self._respond(prompt)
+
+    async def _stream(self, prompt: str) -> AsyncIterator[str]:
+        latency = self.sample_latency(prompt)
+        await asyncio.sleep(latency * self.first_chunk_fraction)
+        response = self._respond(prompt)
+        chunks = [response[i:i + self.stream_chunk_chars] for i in range(0, len(response), self.stream_chunk_chars)]
+        # El resto de la latencia se reparte entre los fragmentos, como la generación token a token
+        gap = latency * (1 - self.first_chunk_fraction) / max(len(chunks) - 1, 1)
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(gap)
+            yield chunk
+
+    def _respond(self, prompt: str) -> str:
+        roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            raise RateLimitError("429: cuota simulada agotada")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise LLMError("Error simulado del proveedor")
+
+        words = [w.strip(".,;:()[]\"'").lower() for w in prompt.split()]
+        common = [w for w, _ in Counter(w for w in words if len(w) > 5).most_common(5)]
+        return json.dumps({
+            "title": " ".join(common[:3]).title() or "Documento",
+            "summary": f"Resumen simulado de {len(prompt)} caracteres sobre {', '.join(common[:3])}.",
+            "keywords": common,
+        }, ensure_ascii=False)
+
+
+class _TextRelay:
+    """Reenvía los fragmentos de una respuesta en streaming y recuerda si ya salió alguno."""
+
+    def __init__(self, on_text: TextCallback):
+        self.on_text = on_text
+        self.started = False
+
+    def __call__(self, chunk: str) -> None:
+        self.started = True
+        self.on_text(chunk)
+
+
+class ResilientLLM:
+    """
+    Cliente de IA tolerante a fallos sobre una lista ordenada de proveedores:
+    - reintentos con espera exponencial y jitter completo;
+    - fallback al siguiente proveedor si uno falla o tiene el circuito abierto;
+    - cobertura opcional (hedging): si el principal no ha respondido en su p95,
+      se lanza la misma petición al secundario y se usa la primera respuesta.
+    En streaming solo se reintenta o se cambia de proveedor mientras no se haya
+    entregado ningún fragmento, y no hay cobertura.
+    Con `gate`, cada llamada a un proveedor pasa por ella por separado (p. ej. el turno
+    del planificador): las esperas entre reintentos no ocupan hueco.
+    """
+
+    def __init__(
+        self,
+        providers: list[LLMProvider],
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE_SECONDS,
+        backoff_max: float = LLM_BACKOFF_MAX_SECONDS,
+        hedging: bool = LLM_HEDGING,
+        hedge_quantile: float = LLM_HEDGE_QUANTILE,
+        on_rate_limit: Callable[[], None] | None = None,
+    ):
+        if not providers:
+            raise ValueError("Se necesita al menos un proveedor de IA.")
+        self.providers = providers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        # Aviso al planificador de llamadas cada vez que un proveedor devuelve un 429
+        self.on_rate_limit = on_rate_limit
+        self.fallbacks = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def version(self) -> str:
+        return "|".join(provider.version for provider in self.providers)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _with_retries(self, provider: LLMProvider, prompt: str, relay: _TextRelay | None = None,
+                            gate: Gate | None = None) -> str:
+        call = partial(provider.generate, prompt, relay)
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await (gate(call) if gate is not None else call())
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                if isinstance(e, RateLimitError) and self.on_rate_limit is not None:
+                    self.on_rate_limit()
+                # Repetir la llamada duplicaría el texto que el cliente ya ha recibido
+                if attempt == self.max_retries or (relay is not None and relay.started):
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning("Fallo de %s (%s); reintento en %.2f s.", provider.name, e, delay)
+                await asyncio.sleep(delay)
+
+    async def generate(self, prompt: str, on_text: TextCallback | None = None, gate: Gate | None = None) -> str:
+        """
+        Devuelve el texto generado por el primer proveedor que responda correctamente.
+        Con `on_text`, los fragmentos se entregan según los genera el proveedor.
+        `gate` envuelve cada llamada a un proveedor (reintentos y cobertura incluidos).
+        """
+        candidates = [p for p in self.providers if p.breaker.is_available()] or self.providers[:1]
+        relay = _TextRelay(on_text) if on_text is not None else None
+
+        if self.hedging and relay is None and len(candidates) >= 2:
+            primary, secondary, *rest = candidates
+            try:
+                return await self._hedged(primary, secondary, prompt, gate)
+            except Exception as e:
+                errors = [f"{primary.name}/{secondary.name}: {e}"]
+        else:
+            rest, errors = candidates, []
+
+        for index, provider in enumerate(rest):
+            if index or errors:
+                self.fallbacks += 1
+            try:
+                return await self._with_retries(provider, prompt, relay, gate)
+            except Exception as e:
+                if relay is not None and relay.started:
+                    raise
+                errors.append(f"{provider.name}: {e}")
+
+        raise AllProvidersFailed("; ".join(errors))
+
+    async def _hedged(self, primary: LLMProvider, secondary: LLMProvider, prompt: str, gate: Gate | None = None) -> str:
+        primary_task = asyncio.create_task(self._with_retries(primary, prompt, gate=gate))
+        tasks = {primary_task}
+        try:
+            hedge_delay = primary.latency.percentile(self.hedge_quantile)
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if primary_task in done and primary_task.exception() is None:
+                return primary_task.result()
+
+            hedged = primary_task not in done
+            if hedged:
+                self.hedges += 1
+            else:
+                # El principal falló antes de su p95: el secundario actúa como fallback
+                self.fallbacks += 1
+                tasks.discard(primary_task)
+            secondary_task = asyncio.create_task(self._with_retries(secondary, prompt, gate=gate))
+            tasks.add(secondary_task)
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if hedged and task is secondary_task:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "hedging": self.hedging,
+            "fallbacks": self.fallbacks,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "providers": [provider.stats() for provider in self.providers],
+        }
+
+
+_PROVIDERS = {
+    "gemini": GeminiProvider,
+    "openai": OpenAIProvider,
+    "fake": FakeProvider.from_env,
+}
+
+
+def build_llm(on_rate_limit: Callable[[], None] | None = None) -> ResilientLLM:
+    """Construye el cliente de IA a partir de LLM_PRIMARY y LLM_SECONDARY."""
+    names = [name.strip() for name in (LLM_PRIMARY, LLM_SECONDARY) if name.strip()]
+    unknown = [name for name in names if name not in _PROVIDERS]
+    if unknown:
+        raise ValueError(f"Proveedor de IA desconocido: {', '.join(unknown)}")
+    return ResilientLLM(
+        [_PROVIDERS[name](timeout=LLM_TIMEOUT_SECONDS) for name in names],
+        on_rate_limit=on_rate_limit,
+    )
@@ -0,0 +1,218 @@
+# app/services/llm_scheduler.py
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, TypeVar
+
+from app.metrics import record_stage
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+# 0 desactiva el límite de tokens por minuto
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "250000"))
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "500"))
+RATE_LIMIT_COOLDOWN_SECONDS = float(os.getenv("LLM_RATE_LIMIT_COOLDOWN_SECONDS", "2"))
+
+# Aproximación habitual para texto en español/inglés
+CHARS_PER_TOKEN = 4
+
+T = TypeVar("T")
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Estimación de tokens de una llamada: prompt más una respuesta típica."""
+    return len(prompt) // CHARS_PER_TOKEN + LLM_EXPECTED_OUTPUT_TOKENS
+
+
+@dataclass
+class _Waiter:
+    owner: str
+    tokens: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class LLMScheduler:
+    """
+    Planificador de llamadas al modelo:
+    - limita la concurrencia global y los tokens por minuto (cubo de tokens);
+    - reparte los huecos por turnos entre usuarios (`owner_id`), de modo que
+      una subida masiva de un usuario no deja sin servicio al resto;
+    - ante un 429/cuota reduce a la mitad la concurrencia y hace una pausa,
+      y la recupera poco a poco con cada llamada correcta (AIMD).
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        min_concurrency: int = LLM_MIN_CONCURRENCY,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        rate_limit_cooldown: float = RATE_LIMIT_COOLDOWN_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self._clock = clock
+
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self._queues: OrderedDict[str, deque[_Waiter]] = OrderedDict()
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = clock()
+        self._paused_until = 0.0
+        self._wakeup: asyncio.TimerHandle | None = None
+
+        self.completed = 0
+        self.rate_limit_events = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._recent_waits: deque[float] = deque(maxlen=500)
+
+    # --- Cubo de tokens ---
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(
+            self.tokens_per_minute,
+            self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60,
+        )
+        self._refilled_at = now
+
+    def _seconds_until_tokens(self, tokens: int) -> float:
+        """0 si hay tokens suficientes; si no, cuánto falta para que los haya."""
+        if self.tokens_per_minute <= 0:
+            return 0.0
+        self._refill()
+        # Una petición mayor que el cubo entero espera a tenerlo lleno
+        needed = min(tokens, self.tokens_per_minute)
+        if self._tokens >= needed:
+            return 0.0
+        return (needed - self._tokens) * 60 / self.tokens_per_minute
+
+    # --- Reparto de huecos ---
+
+    def _schedule_wakeup(self, delay: float) -> None:
+        if self._wakeup is None:
+            loop = asyncio.get_running_loop()
+            self._wakeup = loop.call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self) -> None:
+        self._wakeup = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        pause = self._paused_until - self._clock()
+        if pause > 0:
+            if self._queues:
+                self._schedule_wakeup(pause)
+            return
+
+        while self._queues and self.in_flight < max(self.min_concurrency, int(self.limit)):
+            owner, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+
+            wait = self._seconds_until_tokens(waiter.tokens)
+            if wait > 0:
+                self._schedule_wakeup(wait)
+                return
+
+            queue.popleft()
+            # El usuario atendido pasa al final de la ronda
+            del self._queues[owner]
+            if queue:
+                self._queues[owner] = queue
+
+            if self.tokens_per_minute > 0:
+                self._tokens -= min(waiter.tokens, self.tokens_per_minute)
+            self.in_flight += 1
+            waiter.future.set_result(None)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.owner)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.owner]
+
+    async def run(self, owner_id: str | None, tokens: int, call: Callable[[], Awaitable[T]]) -> T:
+        """Espera turno para el usuario y ejecuta la llamada al modelo."""
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(owner=owner_id or "", tokens=tokens, future=loop.create_future())
+        self._queues.setdefault(waiter.owner, deque()).append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Ya tenía hueco asignado: se devuelve
+                self.in_flight -= 1
+                self._dispatch()
+            else:
+                self._remove(waiter)
+            raise
+
+        waited = self._clock() - waiter.enqueued_at
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self._recent_waits.append(waited)
+        record_stage("llm_queue", waited)
+
+        try:
+            result = await call()
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._dispatch()
+        self.record_success()
+        return result
+
+    # --- Adaptación a los límites del proveedor ---
+
+    def record_success(self) -> None:
+        if self.limit < self.max_concurrency:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def record_rate_limit(self) -> None:
+        """El proveedor devolvió un 429/cuota: se reduce la concurrencia y se pausa el reparto."""
+        self.rate_limit_events += 1
+        now = self._clock()
+        if now < self._paused_until:
+            # Los 429 de las llamadas que ya estaban en vuelo cuentan como el mismo aviso
+            return
+
+        self.limit = max(self.min_concurrency, self.limit / 2)
+        self._paused_until = now + self.rate_limit_cooldown
+        logger.warning(
+            "Límite del proveedor alcanzado: concurrencia %.1f, pausa de %.1f s.", self.limit, self.rate_limit_cooldown
+        )
+
+    def stats(self) -> dict:
+        waits = sorted(self._recent_waits)
+        if self.tokens_per_minute > 0:
+            self._refill()
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": sum(len(queue) for queue in self._queues.values()),
+            "queued_owners": len(self._queues),
+            "tokens_available": int(self._tokens) if self.tokens_per_minute > 0 else None,
+            "tokens_per_minute": self.tokens_per_minute,
+            "rate_limit_events": self.rate_limit_events,
+            "completed": self.completed,
+            "wait_seconds_total": round(self.total_wait_seconds, 3),
+            "wait_seconds_max": round(self.max_wait_seconds, 3),
+            "wait_seconds_p95": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+        }
+
+
+llm_scheduler = LLMScheduler()
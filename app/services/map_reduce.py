@@ -0,0 +1,242 @@
+# app/services/map_reduce.py
+
+import os
+import re
+import zlib
+import asyncio
+import hashlib
+import logging
+from collections import Counter
+from typing import Awaitable, Callable
+
+from starlette.concurrency import run_in_threadpool
+
+from app.services.analysis_cache import AnalysisCache, normalize_text
+from app.services.condensation import condense
+from app.services.llm_providers import LLMError
+from app.services.prompts import parse_analysis
+
+logger = logging.getLogger(__name__)
+
+CHUNK_CHARS = int(os.getenv("ANALYSIS_CHUNK_CHARS", "8000"))
+MAP_CONCURRENCY = int(os.getenv("ANALYSIS_MAP_CONCURRENCY", "4"))
+
+# Recibe un prompt y devuelve el texto generado por el modelo
+GenerateFn = Callable[[str], Awaitable[str]]
+
+CHUNK_PROMPT_TEMPLATE = """
+    Analiza el siguiente fragmento de un documento más largo y devuelve EXCLUSIVAMENTE un objeto JSON válido con la siguiente estructura:
+    - "title": Un título breve para este fragmento.
+    - "summary": Un resumen de 2 o 3 frases con las ideas principales del fragmento.
+    - "keywords": una lista de 3 a 5 palabras clave del fragmento.
+
+    La respuesta debe ser solo el JSON.
+
+    Fragmento del documento:
+    ---
+    {text}
+    ---
+    """
+
+REDUCE_PROMPT_TEMPLATE = """
+    A continuación tienes, en orden, los resúmenes parciales de las distintas partes de un mismo documento.
+    Combínalos y devuelve EXCLUSIVAMENTE un objeto JSON válido con la siguiente estructura:
+    - "title": Un título adecuado y conciso para el documento completo.
+    - "summary": Un resumen ejecutivo de 3 o 4 frases clave del documento completo.
+    - "keywords": una lista de 5 a 7 palabras clave importantes del documento completo.
+
+    La respuesta debe ser solo el JSON.
+
+    Resúmenes parciales:
+    ---
+    {partials}
+    ---
+    """
+
+# Versión del prompt de fragmentos; junto con la del modelo versiona la caché de fragmentos
+CHUNK_VERSION = hashlib.sha256(CHUNK_PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:16]
+
+MAP_REDUCE_VERSION = hashlib.sha256(
+    f"{CHUNK_CHARS}|{CHUNK_PROMPT_TEMPLATE}|{REDUCE_PROMPT_TEMPLATE}".encode("utf-8")
+).hexdigest()[:16]
+
+_SEPARATORS = [re.compile(r"(?<=\n\n)"), re.compile(r"(?<=\n)"), re.compile(r"(?<=[.!?] )")]
+
+
+def _split_long(text: str, max_chars: int, level: int = 0) -> list[str]:
+    """Divide un bloque demasiado largo por párrafos, luego líneas, luego frases y, si no, a ciegas."""
+    if len(text) <= max_chars:
+        return [text]
+    if level == len(_SEPARATORS):
+        return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+    pieces = []
+    for part in _SEPARATORS[level].split(text):
+        if part:
+            pieces.extend(_split_long(part, max_chars, level + 1))
+    return pieces
+
+
+def _is_boundary(unit: str) -> bool:
+    # Frontera definida por el contenido: tras editar una página, los fragmentos
+    # posteriores vuelven a coincidir y siguen saliendo de la caché.
+    return zlib.crc32(unit.encode("utf-8")) % 4 == 0
+
+
+def split_into_chunks(text: str, page_offsets: list[int] | None = None, max_chars: int = CHUNK_CHARS) -> list[str]:
+    """
+    Divide el texto en fragmentos de hasta `max_chars` caracteres respetando, en lo posible,
+    los límites de página y de párrafo. Concatenar los fragmentos devuelve el texto original.
+    """
+    offsets = page_offsets or [0]
+    bounds = [*offsets, len(text)]
+    pages = [text[bounds[i]:bounds[i + 1]] for i in range(len(offsets))]
+
+    chunks, current, size = [], [], 0
+    min_chars = max_chars // 2
+    for page in pages:
+        for unit in _split_long(page, max_chars):
+            if current and size + len(unit) > max_chars:
+                chunks.append("".join(current))
+                current, size = [], 0
+            current.append(unit)
+            size += len(unit)
+            if size >= min_chars and _is_boundary(unit):
+                chunks.append("".join(current))
+                current, size = [], 0
+    if current:
+        chunks.append("".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def _format_partials(partials: list[dict]) -> str:
+    return "\n\n".join(
+        f"[Parte {i}] Título: {p.get('title', '')}\n"
+        f"Resumen: {p.get('summary', '')}\n"
+        f"Palabras clave: {', '.join(p.get('keywords', []))}"
+        for i, p in enumerate(partials, start=1)
+    )
+
+
+def _merge_locally(partials: list[dict]) -> dict:
+    """Combinación sin LLM, usada si falla el paso de reducción."""
+    keywords = Counter(k.strip() for p in partials for k in p.get("keywords", []) if k.strip())
+    return {
+        "title": partials[0].get("title", ""),
+        "summary": " ".join(p.get("summary", "") for p in partials[:4]).strip(),
+        "keywords": [k for k, _ in keywords.most_common(7)],
+    }
+
+
+def _is_valid(result) -> bool:
+    return isinstance(result, dict) and isinstance(result.get("summary"), str)
+
+
+class MapReduceAnalyzer:
+    """
+    Análisis de documentos largos en dos fases:
+    - map: cada fragmento se analiza por separado, en paralelo y con un semáforo;
+    - reduce: los resúmenes parciales se combinan en el análisis final.
+    Los análisis parciales se guardan en caché por contenido del fragmento.
+    Con `condense_chars`, cada fragmento se condensa a ese tamaño antes de su prompt;
+    la clave de caché sigue siendo el fragmento original.
+    """
+
+    def __init__(
+        self,
+        generate: GenerateFn,
+        cache: AnalysisCache | None = None,
+        chunk_chars: int = CHUNK_CHARS,
+        concurrency: int = MAP_CONCURRENCY,
+        model_version: str = "",
+        condense_chars: int | None = None,
+    ):
+        self.generate = generate
+        self.cache = cache
+        self.chunk_chars = chunk_chars
+        self.concurrency = concurrency
+        self.condense_chars = condense_chars
+        version = f"{model_version}|{CHUNK_VERSION}"
+        if condense_chars is not None:
+            version += f"|condense:{condense_chars}"
+        self.chunk_version = hashlib.sha256(version.encode("utf-8")).hexdigest()[:16]
+
+    async def _ask(self, prompt: str, generate: GenerateFn) -> dict | None:
+        try:
+            result = parse_analysis(await generate(prompt))
+        except LLMError:
+            raise
+        except Exception as e:
+            logger.warning("Falló la llamada al modelo durante el map-reduce: %s", e)
+            return None
+        return result if _is_valid(result) else None
+
+    async def _map_chunk(self, chunk: str, semaphore: asyncio.Semaphore, generate: GenerateFn) -> dict | None:
+        key = hashlib.sha256(f"chunk:{normalize_text(chunk)}".encode("utf-8")).hexdigest()
+        if self.cache is not None:
+            cached = await self.cache.get(key, self.chunk_version)
+            if cached is not None:
+                return cached
+
+        if self.condense_chars is not None:
+            # El ranking es CPU: se hace en un hilo
+            chunk = await run_in_threadpool(condense, chunk, self.condense_chars)
+        async with semaphore:
+            result = await self._ask(CHUNK_PROMPT_TEMPLATE.format(text=chunk), generate)
+
+        if result is not None and self.cache is not None:
+            await self.cache.set(key, self.chunk_version, result)
+        return result
+
+    async def _reduce(self, partials: list[dict], semaphore: asyncio.Semaphore, generate: GenerateFn) -> dict:
+        # Si los parciales no caben en un prompt, se reducen por grupos y se repite
+        while len(partials) > 1 and len(_format_partials(partials)) > self.chunk_chars:
+            groups, group = [], []
+            for partial in partials:
+                if group and len(_format_partials(group + [partial])) > self.chunk_chars:
+                    groups.append(group)
+                    group = []
+                group.append(partial)
+            groups.append(group)
+            if len(groups) == len(partials):
+                break
+            partials = await asyncio.gather(*(self._reduce_group(g, semaphore, generate) for g in groups))
+
+        return await self._reduce_group(partials, semaphore, generate)
+
+    async def _reduce_group(self, partials: list[dict], semaphore: asyncio.Semaphore, generate: GenerateFn) -> dict:
+        try:
+            async with semaphore:
+                result = await self._ask(REDUCE_PROMPT_TEMPLATE.format(partials=_format_partials(partials)), generate)
+        except LLMError as e:
+            logger.warning("Falló la reducción del map-reduce; se combina en local: %s", e)
+            result = None
+        return result if result is not None else _merge_locally(partials)
+
+    async def analyze(
+        self, text: str, page_offsets: list[int] | None = None, generate: GenerateFn | None = None
+    ) -> dict | None:
+        """
+        Analiza el documento completo. Devuelve None si no se pudo analizar ningún fragmento,
+        o lanza el LLMError si ninguno se analizó porque el modelo no respondía.
+        `generate` sustituye para esta llamada a la función de generación del analizador.
+        """
+        generate = generate or self.generate
+        semaphore = asyncio.Semaphore(self.concurrency)
+        chunks = split_into_chunks(text, page_offsets, self.chunk_chars)
+        results = await asyncio.gather(
+            *(self._map_chunk(chunk, semaphore, generate) for chunk in chunks), return_exceptions=True
+        )
+
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for error in errors:
+            if not isinstance(error, LLMError):
+                raise error
+        partials = [result for result in results if result is not None and not isinstance(result, BaseException)]
+        if not partials:
+            if errors:
+                raise errors[0]
+            return None
+        if len(partials) < len(chunks):
+            logger.warning("Se analizaron %d de %d fragmentos.", len(partials), len(chunks))
+        return await self._reduce(partials, semaphore, generate)
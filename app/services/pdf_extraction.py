@@ -0,0 +1,190 @@
+# app/services/pdf_extraction.py
+
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Callable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import fitz
+
+# Este módulo se importa también en los procesos del pool: no debe depender
+# de la base de datos ni de los servicios de IA. PyMuPDF solo se importa en
+# esos procesos, al abrir el primer PDF: el servidor no lo necesita para arrancar.
+
+EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
+MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "2000"))
+EXTRACTION_TIMEOUT_SECONDS = float(os.getenv("PDF_EXTRACTION_TIMEOUT_SECONDS", "60"))
+
+# Un PDF puede llegar como bytes o como ruta a un fichero en disco
+PdfSource = bytes | str
+
+# Aviso de progreso: (páginas extraídas, páginas totales)
+ProgressCallback = Callable[[int, int], None]
+
+
+class PdfExtractionError(Exception):
+    """Error base de la extracción de texto."""
+
+
+class InvalidPdfError(PdfExtractionError):
+    """El fichero no se puede abrir como PDF."""
+
+
+class PageLimitExceeded(PdfExtractionError):
+    """El documento supera el número máximo de páginas permitido."""
+
+
+class ExtractionTimeout(PdfExtractionError):
+    """La extracción superó el tiempo máximo por documento."""
+
+
+@dataclass
+class ExtractedDocument:
+    """Texto extraído de un PDF, página a página y en orden."""
+    pages: list[str]
+
+    @property
+    def text(self) -> str:
+        return "".join(self.pages)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    @property
+    def char_count(self) -> int:
+        return sum(len(page) for page in self.pages)
+
+    @property
+    def page_offsets(self) -> list[int]:
+        """Posición en `text` donde empieza cada página."""
+        return [0, *accumulate(len(page) for page in self.pages[:-1])] if self.pages else []
+
+
+def _open(source: PdfSource) -> "fitz.Document":
+    import fitz  # PyMuPDF
+
+    try:
+        if isinstance(source, str):
+            return fitz.open(source, filetype="pdf")
+        return fitz.open(stream=source, filetype="pdf")
+    except Exception:
+        raise InvalidPdfError("el archivo no es un PDF válido") from None
+
+
+def _extract_pages(doc: "fitz.Document", start: int, stop: int, deadline: float) -> list[str]:
+    pages = []
+    for number in range(start, stop):
+        if time.time() > deadline:
+            raise ExtractionTimeout(f"Se superó el tiempo máximo en la página {number + 1}.")
+        pages.append(doc[number].get_text())
+    return pages
+
+
+def _extract_head(source: PdfSource, pages_per_task: int, max_pages: int, deadline: float) -> tuple[int, list[str]]:
+    """Tarea del pool: valida el documento y extrae el primer rango de páginas."""
+    with _open(source) as doc:
+        page_count = doc.page_count
+        if page_count > max_pages:
+            raise PageLimitExceeded(f"El PDF tiene {page_count} páginas (máximo {max_pages}).")
+        return page_count, _extract_pages(doc, 0, min(page_count, pages_per_task), deadline)
+
+
+def _extract_range(source: PdfSource, start: int, stop: int, deadline: float) -> list[str]:
+    """Tarea del pool: extrae el texto de las páginas [start, stop)."""
+    with _open(source) as doc:
+        return _extract_pages(doc, start, stop, deadline)
+
+
+class PdfExtractor:
+    """
+    Extrae el texto de los PDF en un pool de procesos para no bloquear el event loop.
+    Los documentos grandes se dividen en rangos de páginas que se extraen en paralelo
+    y se vuelven a unir en orden. Cada documento tiene un presupuesto de páginas y de tiempo.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = EXTRACTION_WORKERS,
+        pages_per_task: int = PAGES_PER_TASK,
+        max_pages: int = MAX_PAGES,
+        timeout: float = EXTRACTION_TIMEOUT_SECONDS,
+    ):
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self._executor: ProcessPoolExecutor | None = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Se crea bajo demanda; 'spawn' evita heredar hilos y sockets del proceso del servidor
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def extract(self, source: PdfSource, on_progress: ProgressCallback | None = None) -> ExtractedDocument:
+        """
+        Extrae el texto de todas las páginas del PDF respetando los límites configurados.
+        `on_progress` se llama cada vez que termina un rango de páginas.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        deadline = time.time() + self.timeout
+
+        futures = [loop.run_in_executor(
+            executor, _extract_head, source, self.pages_per_task, self.max_pages, deadline
+        )]
+        try:
+            page_count, pages = await asyncio.wait_for(futures[0], timeout=self.timeout)
+            done = len(pages)
+            if on_progress is not None:
+                on_progress(done, page_count)
+
+            def advance(future: asyncio.Future) -> None:
+                nonlocal done
+                if not future.cancelled() and future.exception() is None:
+                    done += len(future.result())
+                    on_progress(done, page_count)
+
+            futures = [
+                loop.run_in_executor(
+                    executor, _extract_range, source, start,
+                    min(start + self.pages_per_task, page_count), deadline,
+                )
+                for start in range(self.pages_per_task, page_count, self.pages_per_task)
+            ]
+            if on_progress is not None:
+                for future in futures:
+                    future.add_done_callback(advance)
+            remaining = max(deadline - time.time(), 0)
+            for chunk in await asyncio.wait_for(asyncio.gather(*futures), timeout=remaining):
+                pages.extend(chunk)
+        except asyncio.TimeoutError:
+            raise ExtractionTimeout(f"La extracción superó {self.timeout:g} segundos.") from None
+        except BrokenProcessPool:
+            # Un proceso murió (p. ej. un PDF corrupto que tumba MuPDF): se recrea el pool
+            self.shutdown()
+            raise PdfExtractionError("El proceso de extracción terminó inesperadamente.") from None
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return ExtractedDocument(pages=pages)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pdf_extractor = PdfExtractor()
@@ -0,0 +1,200 @@
+# app/services/pipeline.py
+
+import asyncio
+import logging
+from typing import AsyncIterator
+
+from bson import ObjectId
+from fastapi import status
+
+from app.models.document import DocumentModel
+from app.repositories import document_repository
+from app.uploads import SpooledUpload
+from app.metrics import stage, timed_stage
+from app.services.analysis import analyze_document_text, ANALYSIS_VERSION
+from app.services.llm_providers import LLMError, TextCallback
+from app.services.prompts import partial_summary
+from app.services.analysis_cache import analysis_cache, make_cache_key
+from app.services.search import search_index
+from app.services.text_store import text_store
+from app.services import user_stats
+from app.services.pdf_extraction import (
+    pdf_extractor,
+    ExtractedDocument,
+    PageLimitExceeded,
+    ProgressCallback,
+    PdfSource,
+    PdfExtractionError,
+    InvalidPdfError,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentProcessingError(Exception):
+    """Error del pipeline de ingesta con el código HTTP que le corresponde."""
+
+    def __init__(self, message: str, status_code: int = status.HTTP_500_INTERNAL_SERVER_ERROR):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class AnalysisUnavailable(DocumentProcessingError):
+    """El modelo de IA no respondió (caído, saturado, circuito abierto): el fallo es transitorio."""
+
+    def __init__(self, message: str = "El servicio de IA no está disponible; inténtalo más tarde."):
+        super().__init__(message, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@timed_stage("extraction")
+async def extract_document(source: PdfSource, on_progress: ProgressCallback | None = None) -> ExtractedDocument:
+    """Extrae el texto de todas las páginas del PDF fuera del event loop."""
+    try:
+        extracted = await pdf_extractor.extract(source, on_progress)
+    except InvalidPdfError as e:
+        raise DocumentProcessingError(f"No se pudo leer el PDF: {e}", status.HTTP_400_BAD_REQUEST)
+    except PageLimitExceeded as e:
+        raise DocumentProcessingError(str(e), status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    except PdfExtractionError as e:
+        raise DocumentProcessingError(str(e), status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    if not extracted.text.strip():
+        raise DocumentProcessingError("El PDF no contiene texto.", status.HTTP_400_BAD_REQUEST)
+    return extracted
+
+
+async def analyze_text(
+    pdf_sha256: str,
+    extracted_text: str,
+    page_offsets: list[int] | None = None,
+    owner_id: str | None = None,
+    on_text: TextCallback | None = None,
+    refresh: bool = False,
+) -> dict:
+    """
+    Analiza el texto con IA, reutilizando la caché de análisis.
+    Un PDF ya analizado con la misma versión de prompt/modelo no vuelve a llamar al modelo.
+    Con `refresh` se ignora lo que haya en caché y se sustituye por el análisis nuevo.
+    Lanza AnalysisUnavailable si el modelo no respondió, para poder reintentar más tarde.
+    """
+    cache_key = make_cache_key(pdf_sha256, extracted_text)
+    analysis_result = None
+    if not refresh:
+        with stage("cache"):
+            analysis_result = await analysis_cache.get(cache_key, ANALYSIS_VERSION)
+    if analysis_result is None:
+        try:
+            analysis_result = await analyze_document_text(extracted_text, page_offsets, owner_id, on_text)
+        except LLMError as e:
+            raise AnalysisUnavailable() from e
+        if not analysis_result:
+            raise DocumentProcessingError("El análisis de IA falló.")
+        await analysis_cache.set(cache_key, ANALYSIS_VERSION, analysis_result)
+    return analysis_result
+
+
+async def index_for_search(document: dict, text: str) -> None:
+    """Añade el documento al índice de búsqueda. Un fallo aquí no invalida el documento guardado."""
+    try:
+        with stage("index"):
+            await search_index.index_document(document, text)
+    except Exception as e:
+        logger.warning("No se pudo indexar el documento %s para búsqueda: %s", document["_id"], e)
+
+
+async def store_text(document: dict, extracted: ExtractedDocument, pdf_sha256: str) -> None:
+    """Guarda el texto extraído para poder reanalizar sin el PDF. Un fallo aquí no invalida el documento."""
+    try:
+        await text_store.save(document["_id"], document["owner_id"], extracted.text, extracted.page_offsets, pdf_sha256)
+    except Exception as e:
+        logger.warning("No se pudo guardar el texto del documento %s: %s", document["_id"], e)
+
+
+async def finish_document(document: dict, extracted: ExtractedDocument, pdf_sha256: str) -> None:
+    """Tras guardar un documento: índice de búsqueda, texto para reanálisis y estadísticas del usuario, a la vez."""
+    await asyncio.gather(
+        index_for_search(document, extracted.text),
+        store_text(document, extracted, pdf_sha256),
+        user_stats.record_added(document),
+    )
+
+
+async def save_document(filename: str, analysis: dict, owner_id: str, extracted: ExtractedDocument,
+                        pdf_sha256: str, document_id: ObjectId | None = None) -> dict:
+    """
+    Guarda el documento analizado, lo indexa para búsqueda, guarda su texto y devuelve el registro creado.
+    Con `document_id`, el documento se crea con ese `_id`: si ya existe, lanza DuplicateKeyError
+    (así un trabajo que se reintenta no crea dos documentos).
+    """
+    document_data = DocumentModel(
+        filename=filename,
+        analysis=analysis,
+        owner_id=owner_id,
+        analysis_version=ANALYSIS_VERSION,
+        page_count=extracted.page_count,
+        char_count=extracted.char_count,
+    )
+    document = document_data.model_dump()
+    if document_id is not None:
+        document = {"_id": document_id, **document}
+    document = await document_repository.create(document)
+    await finish_document(document, extracted, pdf_sha256)
+    return document
+
+
+async def process_pdf(upload: SpooledUpload, owner_id: str) -> dict:
+    """Pipeline completo: extracción, análisis y guardado."""
+    extracted = await extract_document(upload.path)
+    analysis = await analyze_text(upload.sha256, extracted.text, extracted.page_offsets, owner_id)
+    return await save_document(upload.filename, analysis, owner_id, extracted, upload.sha256)
+
+
+async def stream_pdf(upload: SpooledUpload, owner_id: str) -> AsyncIterator[tuple[str, dict]]:
+    """
+    Pipeline completo emitiendo eventos (nombre, datos) según avanza:
+    - ("progress", {"stage": "extracting", "page": n, "pages": total}) por cada rango de páginas extraído;
+    - ("progress", {"stage": "analyzing"}) y ("progress", {"stage": "saving"});
+    - ("summary", {"text": ...}) con cada trozo nuevo del resumen según lo escribe el modelo;
+    - ("document", documento) al final, con el mismo resultado que `process_pdf`.
+    Los errores (DocumentProcessingError) se lanzan tras los eventos ya emitidos.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    response = ""
+    summary = ""
+
+    def on_pages(done: int, total: int) -> None:
+        events.put_nowait(("progress", {"stage": "extracting", "page": done, "pages": total}))
+
+    def emit_summary(text: str) -> None:
+        nonlocal summary
+        if len(text) > len(summary) and text.startswith(summary):
+            events.put_nowait(("summary", {"text": text[len(summary):]}))
+            summary = text
+
+    def on_text(chunk: str) -> None:
+        nonlocal response
+        response += chunk
+        emit_summary(partial_summary(response))
+
+    async def run() -> dict:
+        try:
+            extracted = await extract_document(upload.path, on_pages)
+            events.put_nowait(("progress", {"stage": "analyzing"}))
+            analysis = await analyze_text(upload.sha256, extracted.text, extracted.page_offsets, owner_id, on_text)
+            # Desde la caché o en map-reduce no hay streaming: el resumen sale entero
+            emit_summary(analysis.get("summary") or "")
+            events.put_nowait(("progress", {"stage": "saving"}))
+            return await save_document(upload.filename, analysis, owner_id, extracted, upload.sha256)
+        finally:
+            events.put_nowait(None)
+
+    yield "progress", {"stage": "extracting"}
+    task = asyncio.create_task(run())
+    try:
+        while (event := await events.get()) is not None:
+            yield event
+        yield "document", await task
+    finally:
+        # El cliente se desconectó: se abandona el procesamiento
+        task.cancel()
@@ -0,0 +1,72 @@
+# app/services/prompts.py
+
+import re
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_PROMPT_CHARS = 8000
+
+# Plantilla del prompt de análisis. Cualquier cambio aquí cambia PROMPT_VERSION
+# e invalida los análisis guardados en caché.
+PROMPT_TEMPLATE = """
+    Analiza el siguiente texto y devuelve EXCLUSIVAMENTE un objeto JSON válido con la siguiente estructura:
+    - "title": Un título adecuado y conciso para el documento.
+    - "summary": Un resumen ejecutivo de 3 o 4 frases clave.
+    - "keywords": una lista de 5 a 7 palabras clave importantes.
+
+    NO incluyas "
+json" ni "
+" en la respuesta. La respuesta debe ser solo el JSON.
+
+    Texto del documento:
+    ---
+    {text}
+    ---
+    """
+
+PROMPT_VERSION = hashlib.sha256(f"{MAX_PROMPT_CHARS}|{PROMPT_TEMPLATE}".encode("utf-8")).hexdigest()[:16]
+
+# Comienzo del campo "summary" en una respuesta del modelo que aún se está generando
+_SUMMARY_START = re.compile(r'"summary"\s*:\s*"')
+_JSON_STRING_BODY = re.compile(r'(?:[^"\\]|\\.)*')
+
+
+def build_analysis_prompt(text: str) -> str:
+    """Prompt de análisis de un documento completo, recortado al máximo permitido."""
+    return PROMPT_TEMPLATE.format(text=text[:MAX_PROMPT_CHARS])
+
+
+def partial_summary(result_text: str) -> str:
+    """
+    Resumen que lleva escrito una respuesta del modelo todavía incompleta
+    (cadena vacía si aún no ha empezado). Sirve para mostrarlo mientras se genera.
+    """
+    start = _SUMMARY_START.search(result_text)
+    if not start:
+        return ""
+    body = _JSON_STRING_BODY.match(result_text, start.end()).group(0)
+    # Un escape cortado entre dos fragmentos (p. ej. "\u00") se completa con el siguiente
+    while body:
+        try:
+            return json.loads(f'"{body}"', strict=False)
+        except json.JSONDecodeError:
+            body = body[:-1]
+    return ""
+
+
+def parse_analysis(result_text: str) -> dict | None:
+    """Extrae el objeto JSON de la respuesta del modelo. Devuelve None si no hay JSON válido."""
+    # Extraer el bloque JSON de la respuesta para mayor robustez
+    json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
+    if not json_match:
+        logger.warning("No se encontró JSON en la respuesta del modelo. Respuesta: %s", result_text)
+        return None
+
+    try:
+        return json.loads(json_match.group(0))
+    except json.JSONDecodeError as e:
+        logger.warning("JSON inválido en la respuesta del modelo: %s", e)
+        return None
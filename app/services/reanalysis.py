@@ -0,0 +1,314 @@
+# app/services/reanalysis.py
+
+import os
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from fastapi import status
+from pymongo import ReturnDocument
+
+from app.database import document_collection, reanalysis_job_collection, stored_datetime
+from app.models.job import ReanalysisJobState
+from app.repositories import document_repository
+from app.services.analysis import ANALYSIS_VERSION
+from app.services.pipeline import DocumentProcessingError, analyze_text
+from app.services.search import search_index
+from app.services.text_store import text_store
+from app.services import user_stats
+
+logger = logging.getLogger(__name__)
+
+# Ritmo máximo de un trabajo de reanálisis (documentos que llaman al modelo por minuto; 0 = sin límite)
+REANALYSIS_DOCS_PER_MINUTE = float(os.getenv("REANALYSIS_DOCS_PER_MINUTE", "30"))
+REANALYSIS_JOB_LEASE_SECONDS = int(os.getenv("REANALYSIS_JOB_LEASE_SECONDS", "300"))
+REANALYSIS_PAGE_SIZE = int(os.getenv("REANALYSIS_PAGE_SIZE", "100"))
+# Cada cuánto se buscan trabajos reclamables que no estén en este proceso (p. ej. de uno caído)
+REANALYSIS_SWEEP_INTERVAL_SECONDS = float(os.getenv("REANALYSIS_SWEEP_INTERVAL_SECONDS", "60"))
+
+# Turno propio en el planificador de IA: un reanálisis masivo ocupa como mucho lo que un usuario más
+REANALYSIS_SCHEDULER_OWNER = "reanalysis"
+
+UNFINISHED_STATES = [ReanalysisJobState.queued.value, ReanalysisJobState.running.value]
+
+
+class MissingDocumentText(Exception):
+    """El documento no tiene guardado su texto extraído (se subió antes de guardarlo)."""
+
+
+def stale_filter(owner_id: str | None = None, after: ObjectId | None = None) -> dict:
+    """Documentos cuyo análisis no es de la versión actual de prompt/modelo (o no la tiene)."""
+    query: dict = {"analysis_version": {"$ne": ANALYSIS_VERSION}}
+    if owner_id is not None:
+        query["owner_id"] = owner_id
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    return query
+
+
+async def ensure_reanalysis_indexes() -> None:
+    # Recorrido de los documentos desactualizados de un usuario (o de todos) por orden de _id
+    await document_collection.create_index([("owner_id", 1), ("analysis_version", 1), ("_id", 1)])
+    await document_collection.create_index([("analysis_version", 1), ("_id", 1)])
+    await reanalysis_job_collection.create_index([("owner_id", 1), ("state", 1)])
+    await text_store.ensure_indexes()
+
+
+async def reanalyze_document(document: dict, scheduler_owner: str | None = None, refresh: bool = False) -> dict:
+    """
+    Vuelve a analizar un documento con su texto guardado, sin el PDF, y guarda el análisis
+    con la versión actual. Devuelve el documento actualizado. `refresh` ignora la caché
+    de análisis (para corregir un resumen malo con la misma versión).
+    """
+    stored = await text_store.load(document["_id"], document["owner_id"])
+    if stored is None:
+        raise MissingDocumentText(str(document["_id"]))
+
+    analysis = await analyze_text(
+        stored.pdf_sha256 or "", stored.text, stored.page_offsets,
+        scheduler_owner or document["owner_id"], refresh=refresh,
+    )
+    changed = await document_repository.set_analysis(document["_id"], document["owner_id"], analysis, ANALYSIS_VERSION)
+    if changed is None:
+        raise DocumentProcessingError("Documento no encontrado.", status.HTTP_404_NOT_FOUND)
+    before, updated = changed
+    await asyncio.gather(search_index.update_document(updated), user_stats.record_changed(before, updated))
+    return updated
+
+
+def _claimable_filter(now: datetime) -> dict:
+    """Trabajos en cola, o en curso cuyo proceso dueño dejó expirar la concesión."""
+    return {
+        "$or": [
+            {"state": ReanalysisJobState.queued.value},
+            {"state": ReanalysisJobState.running.value, "lease_until": {"$lt": now}},
+        ]
+    }
+
+
+class ReanalysisRunner:
+    """
+    Ejecuta en segundo plano los trabajos de reanálisis, de uno en uno.
+    Cada trabajo recorre por orden de `_id` los documentos con el análisis desactualizado,
+    a un ritmo máximo de `docs_per_minute`, y tras cada documento guarda hasta dónde
+    ha llegado. Al parar, el trabajo en curso vuelve a la cola y lo retoma el siguiente
+    arranque; el de un proceso caído, cuando expira su concesión, en el siguiente barrido.
+    La concesión lleva un token para que nunca lo ejecuten dos procesos a la vez.
+    """
+
+    def __init__(self, docs_per_minute: float = REANALYSIS_DOCS_PER_MINUTE,
+                 lease_seconds: int = REANALYSIS_JOB_LEASE_SECONDS,
+                 sweep_interval: float = REANALYSIS_SWEEP_INTERVAL_SECONDS):
+        self.docs_per_minute = docs_per_minute
+        self.lease_seconds = lease_seconds
+        self.sweep_interval = sweep_interval
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: asyncio.Task | None = None
+        self._sweeper: asyncio.Task | None = None
+        # Trabajos en la cola local (para no encolarlos dos veces) y el que se está ejecutando
+        self._pending: set[ObjectId] = set()
+        self._current: dict | None = None
+
+    async def start(self) -> None:
+        """Arranca el worker y el barrido, y reencola los trabajos pendientes de ejecuciones anteriores."""
+        self._worker = asyncio.create_task(self._work())
+        await self.resume_pending()
+        if self.sweep_interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self) -> None:
+        """Detiene el worker y devuelve a la cola el trabajo en curso (conserva su avance)."""
+        current = self._current
+        tasks = [task for task in (self._worker, self._sweeper) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker = self._sweeper = None
+        self._pending.clear()
+        if current is not None:
+            try:
+                await reanalysis_job_collection.update_one(
+                    {"_id": current["_id"], "state": ReanalysisJobState.running.value,
+                     "lease_token": current["lease_token"]},
+                    {"$set": {"state": ReanalysisJobState.queued.value, "lease_token": None, "lease_until": None,
+                              "updated_at": datetime.now(timezone.utc)}},
+                )
+            except Exception as e:
+                logger.warning("No se pudo devolver a la cola el trabajo de reanálisis %s: %s", current["_id"], e)
+
+    def submit(self, job_id: ObjectId) -> None:
+        if job_id in self._pending or (self._current is not None and self._current["_id"] == job_id):
+            return
+        self._pending.add(job_id)
+        self._queue.put_nowait(job_id)
+
+    async def resume_pending(self) -> int:
+        """Encola los trabajos reclamables que no estén ya en este proceso. Devuelve cuántos encoló."""
+        resumed = 0
+        cursor = reanalysis_job_collection.find(_claimable_filter(datetime.now(timezone.utc)), {"_id": 1})
+        async for job in cursor.sort("created_at", 1):
+            if job["_id"] not in self._pending:
+                self.submit(job["_id"])
+                resumed += 1
+        if resumed:
+            logger.info("Reanudando %d trabajos de reanálisis pendientes.", resumed)
+        return resumed
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.resume_pending()
+            except Exception as e:
+                logger.warning("Falló el barrido de trabajos de reanálisis pendientes: %s", e)
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._pending.discard(job_id)
+            try:
+                await self.run_job(job_id)
+            except Exception:
+                logger.exception("Error inesperado en el trabajo de reanálisis %s", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _claim(self, job_id: ObjectId) -> dict | None:
+        now = datetime.now(timezone.utc)
+        return await reanalysis_job_collection.find_one_and_update(
+            {"_id": job_id, **_claimable_filter(now)},
+            {"$set": {
+                "state": ReanalysisJobState.running.value,
+                "analysis_version": ANALYSIS_VERSION,
+                "lease_token": ObjectId(),
+                "lease_until": now + timedelta(seconds=self.lease_seconds),
+                "updated_at": now,
+            }},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _checkpoint(self, job: dict, update: dict) -> bool:
+        """Guarda el avance y renueva la concesión. Devuelve False si otro proceso se quedó el trabajo."""
+        now = datetime.now(timezone.utc)
+        update.setdefault("$set", {}).update({
+            "lease_until": now + timedelta(seconds=self.lease_seconds),
+            "updated_at": now,
+        })
+        result = await reanalysis_job_collection.update_one(
+            {"_id": job["_id"], "lease_token": job["lease_token"]}, update,
+        )
+        return result.matched_count == 1
+
+    async def run_job(self, job_id: ObjectId) -> None:
+        """Ejecuta (o continúa) un trabajo hasta que no quedan documentos desactualizados."""
+        job = await self._claim(job_id)
+        if job is None:
+            # Otro proceso lo tiene o ya terminó
+            return
+
+        self._current = job
+        try:
+            await self._process(job)
+        finally:
+            self._current = None
+
+    async def _process(self, job: dict) -> None:
+        job_id = job["_id"]
+        interval = 60 / self.docs_per_minute if self.docs_per_minute > 0 else 0.0
+        loop = asyncio.get_running_loop()
+        next_start = loop.time()
+        last_id = job.get("last_id")
+
+        while True:
+            documents = await (
+                document_collection.find(stale_filter(job["owner_id"], last_id), {"_id": 1, "owner_id": 1})
+                .sort("_id", 1)
+                .limit(REANALYSIS_PAGE_SIZE)
+                .to_list(REANALYSIS_PAGE_SIZE)
+            )
+            if not documents:
+                break
+
+            for document in documents:
+                delay = next_start - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                outcome = "processed"
+                try:
+                    await reanalyze_document(document, REANALYSIS_SCHEDULER_OWNER)
+                except MissingDocumentText:
+                    outcome = "skipped"
+                except Exception as e:
+                    logger.warning("Falló el reanálisis del documento %s: %s", document["_id"], e)
+                    outcome = "failed"
+                if outcome != "skipped":
+                    # Los documentos sin texto no llaman al modelo y no consumen ritmo
+                    next_start = max(next_start, loop.time()) + interval
+
+                last_id = document["_id"]
+                if not await self._checkpoint(job, {"$set": {"last_id": last_id}, "$inc": {outcome: 1}}):
+                    logger.warning("El trabajo de reanálisis %s lo ha retomado otro proceso.", job_id)
+                    return
+
+        await self._checkpoint(job, {"$set": {"state": ReanalysisJobState.done.value, "lease_until": None}})
+        logger.info("Trabajo de reanálisis %s terminado.", job_id)
+
+
+reanalysis_runner = ReanalysisRunner()
+
+
+async def create_reanalysis_job(owner_id: str | None) -> dict:
+    """
+    Registra un trabajo de reanálisis de los documentos desactualizados de un usuario
+    (o de todos con `owner_id=None`). Si ya hay uno sin terminar, devuelve ese.
+    """
+    existing = await reanalysis_job_collection.find_one({"owner_id": owner_id, "state": {"$in": UNFINISHED_STATES}})
+    if existing is not None:
+        return existing
+
+    now = stored_datetime(datetime.now(timezone.utc))
+    job = {
+        "owner_id": owner_id,
+        "state": ReanalysisJobState.queued.value,
+        "analysis_version": ANALYSIS_VERSION,
+        "total": await document_collection.count_documents(stale_filter(owner_id)),
+        "processed": 0,
+        "failed": 0,
+        "skipped": 0,
+        "last_id": None,
+        "lease_token": None,
+        "lease_until": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    result = await reanalysis_job_collection.insert_one(job)
+    job["_id"] = result.inserted_id
+    return job
+
+
+async def get_reanalysis_job(job_id: str, owner_id: str) -> dict | None:
+    """Devuelve el trabajo si existe y pertenece al usuario."""
+    return await reanalysis_job_collection.find_one({"_id": ObjectId(job_id), "owner_id": owner_id})
+
+
+async def _migrate(owner_id: str | None) -> None:
+    await ensure_reanalysis_indexes()
+    job = await create_reanalysis_job(owner_id)
+    logger.info("Reanalizando %d documentos (trabajo %s).", job["total"], job["_id"])
+    await reanalysis_runner.run_job(job["_id"])
+
+
+def main():
+    # Migración tras cambiar el prompt o el modelo: python -m app.services.reanalysis [--owner ID]
+    parser = argparse.ArgumentParser(description="Reanaliza los documentos con el análisis desactualizado")
+    parser.add_argument("--owner", default=None, help="Solo los documentos de este usuario (id)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_migrate(args.owner))
+
+
+if __name__ == "__main__":
+    main()
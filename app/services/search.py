@@ -0,0 +1,399 @@
+# app/services/search.py
+
+import os
+import re
+import math
+import time
+import asyncio
+import logging
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Callable
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from starlette.concurrency import run_in_threadpool
+
+from app.database import document_collection, search_index_collection
+
+logger = logging.getLogger(__name__)
+
+# Solo se indexa el principio de textos muy largos
+SEARCH_TEXT_MAX_CHARS = int(os.getenv("SEARCH_TEXT_MAX_CHARS", "200000"))
+# Índices de usuario que se mantienen en memoria (LRU)
+SEARCH_MAX_LOADED_OWNERS = int(os.getenv("SEARCH_MAX_LOADED_OWNERS", "64"))
+# Con varios procesos, cada índice cargado se pone al día con los cambios de los demás cada cierto tiempo
+SEARCH_SYNC_INTERVAL_SECONDS = float(os.getenv("SEARCH_SYNC_INTERVAL_SECONDS", "10"))
+# Las bajas se guardan como marcas durante este tiempo para que las vean los demás procesos
+SEARCH_TOMBSTONE_SECONDS = int(os.getenv("SEARCH_TOMBSTONE_SECONDS", str(24 * 3600)))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {"title": 3.0, "keywords": 2.0, "summary": 1.5, "text": 1.0}
+
+LOAD_BATCH_SIZE = 1000
+# Margen para relojes algo desincronizados entre servidores
+SYNC_CLOCK_SKEW = timedelta(seconds=5)
+
+_TOKEN_RE = re.compile(r"\w{2,}")
+_ACCENTS_RE = re.compile(r"[\u0300-\u036f]")
+
+STOPWORDS = frozenset(
+    "de la que el en y a los del se las por un para con no una su al lo como mas pero sus le ya o este "
+    "ha si porque esta son entre cuando muy sin sobre ser tiene tambien me hasta hay donde desde todo nos "
+    "the and of to in is for on with as by at an be this that are from or it was which"
+    .split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Términos de búsqueda: minúsculas, sin tildes y sin palabras vacías."""
+    text = _ACCENTS_RE.sub("", unicodedata.normalize("NFKD", text.lower()))
+    return [token for token in _TOKEN_RE.findall(text) if token not in STOPWORDS and not token.isdigit()]
+
+
+def count_terms(text: str) -> dict[str, int]:
+    """Frecuencia de cada término en el texto extraído del documento."""
+    counts: dict[str, int] = {}
+    for token in tokenize(text[:SEARCH_TEXT_MAX_CHARS]):
+        counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+def weighted_terms(analysis: dict, text_terms: dict[str, int] | None = None) -> dict[str, float]:
+    """Frecuencias de términos del documento ponderadas por campo (título, palabras clave, resumen, texto)."""
+    text_weight = FIELD_WEIGHTS["text"]
+    terms = {token: count * text_weight for token, count in (text_terms or {}).items()}
+    fields = (
+        ("title", analysis.get("title") or ""),
+        ("summary", analysis.get("summary") or ""),
+        ("keywords", " ".join(analysis.get("keywords") or [])),
+    )
+    for field, value in fields:
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(value):
+            terms[token] = terms.get(token, 0.0) + weight
+    return terms
+
+
+def tombstones_expired(synced_at: datetime) -> bool:
+    """Si la última sincronización es tan antigua que las marcas de baja pueden haber caducado ya."""
+    return datetime.now(timezone.utc) - synced_at > timedelta(seconds=SEARCH_TOMBSTONE_SECONDS) / 2
+
+
+class OwnerTasks:
+    """
+    Tareas en segundo plano de los índices por usuario: como mucho una de cada tipo
+    ("load", "sync") por usuario a la vez. Cada tipo tiene su propio hueco, así que quien
+    espera la carga de un usuario nunca recibe una sincronización en curso (que no devuelve nada).
+    """
+
+    def __init__(self, description: str):
+        self.description = description
+        self._tasks: dict[tuple[str, str], asyncio.Task] = {}
+
+    def run_once(self, kind: str, owner_id: str, coroutine_function, *args) -> asyncio.Task:
+        """La tarea de ese tipo en curso para el usuario, o una nueva con `coroutine_function(owner_id, *args)`."""
+        key = (kind, owner_id)
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.create_task(coroutine_function(owner_id, *args))
+            task.add_done_callback(lambda _: self._on_done(key, task))
+        return task
+
+    def _on_done(self, key: tuple[str, str], task: asyncio.Task) -> None:
+        self._tasks.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("No se pudo actualizar el %s de %s: %s", self.description, key[1], task.exception())
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+
+class _Postings:
+    __slots__ = ("slots", "weights")
+
+    def __init__(self):
+        self.slots = array("I")
+        self.weights = array("f")
+
+
+class OwnerIndex:
+    """
+    Índice invertido en memoria de los documentos de un usuario, con puntuación BM25.
+    Las listas de apariciones son arrays compactos; las bajas se marcan y se
+    compactan cuando ocupan más que los documentos vivos.
+    """
+
+    def __init__(self):
+        self.postings: dict[str, _Postings] = {}
+        self.doc_ids: list[str | None] = []
+        self.lengths = array("f")
+        self.alive = bytearray()
+        self.slot_of: dict[str, int] = {}
+        self.total_length = 0.0
+        # Momento (según Mongo) hasta el que el índice está al día, y cuándo se comprobó
+        self.synced_at: datetime | None = None
+        self.checked_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.slot_of)
+
+    def add(self, doc_id: str, terms: dict[str, float]) -> None:
+        self.remove(doc_id)
+        slot = len(self.doc_ids)
+        length = float(sum(terms.values()))
+        self.doc_ids.append(doc_id)
+        self.slot_of[doc_id] = slot
+        self.lengths.append(length)
+        self.alive.append(1)
+        self.total_length += length
+        for term, weight in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = _Postings()
+            postings.slots.append(slot)
+            postings.weights.append(weight)
+
+    def remove(self, doc_id: str) -> None:
+        slot = self.slot_of.pop(doc_id, None)
+        if slot is None:
+            return
+        self.alive[slot] = 0
+        self.doc_ids[slot] = None
+        self.total_length -= self.lengths[slot]
+        dead = len(self.doc_ids) - len(self.slot_of)
+        if dead > max(1000, len(self.slot_of)):
+            self._compact()
+
+    def _compact(self) -> None:
+        alive = np.array(self.alive, dtype=bool)
+        new_slot = np.cumsum(alive, dtype=np.int64) - 1
+        for term in list(self.postings):
+            postings = self.postings[term]
+            slots = np.array(postings.slots, dtype=np.int64)
+            keep = alive[slots]
+            if not keep.any():
+                del self.postings[term]
+                continue
+            postings.slots = array("I", new_slot[slots[keep]].astype(np.uint32).tobytes())
+            postings.weights = array("f", np.array(postings.weights, dtype=np.float32)[keep].tobytes())
+        self.doc_ids = [doc_id for doc_id in self.doc_ids if doc_id is not None]
+        self.lengths = array("f", np.array(self.lengths, dtype=np.float32)[alive].tobytes())
+        self.alive = bytearray(b"\x01" * len(self.doc_ids))
+        self.slot_of = {doc_id: slot for slot, doc_id in enumerate(self.doc_ids)}
+
+    def search(self, terms: list[str], limit: int) -> list[tuple[str, float]]:
+        """Devuelve los `limit` documentos con mayor puntuación BM25 para los términos dados."""
+        n_docs = len(self.slot_of)
+        if not n_docs:
+            return []
+        alive = np.array(self.alive, dtype=bool)
+        lengths = np.array(self.lengths, dtype=np.float32)
+        average_length = self.total_length / n_docs or 1.0
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            slots = np.array(postings.slots, dtype=np.int64)
+            live = alive[slots]
+            slots = slots[live]
+            if not len(slots):
+                continue
+            weights = np.array(postings.weights, dtype=np.float32)[live]
+            idf = math.log(1 + (n_docs - len(slots) + 0.5) / (len(slots) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[slots] / average_length)
+            # Cada documento aparece una sola vez por término: la suma indexada es segura
+            scores[slots] += idf * weights * (BM25_K1 + 1) / (weights + norm)
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.doc_ids[slot], float(scores[slot])) for slot in ranked]
+
+
+def _add_entries(index: OwnerIndex, entries: list[dict]) -> None:
+    for entry in entries:
+        index.add(str(entry["_id"]), weighted_terms(entry.get("analysis") or {}, entry.get("text_terms")))
+
+
+class SearchIndex:
+    """
+    Búsqueda por relevancia sobre los documentos de cada usuario.
+    La colección `search_index` guarda, por documento, las frecuencias de términos de su
+    texto y una copia del análisis; con ella se construye en memoria el índice de un
+    usuario la primera vez que busca. Altas, cambios y bajas se guardan ahí con su fecha
+    (`indexed_at`), de modo que cada proceso pone al día sus índices leyendo solo lo nuevo.
+    """
+
+    def __init__(
+        self,
+        documents,
+        entries,
+        max_loaded_owners: int = SEARCH_MAX_LOADED_OWNERS,
+        sync_interval: float = SEARCH_SYNC_INTERVAL_SECONDS,
+    ):
+        self.documents = documents
+        self.entries = entries
+        self.max_loaded_owners = max_loaded_owners
+        self.sync_interval = sync_interval
+        self._owners: OrderedDict[str, OwnerIndex] = OrderedDict()
+        self._tasks = OwnerTasks("índice de búsqueda")
+        # Otros índices derivados de las mismas entradas (p. ej. el vectorial) que reciben los cambios locales
+        self.listeners: list[Callable[[dict], None]] = []
+
+    async def ensure_indexes(self) -> None:
+        await self.entries.create_index([("owner_id", 1), ("indexed_at", 1)])
+        await self.entries.create_index("expire_at", expireAfterSeconds=0)
+
+    # --- Mantenimiento ---
+
+    async def index_document(self, document: dict, text: str) -> None:
+        """Indexa un documento recién guardado junto con su texto extraído."""
+        text_terms = await run_in_threadpool(count_terms, text)
+        entry = {
+            "_id": document["_id"],
+            "owner_id": document["owner_id"],
+            "analysis": document["analysis"],
+            "text_terms": text_terms,
+            "indexed_at": datetime.now(timezone.utc),
+        }
+        await self.entries.replace_one({"_id": document["_id"]}, entry, upsert=True)
+        self._notify(entry)
+
+    async def update_document(self, document: dict) -> None:
+        """Reindexa el análisis de un documento editado; las frecuencias del texto se conservan."""
+        entry = await self.entries.find_one_and_update(
+            {"_id": document["_id"]},
+            {
+                "$set": {"analysis": document["analysis"], "indexed_at": datetime.now(timezone.utc)},
+                "$setOnInsert": {"owner_id": document["owner_id"], "text_terms": {}},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._notify(entry)
+
+    async def remove_document(self, owner_id: str, document_id) -> None:
+        now = datetime.now(timezone.utc)
+        entry = {
+            "_id": document_id,
+            "owner_id": owner_id,
+            "deleted": True,
+            "indexed_at": now,
+            "expire_at": now + timedelta(seconds=SEARCH_TOMBSTONE_SECONDS),
+        }
+        await self.entries.replace_one({"_id": document_id}, entry, upsert=True)
+        self._notify(entry)
+
+    def _notify(self, entry: dict) -> None:
+        for listener in self.listeners:
+            listener(entry)
+        self._apply(entry)
+
+    def _apply(self, entry: dict) -> None:
+        index = self._owners.get(entry["owner_id"])
+        if index is None:
+            return
+        if entry.get("deleted"):
+            index.remove(str(entry["_id"]))
+        else:
+            index.add(str(entry["_id"]), weighted_terms(entry.get("analysis") or {}, entry.get("text_terms")))
+
+    # --- Carga y sincronización ---
+
+    async def _load(self, owner_id: str) -> OwnerIndex:
+        index = OwnerIndex()
+        index.synced_at = datetime.now(timezone.utc) - SYNC_CLOCK_SKEW
+        batch = []
+        cursor = self.entries.find({"owner_id": owner_id, "deleted": {"$ne": True}}, batch_size=LOAD_BATCH_SIZE)
+        async for entry in cursor:
+            batch.append(entry)
+            if len(batch) >= LOAD_BATCH_SIZE:
+                # Construir el índice es CPU: se hace en un hilo; aún no lo ve nadie más
+                await run_in_threadpool(_add_entries, index, batch)
+                batch = []
+        await run_in_threadpool(_add_entries, index, batch)
+
+        # Documentos anteriores al índice de búsqueda: se indexan por su análisis
+        if await self.documents.count_documents({"owner_id": owner_id}) != len(index):
+            await self._backfill(owner_id, index)
+
+        self._owners[owner_id] = index
+        while len(self._owners) > self.max_loaded_owners:
+            self._owners.popitem(last=False)
+        # Cambios hechos mientras se cargaba
+        await self._sync(owner_id, index)
+        logger.info("Índice de búsqueda cargado para %s: %d documentos.", owner_id, len(index))
+        return index
+
+    async def _backfill(self, owner_id: str, index: OwnerIndex) -> None:
+        missing = []
+        async for doc in self.documents.find({"owner_id": owner_id}, {"analysis": 1}):
+            if str(doc["_id"]) not in index.slot_of:
+                missing.append({
+                    "_id": doc["_id"],
+                    "owner_id": owner_id,
+                    "analysis": doc.get("analysis") or {},
+                    "text_terms": {},
+                    "indexed_at": datetime.now(timezone.utc),
+                })
+        for start in range(0, len(missing), LOAD_BATCH_SIZE):
+            batch = missing[start:start + LOAD_BATCH_SIZE]
+            try:
+                await self.entries.insert_many(batch, ordered=False)
+            except BulkWriteError:
+                # Alguno se indexó mientras tanto por la vía normal
+                pass
+            await run_in_threadpool(_add_entries, index, batch)
+
+    async def _sync(self, owner_id: str, index: OwnerIndex) -> None:
+        """Aplica al índice las altas, cambios y bajas guardados desde la última sincronización."""
+        since = index.synced_at
+        index.synced_at = datetime.now(timezone.utc) - SYNC_CLOCK_SKEW
+        index.checked_at = time.monotonic()
+        async for entry in self.entries.find({"owner_id": owner_id, "indexed_at": {"$gte": since}}):
+            self._apply(entry)
+
+    async def _get(self, owner_id: str) -> OwnerIndex:
+        index = self._owners.get(owner_id)
+        if index is None:
+            return await asyncio.shield(self._tasks.run_once("load", owner_id, self._load))
+
+        self._owners.move_to_end(owner_id)
+        if tombstones_expired(index.synced_at):
+            # Sin uso durante mucho tiempo: ponerlo al día podría no ver algunas bajas, se reconstruye
+            self._tasks.run_once("load", owner_id, self._load)
+        elif time.monotonic() - index.checked_at > self.sync_interval:
+            # Se responde con el índice actual mientras se pone al día
+            self._tasks.run_once("sync", owner_id, self._sync, index)
+        return index
+
+    async def ensure_loaded(self, owner_id: str) -> None:
+        """Carga el índice del usuario; de paso, crea las entradas que falten de documentos antiguos."""
+        await self._get(owner_id)
+
+    async def search(self, owner_id: str, query: str, limit: int = 20) -> list[tuple[str, float]]:
+        """Devuelve (id, puntuación) de los documentos del usuario más relevantes para la consulta."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        index = await self._get(owner_id)
+        return index.search(terms, limit)
+
+    def stats(self) -> dict:
+        return {
+            "loaded_owners": len(self._owners),
+            "loaded_documents": sum(len(index) for index in self._owners.values()),
+            "loaded_terms": sum(len(index.postings) for index in self._owners.values()),
+            "updating": len(self._tasks),
+        }
+
+
+search_index = SearchIndex(document_collection, search_index_collection)
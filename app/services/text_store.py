@@ -0,0 +1,102 @@
+# app/services/text_store.py
+
+import os
+import zlib
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import numpy as np
+from bson import Binary, ObjectId
+from starlette.concurrency import run_in_threadpool
+
+from app.database import document_text_collection
+from app.metrics import timed_stage
+
+TEXT_COMPRESSION_LEVEL = int(os.getenv("TEXT_COMPRESSION_LEVEL", "6"))
+# Tamaño máximo de cada fragmento comprimido (un documento de Mongo no puede pasar de 16 MB)
+TEXT_CHUNK_BYTES = int(os.getenv("TEXT_CHUNK_BYTES", str(4 * 1024 * 1024)))
+
+COMPRESSION = "zlib"
+
+
+@dataclass
+class StoredText:
+    """Texto extraído de un documento, recuperado del almacén."""
+    text: str
+    page_offsets: list[int]
+    sha256: str
+    pdf_sha256: str | None
+
+
+def _compress(text: str, page_offsets: list[int], level: int) -> tuple[bytes, bytes, str]:
+    encoded = text.encode("utf-8")
+    offsets = np.asarray(page_offsets, dtype="<u4").tobytes()
+    return zlib.compress(encoded, level), zlib.compress(offsets, level), hashlib.sha256(encoded).hexdigest()
+
+
+def _decompress(records: list[dict]) -> StoredText:
+    header = records[0]
+    text = zlib.decompress(b"".join(record["data"] for record in records)).decode("utf-8")
+    offsets = np.frombuffer(zlib.decompress(header["page_offsets"]), dtype="<u4")
+    return StoredText(text=text, page_offsets=offsets.tolist(), sha256=header["sha256"],
+                      pdf_sha256=header.get("pdf_sha256"))
+
+
+class TextStore:
+    """
+    Texto extraído de cada documento, comprimido con zlib y guardado por fragmentos
+    en `document_texts` (un registro por fragmento). El primero lleva además las
+    posiciones de página comprimidas, el hash del texto y el del PDF original.
+    Con él se puede volver a analizar un documento sin el PDF: una lectura y una
+    descompresión en lugar de una subida y una extracción.
+    """
+
+    def __init__(self, collection, chunk_bytes: int = TEXT_CHUNK_BYTES, level: int = TEXT_COMPRESSION_LEVEL):
+        self.collection = collection
+        self.chunk_bytes = chunk_bytes
+        self.level = level
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index([("document_id", 1), ("seq", 1)], unique=True)
+
+    @timed_stage("text_store")
+    async def save(self, document_id: ObjectId, owner_id: str, text: str, page_offsets: list[int],
+                   pdf_sha256: str | None = None) -> int:
+        """Guarda el texto del documento. Devuelve los bytes que ocupa comprimido."""
+        # Comprimir varios MB de texto es CPU: se hace en un hilo
+        data, offsets, text_sha256 = await run_in_threadpool(_compress, text, page_offsets, self.level)
+        pieces = [data[start:start + self.chunk_bytes] for start in range(0, len(data), self.chunk_bytes)]
+        records = [
+            {"document_id": document_id, "owner_id": owner_id, "seq": seq, "data": Binary(piece)}
+            for seq, piece in enumerate(pieces)
+        ]
+        records[0].update({
+            "pieces": len(pieces),
+            "compression": COMPRESSION,
+            "chars": len(text),
+            "sha256": text_sha256,
+            "pdf_sha256": pdf_sha256,
+            "page_offsets": Binary(offsets),
+            "created_at": datetime.now(timezone.utc),
+        })
+        await self.collection.insert_many(records)
+        return len(data) + len(offsets)
+
+    @timed_stage("text_store")
+    async def load(self, document_id: ObjectId, owner_id: str) -> StoredText | None:
+        """Texto del documento, o None si no se guardó (documentos anteriores) o está incompleto."""
+        records = await (
+            self.collection.find({"document_id": document_id, "owner_id": owner_id})
+            .sort("seq", 1)
+            .to_list(None)
+        )
+        if not records or records[0].get("pieces") != len(records):
+            return None
+        return await run_in_threadpool(_decompress, records)
+
+    async def delete(self, document_id: ObjectId) -> None:
+        await self.collection.delete_many({"document_id": document_id})
+
+
+text_store = TextStore(document_text_collection)
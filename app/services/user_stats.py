@@ -0,0 +1,247 @@
+# app/services/user_stats.py
+
+import os
+import random
+import asyncio
+import logging
+import argparse
+import unicodedata
+from collections import Counter
+from datetime import datetime, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from app.database import document_collection, user_collection, user_stats_collection
+from app.metrics import registry, timed_stage
+
+# Estadísticas de cada usuario en un único documento de `user_stats` (con _id = owner_id):
+#   {documents, pages, chars, keywords: {clave: n}, labels: {clave: forma original},
+#    months: {"AAAA-MM": n}, version, updated_at}
+# Se actualizan con $inc al crear, editar, reanalizar y borrar documentos, así que leerlas
+# no recorre la colección de documentos. La reconciliación periódica las recalcula y corrige
+# lo que se haya desviado (una actualización que falló, una carrera con la propia reconciliación).
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se reconcilian las estadísticas de todos los usuarios (0 = nunca)
+USER_STATS_RECONCILE_INTERVAL_SECONDS = float(os.getenv("USER_STATS_RECONCILE_INTERVAL_SECONDS", "21600"))
+USER_STATS_TOP_KEYWORDS = int(os.getenv("USER_STATS_TOP_KEYWORDS", "50"))
+
+# Campos de los documentos que cuentan para las estadísticas
+STATS_PROJECTION = {"owner_id": 1, "created_at": 1, "analysis.keywords": 1, "page_count": 1, "char_count": 1}
+
+stats_repaired = registry.counter(
+    "intellidocs_user_stats_repaired_total", "Usuarios cuyas estadísticas corrigió la reconciliación.",
+)
+
+# La virgulilla de la ñ no se quita: "año" y "ano" son palabras distintas
+_KEPT_MARKS = {("n", "\u0303"), ("N", "\u0303")}
+
+
+def normalize_keyword(keyword: str) -> str:
+    """Clave de una palabra clave: sin mayúsculas, tildes ni espacios de más ("  Información" -> "informacion")."""
+    kept = []
+    for char in unicodedata.normalize("NFKD", keyword):
+        if unicodedata.combining(char) and (not kept or (kept[-1], char) not in _KEPT_MARKS):
+            continue
+        kept.append(char)
+    return " ".join(unicodedata.normalize("NFC", "".join(kept)).casefold().split())
+
+
+def _field(key: str) -> str:
+    """La clave como nombre de campo de Mongo, que no admite puntos ni un $ inicial."""
+    return key.replace(".", "\uff0e").lstrip("$")
+
+
+def _unfield(field: str) -> str:
+    return field.replace("\uff0e", ".")
+
+
+def _keywords(document: dict) -> dict[str, str]:
+    """Palabras clave del documento sin repetir, como campo -> forma original."""
+    keywords: dict[str, str] = {}
+    for keyword in (document.get("analysis") or {}).get("keywords") or []:
+        field = _field(normalize_keyword(keyword))
+        if field:
+            keywords.setdefault(field, " ".join(keyword.split()))
+    return keywords
+
+
+def _month(document: dict) -> str:
+    return document["created_at"].strftime("%Y-%m")
+
+
+@timed_stage("db")
+async def _apply(owner_id: str, increments: dict, labels: dict[str, str] | None = None) -> None:
+    """
+    Aplica los incrementos en un solo update. Un fallo no afecta a la operación que lo
+    causó: las estadísticas quedan desviadas hasta la siguiente reconciliación.
+    """
+    update = {
+        "$inc": {**increments, "version": 1},
+        "$set": {"updated_at": datetime.now(timezone.utc),
+                 **{f"labels.{field}": label for field, label in (labels or {}).items()}},
+    }
+    try:
+        await user_stats_collection.update_one({"_id": owner_id}, update, upsert=True)
+    except Exception as e:
+        logger.warning("No se pudieron actualizar las estadísticas del usuario %s: %s", owner_id, e)
+
+
+def _document_increments(document: dict, sign: int) -> dict:
+    increments = {
+        "documents": sign,
+        "pages": sign * (document.get("page_count") or 0),
+        "chars": sign * (document.get("char_count") or 0),
+        f"months.{_month(document)}": sign,
+    }
+    increments.update({f"keywords.{field}": sign for field in _keywords(document)})
+    return increments
+
+
+async def record_added(document: dict) -> None:
+    await _apply(document["owner_id"], _document_increments(document, 1), _keywords(document))
+
+
+async def record_removed(document: dict) -> None:
+    await _apply(document["owner_id"], _document_increments(document, -1))
+
+
+async def record_changed(before: dict, after: dict) -> None:
+    """Tras editar o reanalizar un documento: solo cambian los contadores de sus palabras clave."""
+    old, new = _keywords(before), _keywords(after)
+    increments = {f"keywords.{field}": -1 for field in old.keys() - new.keys()}
+    increments.update({f"keywords.{field}": 1 for field in new.keys() - old.keys()})
+    if increments:
+        await _apply(after["owner_id"], increments, {field: new[field] for field in new.keys() - old.keys()})
+
+
+@timed_stage("db")
+async def compute_user_stats(owner_id: str) -> dict:
+    """Estadísticas del usuario recorriendo todos sus documentos (lo que evitan los contadores)."""
+    totals = Counter()
+    keywords: Counter[str] = Counter()
+    months: Counter[str] = Counter()
+    labels: dict[str, str] = {}
+    async for document in document_collection.find({"owner_id": owner_id}, STATS_PROJECTION):
+        totals.update(documents=1, pages=document.get("page_count") or 0, chars=document.get("char_count") or 0)
+        months[_month(document)] += 1
+        document_keywords = _keywords(document)
+        keywords.update(document_keywords.keys())
+        labels.update(document_keywords)
+    return {
+        "documents": totals["documents"],
+        "pages": totals["pages"],
+        "chars": totals["chars"],
+        "keywords": dict(keywords),
+        "labels": labels,
+        "months": dict(months),
+    }
+
+
+def _counts(stats: dict) -> tuple:
+    """Lo que se compara al reconciliar (los contadores a cero equivalen a no tenerlos)."""
+    return (
+        stats.get("documents", 0), stats.get("pages", 0), stats.get("chars", 0),
+        {key: count for key, count in stats.get("keywords", {}).items() if count},
+        {key: count for key, count in stats.get("months", {}).items() if count},
+    )
+
+
+async def reconcile_user(owner_id: str) -> bool:
+    """
+    Recalcula las estadísticas del usuario y, si no coinciden, las sustituye (sin los
+    contadores a cero). Solo se sustituyen si nadie las cambió mientras se recalculaban;
+    si no, se deja para la siguiente pasada. Devuelve si se corrigieron.
+    """
+    stored = await user_stats_collection.find_one({"_id": owner_id}) or {}
+    version = stored.get("version")
+    computed = await compute_user_stats(owner_id)
+    if stored and _counts(stored) == _counts(computed):
+        return False
+
+    replacement = {**computed, "version": (version or 0) + 1, "updated_at": datetime.now(timezone.utc)}
+    try:
+        result = await user_stats_collection.replace_one({"_id": owner_id, "version": version}, replacement, upsert=True)
+    except DuplicateKeyError:
+        return False
+    return result.matched_count == 1 or result.upserted_id is not None
+
+
+async def get_user_stats(owner_id: str, top_keywords: int = USER_STATS_TOP_KEYWORDS) -> dict:
+    """
+    Estadísticas del usuario: totales, las `top_keywords` palabras clave con más documentos
+    y los documentos por mes. Lee un solo documento; el primer acceso de un usuario sin
+    estadísticas (de antes de existir los contadores) las calcula.
+    """
+    stats = await user_stats_collection.find_one({"_id": owner_id})
+    if stats is None:
+        await reconcile_user(owner_id)
+        stats = await user_stats_collection.find_one({"_id": owner_id}) or {}
+
+    labels = stats.get("labels", {})
+    keywords = sorted(
+        ((field, count) for field, count in stats.get("keywords", {}).items() if count > 0),
+        key=lambda item: (-item[1], item[0]),
+    )[:top_keywords]
+    return {
+        "documents": stats.get("documents", 0),
+        "pages": stats.get("pages", 0),
+        "chars": stats.get("chars", 0),
+        "keywords": [{"keyword": _unfield(labels.get(field, field)), "count": count} for field, count in keywords],
+        "months": [{"month": month, "count": count} for month, count in sorted(stats.get("months", {}).items()) if count > 0],
+        "updated_at": stats.get("updated_at"),
+    }
+
+
+class StatsReconciler:
+    """Reconcilia en segundo plano las estadísticas de todos los usuarios cada `interval` segundos."""
+
+    def __init__(self, interval: float = USER_STATS_RECONCILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            # Con varios workers, así no reconcilian todos a la vez
+            await asyncio.sleep(self.interval * random.uniform(0.75, 1.25))
+            try:
+                await self.reconcile_all()
+            except Exception:
+                logger.exception("Error al reconciliar las estadísticas de usuario")
+
+    async def reconcile_all(self) -> int:
+        """Reconcilia todos los usuarios. Devuelve a cuántos se les corrigieron las estadísticas."""
+        repaired = 0
+        async for user in user_collection.find({}, {"_id": 1}):
+            if await reconcile_user(str(user["_id"])):
+                repaired += 1
+        if repaired:
+            stats_repaired.inc(repaired)
+            logger.info("Estadísticas corregidas de %d usuarios.", repaired)
+        return repaired
+
+
+stats_reconciler = StatsReconciler()
+
+
+def main():
+    # Primera carga o reparación manual: python -m app.services.user_stats
+    parser = argparse.ArgumentParser(description="Recalcula las estadísticas de los usuarios")
+    parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(stats_reconciler.reconcile_all())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+# app/services/vector_index.py
+
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import asyncio
+import hashlib
+import logging
+import tempfile
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from app.database import search_index_collection
+from app.services.search import (
+    SearchIndex,
+    OwnerTasks,
+    search_index,
+    weighted_terms,
+    count_terms,
+    tombstones_expired as _tombstones_expired,
+    SYNC_CLOCK_SKEW,
+    SEARCH_SYNC_INTERVAL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Dimensión de los embeddings (múltiplo de 64 para los códigos binarios)
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))
+EMBEDDINGS_DIR = os.getenv("EMBEDDINGS_DIR") or os.path.join(tempfile.gettempdir(), "intellidocs-embeddings")
+VECTOR_MAX_LOADED_OWNERS = int(os.getenv("VECTOR_MAX_LOADED_OWNERS", "64"))
+# A partir de este número de vectores, la búsqueda por defecto es aproximada
+VECTOR_EXACT_MAX_ROWS = int(os.getenv("VECTOR_EXACT_MAX_ROWS", "200000"))
+# En modo aproximado se reordenan con el coseno exacto `limit * VECTOR_RERANK_FACTOR` candidatos
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "50"))
+# Filas nuevas en memoria a partir de las que se reescribe la instantánea en disco
+VECTOR_SNAPSHOT_ROWS = int(os.getenv("VECTOR_SNAPSHOT_ROWS", "1000"))
+
+LOAD_BATCH_SIZE = 1000
+SNAPSHOT_CHUNK_ROWS = 65536
+
+_SAFE_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def embed_terms(terms: dict[str, float], dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """
+    Embedding por hashing de términos: cada término suma `log(1 + peso)` con signo
+    en la posición que indica su hash, y el vector se normaliza (coseno = producto escalar).
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    if not terms:
+        return vector
+    hashes = np.fromiter((zlib.crc32(term.encode("utf-8")) for term in terms), dtype=np.uint32, count=len(terms))
+    weights = np.log1p(np.fromiter(terms.values(), dtype=np.float32, count=len(terms)))
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, hashes % dim, signs * weights)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def embed_entry(entry: dict, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Embedding de un documento a partir de su entrada en el índice de búsqueda."""
+    return embed_terms(weighted_terms(entry.get("analysis") or {}, entry.get("text_terms")), dim)
+
+
+def embed_query(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    return embed_terms(count_terms(text), dim)
+
+
+def binary_codes(vectors: np.ndarray) -> np.ndarray:
+    """Código binario (signo de cada componente) empaquetado en palabras de 64 bits."""
+    return np.packbits(vectors > 0, axis=-1).view(np.uint64)
+
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """
+    Distancia de Hamming de cada código con el de la consulta. Los códigos se guardan por
+    palabra, con forma (palabras, n): cada pasada recorre memoria contigua.
+    """
+    distances = np.zeros(codes.shape[1], dtype=np.uint16)
+    for word, query_word in zip(codes, query_code):
+        distances += np.bitwise_count(word ^ query_word)
+    return distances
+
+
+class OwnerVectors:
+    """
+    Embeddings de los documentos de un usuario: una instantánea en disco abierta con
+    memmap (vectores float32 y sus códigos binarios, por palabra) más las filas añadidas desde
+    entonces, en memoria. Las bajas solo se marcan; se eliminan al reescribir la instantánea.
+    """
+
+    def __init__(self, dim: int, vectors: np.ndarray | None = None, codes: np.ndarray | None = None,
+                 ids: list[str] | None = None):
+        self.dim = dim
+        self.base = vectors if vectors is not None else np.empty((0, dim), dtype=np.float32)
+        self.base_codes = codes if codes is not None else np.empty((dim // 64, 0), dtype=np.uint64)
+        self.delta = np.empty((0, dim), dtype=np.float32)
+        self.delta_codes = np.empty((dim // 64, 0), dtype=np.uint64)
+        self._pending: list[np.ndarray] = []
+        self.ids: list[str | None] = list(ids or [])
+        self.row_of = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.alive = bytearray(b"\x01" * len(self.ids))
+        self.synced_at: datetime | None = None
+        self.checked_at = time.monotonic()
+        # Cambios registrados mientras se escribe una instantánea, para reaplicarlos sobre ella
+        self.log: list[tuple[str, str, np.ndarray | None]] | None = None
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    @property
+    def unsaved_rows(self) -> int:
+        return len(self.ids) - len(self.base)
+
+    def add(self, doc_id: str, vector: np.ndarray) -> None:
+        self.remove(doc_id)
+        self.row_of[doc_id] = len(self.ids)
+        self.ids.append(doc_id)
+        self.alive.append(1)
+        self._pending.append(vector)
+        if self.log is not None:
+            self.log.append(("add", doc_id, vector))
+
+    def remove(self, doc_id: str) -> None:
+        row = self.row_of.pop(doc_id, None)
+        if row is None:
+            return
+        self.alive[row] = 0
+        self.ids[row] = None
+        if self.log is not None:
+            self.log.append(("remove", doc_id, None))
+
+    def _consolidate(self) -> None:
+        if self._pending:
+            rows = np.vstack(self._pending)
+            self.delta = np.concatenate([self.delta, rows])
+            self.delta_codes = np.concatenate([self.delta_codes, binary_codes(rows).T], axis=1)
+            self._pending = []
+
+    def vector(self, doc_id: str) -> np.ndarray | None:
+        row = self.row_of.get(doc_id)
+        if row is None:
+            return None
+        self._consolidate()
+        return self._rows(np.array([row]))[0]
+
+    def _rows(self, rows: np.ndarray) -> np.ndarray:
+        n_base = len(self.base)
+        in_base = rows < n_base
+        result = np.empty((len(rows), self.dim), dtype=np.float32)
+        # Acceso ordenado a la instantánea: lecturas secuenciales del memmap
+        base_rows = rows[in_base]
+        order = np.argsort(base_rows)
+        result[np.flatnonzero(in_base)[order]] = self.base[base_rows[order]]
+        result[~in_base] = self.delta[rows[~in_base] - n_base]
+        return result
+
+    def search(self, query: np.ndarray, limit: int, exclude: str | None = None,
+               approximate: bool | None = None) -> list[tuple[str, float]]:
+        """Devuelve los `limit` documentos con mayor similitud coseno con `query`."""
+        self._consolidate()
+        alive = np.array(self.alive, dtype=bool)
+        if exclude in self.row_of:
+            alive[self.row_of[exclude]] = False
+        n_alive = int(alive.sum())
+        if not n_alive or not query.any():
+            return []
+        if approximate is None:
+            approximate = len(alive) > VECTOR_EXACT_MAX_ROWS
+
+        if approximate:
+            # Preselección por distancia de Hamming entre códigos binarios y reordenación exacta
+            query_code = binary_codes(query)
+            distances = np.concatenate([
+                hamming_distances(self.base_codes, query_code),
+                hamming_distances(self.delta_codes, query_code),
+            ])
+            distances[~alive] = np.iinfo(np.uint16).max
+            n_candidates = min(n_alive, limit * VECTOR_RERANK_FACTOR)
+            rows = np.argpartition(distances, n_candidates - 1)[:n_candidates]
+            scores = self._rows(rows) @ query
+        else:
+            scores = np.concatenate([self.base @ query, self.delta @ query])
+            scores[~alive] = -np.inf
+            rows = np.arange(len(scores))
+
+        top = min(limit, len(rows))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(self.ids[rows[i]], float(scores[i])) for i in best if scores[i] > 0 and alive[rows[i]]]
+
+
+# --- Instantáneas en disco ---
+
+def _owner_dir(directory: str, owner_id: str) -> str:
+    name = owner_id if _SAFE_NAME_RE.match(owner_id) else hashlib.sha256(owner_id.encode("utf-8")).hexdigest()
+    return os.path.join(directory, name)
+
+
+def _read_snapshot(directory: str, owner_id: str, dim: int) -> OwnerVectors | None:
+    path = _owner_dir(directory, owner_id)
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        if meta["dim"] != dim:
+            return None
+        vectors = np.load(os.path.join(path, meta["vectors"]), mmap_mode="r")
+        codes = np.load(os.path.join(path, meta["codes"]), mmap_mode="r")
+        ids = [doc_id.decode("ascii") for doc_id in np.load(os.path.join(path, meta["ids"]))]
+        if vectors.shape != (len(ids), dim) or codes.shape != (dim // 64, len(ids)):
+            raise ValueError("dimensiones inconsistentes")
+    except (OSError, ValueError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logger.warning("Instantánea de vectores ilegible para %s: %s", owner_id, e)
+        return None
+
+    owner_vectors = OwnerVectors(dim, vectors, codes, ids)
+    owner_vectors.synced_at = datetime.fromisoformat(meta["synced_at"])
+    return owner_vectors
+
+
+def _write_snapshot(directory: str, owner_id: str, owner_vectors: OwnerVectors, rows: np.ndarray,
+                    ids: list[str], synced_at: datetime) -> None:
+    """
+    Escribe las filas vivas indicadas en ficheros nuevos y publica la instantánea
+    sustituyendo `meta.json` de forma atómica; los ficheros anteriores se borran después.
+    """
+    path = _owner_dir(directory, owner_id)
+    os.makedirs(path, exist_ok=True)
+    token = uuid.uuid4().hex[:12]
+    names = {"vectors": f"vectors-{token}.npy", "codes": f"codes-{token}.npy", "ids": f"ids-{token}.npy"}
+
+    vectors = np.lib.format.open_memmap(os.path.join(path, names["vectors"]), mode="w+",
+                                        dtype=np.float32, shape=(len(rows), owner_vectors.dim))
+    codes = np.lib.format.open_memmap(os.path.join(path, names["codes"]), mode="w+",
+                                      dtype=np.uint64, shape=(owner_vectors.dim // 64, len(rows)))
+    for start in range(0, len(rows), SNAPSHOT_CHUNK_ROWS):
+        chunk = owner_vectors._rows(rows[start:start + SNAPSHOT_CHUNK_ROWS])
+        vectors[start:start + len(chunk)] = chunk
+        codes[:, start:start + len(chunk)] = binary_codes(chunk).T
+    vectors.flush()
+    codes.flush()
+    del vectors, codes
+    np.save(os.path.join(path, names["ids"]), np.array(ids, dtype="S24"))
+
+    previous = None
+    meta_path = os.path.join(path, "meta.json")
+    try:
+        with open(meta_path, encoding="utf-8") as meta_file:
+            previous = json.load(meta_file)
+    except (OSError, ValueError):
+        pass
+
+    meta = {"dim": owner_vectors.dim, "rows": len(rows), "synced_at": synced_at.isoformat(), **names}
+    with tempfile.NamedTemporaryFile("w", dir=path, suffix=".json", delete=False, encoding="utf-8") as tmp:
+        json.dump(meta, tmp)
+    os.replace(tmp.name, meta_path)
+
+    if previous:
+        for key in ("vectors", "codes", "ids"):
+            try:
+                os.unlink(os.path.join(path, previous[key]))
+            except (OSError, KeyError):
+                # En Windows no se puede borrar un fichero que otro proceso tiene mapeado
+                pass
+
+
+class VectorIndex:
+    """
+    Índice vectorial para "documentos similares" y búsqueda semántica.
+    Los embeddings se derivan de las entradas del índice de búsqueda, así que comparte
+    su mantenimiento: recibe los cambios locales y se pone al día con `indexed_at`.
+    Cada usuario tiene una instantánea en disco que se abre con memmap al cargar.
+    """
+
+    def __init__(
+        self,
+        entries,
+        text_index: SearchIndex,
+        directory: str = EMBEDDINGS_DIR,
+        dim: int = EMBEDDING_DIM,
+        max_loaded_owners: int = VECTOR_MAX_LOADED_OWNERS,
+        sync_interval: float = SEARCH_SYNC_INTERVAL_SECONDS,
+    ):
+        if dim % 64:
+            raise ValueError("EMBEDDING_DIM debe ser múltiplo de 64.")
+        self.entries = entries
+        self.text_index = text_index
+        self.directory = directory
+        self.dim = dim
+        self.max_loaded_owners = max_loaded_owners
+        self.sync_interval = sync_interval
+        self._owners: OrderedDict[str, OwnerVectors] = OrderedDict()
+        self._tasks = OwnerTasks("índice vectorial")
+        self._snapshots: dict[str, asyncio.Task] = {}
+        text_index.listeners.append(self.apply)
+
+    def apply(self, entry: dict) -> None:
+        owner_id = entry["owner_id"]
+        owner_vectors = self._owners.get(owner_id)
+        if owner_vectors is None:
+            return
+        if entry.get("deleted"):
+            owner_vectors.remove(str(entry["_id"]))
+        else:
+            owner_vectors.add(str(entry["_id"]), embed_entry(entry, self.dim))
+        if owner_vectors.unsaved_rows >= VECTOR_SNAPSHOT_ROWS:
+            self._start_snapshot(owner_id)
+
+    # --- Carga, sincronización e instantáneas ---
+
+    async def _load(self, owner_id: str) -> OwnerVectors:
+        owner_vectors = await run_in_threadpool(_read_snapshot, self.directory, owner_id, self.dim)
+        if owner_vectors is not None and _tombstones_expired(owner_vectors.synced_at):
+            # Ya no quedan las marcas de las bajas posteriores a la instantánea: no sirve
+            owner_vectors = None
+        if owner_vectors is None:
+            # Sin instantánea: se calculan todos los embeddings desde las entradas
+            await self.text_index.ensure_loaded(owner_id)
+            owner_vectors = OwnerVectors(self.dim)
+            owner_vectors.synced_at = datetime.now(timezone.utc) - SYNC_CLOCK_SKEW
+            query = {"owner_id": owner_id, "deleted": {"$ne": True}}
+            await self._add_from_cursor(owner_vectors, self.entries.find(query, batch_size=LOAD_BATCH_SIZE))
+
+        self._owners[owner_id] = owner_vectors
+        while len(self._owners) > self.max_loaded_owners:
+            self._owners.popitem(last=False)
+        await self._sync(owner_id, owner_vectors)
+        if owner_vectors.unsaved_rows or len(owner_vectors.ids) > len(owner_vectors) * 1.25:
+            self._start_snapshot(owner_id)
+        return owner_vectors
+
+    async def _add_from_cursor(self, owner_vectors: OwnerVectors, cursor) -> None:
+        batch = []
+        async for entry in cursor:
+            batch.append(entry)
+            if len(batch) >= LOAD_BATCH_SIZE:
+                await self._add_batch(owner_vectors, batch)
+                batch = []
+        await self._add_batch(owner_vectors, batch)
+
+    async def _add_batch(self, owner_vectors: OwnerVectors, entries: list[dict]) -> None:
+        # Los embeddings son CPU: se calculan en un hilo y se aplican en el event loop
+        vectors = await run_in_threadpool(lambda: [embed_entry(entry, self.dim) for entry in entries])
+        for entry, vector in zip(entries, vectors):
+            if entry.get("deleted"):
+                owner_vectors.remove(str(entry["_id"]))
+            else:
+                owner_vectors.add(str(entry["_id"]), vector)
+
+    async def _sync(self, owner_id: str, owner_vectors: OwnerVectors) -> None:
+        since = owner_vectors.synced_at
+        owner_vectors.synced_at = datetime.now(timezone.utc) - SYNC_CLOCK_SKEW
+        owner_vectors.checked_at = time.monotonic()
+        await self._add_from_cursor(owner_vectors, self.entries.find({"owner_id": owner_id, "indexed_at": {"$gte": since}}))
+
+    def _start_snapshot(self, owner_id: str) -> None:
+        if owner_id not in self._snapshots:
+            task = self._snapshots[owner_id] = asyncio.create_task(self._snapshot(owner_id))
+            task.add_done_callback(lambda _: self._on_snapshot_done(owner_id, task))
+
+    def _on_snapshot_done(self, owner_id: str, task: asyncio.Task) -> None:
+        self._snapshots.pop(owner_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("No se pudo guardar la instantánea de vectores de %s: %s", owner_id, task.exception())
+
+    async def _snapshot(self, owner_id: str) -> None:
+        owner_vectors = self._owners.get(owner_id)
+        if owner_vectors is None:
+            return
+        owner_vectors._consolidate()
+        rows = np.flatnonzero(np.array(owner_vectors.alive, dtype=bool))
+        ids = [owner_vectors.ids[row] for row in rows]
+        synced_at = owner_vectors.synced_at
+        owner_vectors.log = []
+        try:
+            await run_in_threadpool(_write_snapshot, self.directory, owner_id, owner_vectors, rows, ids, synced_at)
+            fresh = await run_in_threadpool(_read_snapshot, self.directory, owner_id, self.dim)
+        finally:
+            log, owner_vectors.log = owner_vectors.log, None
+        if fresh is None or self._owners.get(owner_id) is not owner_vectors:
+            return
+
+        # Se pasa a usar la instantánea recién escrita, con los cambios que llegaron mientras tanto
+        for operation, doc_id, vector in log:
+            if operation == "add":
+                fresh.add(doc_id, vector)
+            else:
+                fresh.remove(doc_id)
+        fresh.synced_at = owner_vectors.synced_at
+        fresh.checked_at = owner_vectors.checked_at
+        self._owners[owner_id] = fresh
+
+    async def _get(self, owner_id: str) -> OwnerVectors:
+        owner_vectors = self._owners.get(owner_id)
+        if owner_vectors is None:
+            return await asyncio.shield(self._tasks.run_once("load", owner_id, self._load))
+
+        self._owners.move_to_end(owner_id)
+        if _tombstones_expired(owner_vectors.synced_at):
+            self._tasks.run_once("load", owner_id, self._load)
+        elif time.monotonic() - owner_vectors.checked_at > self.sync_interval:
+            self._tasks.run_once("sync", owner_id, self._sync, owner_vectors)
+        return owner_vectors
+
+    # --- Consultas ---
+
+    async def similar(self, owner_id: str, document_id: str, limit: int = 10,
+                      approximate: bool | None = None) -> list[tuple[str, float]] | None:
+        """Documentos más parecidos a uno dado. None si el documento no está indexado."""
+        owner_vectors = await self._get(owner_id)
+        vector = owner_vectors.vector(document_id)
+        if vector is None:
+            return None
+        return owner_vectors.search(vector, limit, exclude=document_id, approximate=approximate)
+
+    async def search(self, owner_id: str, query: str, limit: int = 20,
+                     approximate: bool | None = None) -> list[tuple[str, float]]:
+        """Búsqueda semántica: documentos cuyo embedding es más cercano al de la consulta."""
+        owner_vectors = await self._get(owner_id)
+        return owner_vectors.search(embed_query(query, self.dim), limit, approximate=approximate)
+
+    def stats(self) -> dict:
+        return {
+            "loaded_owners": len(self._owners),
+            "loaded_vectors": sum(len(owner_vectors) for owner_vectors in self._owners.values()),
+            "unsaved_rows": sum(owner_vectors.unsaved_rows for owner_vectors in self._owners.values()),
+            "dim": self.dim,
+        }
+
+
+vector_index = VectorIndex(search_index_collection, search_index)
@@ -0,0 +1,133 @@
+# app/uploads.py
+
+import os
+import time
+import hashlib
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from fastapi import UploadFile, status
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.metrics import record_stage
+
+# --- Configuración de subidas ---
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or tempfile.gettempdir()
+# Subidas por lotes: número de archivos y tamaño total de la petición
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "50"))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+
+# Margen para las cabeceras y separadores del cuerpo multipart
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """El fichero subido supera el tamaño máximo permitido."""
+
+
+@dataclass
+class SpooledUpload:
+    """PDF subido y volcado a un fichero temporal en disco."""
+    path: str
+    filename: str
+    size: int
+    sha256: str
+
+
+def _too_large_response(limit: int) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        content={"detail": f"El archivo supera el tamaño máximo de {limit // (1024 * 1024)} MB."},
+    )
+
+
+@asynccontextmanager
+async def spool_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    Copia la subida por bloques a un fichero temporal, calculando su hash por el camino.
+    Nunca hay más de un bloque en memoria; el fichero se borra al salir del contexto.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    spool = tempfile.NamedTemporaryFile(dir=UPLOAD_SPOOL_DIR, suffix=".pdf", delete=False)
+    start = time.perf_counter()
+    try:
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"El archivo supera el tamaño máximo de {max_bytes // (1024 * 1024)} MB.")
+                digest.update(chunk)
+                await run_in_threadpool(spool.write, chunk)
+        finally:
+            spool.close()
+        record_stage("spool", time.perf_counter() - start)
+        yield SpooledUpload(path=spool.name, filename=file.filename, size=size, sha256=digest.hexdigest())
+    finally:
+        os.unlink(spool.name)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Middleware ASGI que limita el tamaño del cuerpo de las peticiones.
+    Rechaza con 413 por la cabecera Content-Length antes de leer nada y,
+    si no la hay, corta la lectura en cuanto se supera el límite.
+    `path_limits` permite límites propios para algunas rutas (p. ej. subidas por lotes).
+    """
+
+    def __init__(
+        self,
+        app,
+        max_body_bytes: int = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+        path_limits: dict[str, int] | None = None,
+    ):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.path_limits = {path.rstrip("/"): limit for path, limit in (path_limits or {}).items()}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.path_limits.get(scope["path"].rstrip("/"), self.max_body_bytes)
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await _too_large_response(limit)(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # Si se cortó la lectura, la respuesta que genere la app (400/500) se sustituye por un 413
+            if exceeded:
+                if not response_started:
+                    response_started = True
+                    await _too_large_response(limit)(scope, receive, send)
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            if not response_started:
+                await _too_large_response(limit)(scope, receive, send)
@@ -0,0 +1,123 @@
+# benchmarks/bench_auth_cache.py
+#
+# Carga sintética sobre get_current_user: muchos usuarios con popularidad tipo Zipf
+# y peticiones concurrentes. Compara la dependencia original (verificar el JWT y leer
+# el usuario en cada petición) con la caché de autenticación. La colección de
+# usuarios se simula con una latencia de ida y vuelta configurable.
+#   python -m benchmarks.bench_auth_cache --requests 20000 --users 2000 --db-latency-ms 1
+
+import os
+import json
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+
+from jose import jwt
+
+from app import security
+from app.repositories import UserRepository
+from app.security import AuthCache, create_access_token, SECRET_KEY, ALGORITHM, get_current_user
+
+
+class FakeUserCollection:
+    """Colección de usuarios en memoria que tarda lo que un viaje a MongoDB."""
+
+    def __init__(self, users: int, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.users = {
+            f"user{number}@example.com": {
+                "_id": f"{number:024x}",
+                "email": f"user{number}@example.com",
+                "hashed_password": "x",
+            }
+            for number in range(users)
+        }
+
+    async def find_one(self, query: dict) -> dict | None:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.users.get(query["email"])
+
+
+async def uncached_current_user(token: str):
+    """La dependencia tal y como era antes de la caché."""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    user = await security.user_repository.get_by_email(payload["sub"])
+    return security.UserModel(**user)
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+async def run_load(name: str, resolve, tokens: list[str], order: np.ndarray, concurrency: int,
+                   collection: FakeUserCollection) -> dict:
+    latencies: list[float] = []
+    queue = iter(order.tolist())
+    collection.calls = 0
+
+    async def client():
+        for index in queue:
+            start = time.perf_counter()
+            await resolve(tokens[index])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": name,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "db_calls": collection.calls,
+    }
+
+
+async def main_async(args) -> None:
+    collection = FakeUserCollection(args.users, args.db_latency_ms / 1000)
+    security.user_repository = UserRepository(collection)
+    # Cada usuario tiene varias sesiones abiertas (tokens distintos)
+    tokens = [
+        create_access_token({"sub": f"user{number}@example.com", "session": session})
+        for number in range(args.users)
+        for session in range(args.sessions)
+    ]
+    rng = np.random.default_rng(args.seed)
+    users = (np.minimum(rng.zipf(args.zipf, args.requests), args.users) - 1)
+    order = users * args.sessions + rng.integers(0, args.sessions, args.requests)
+
+    print(json.dumps(await run_load("uncached", uncached_current_user, tokens, order, args.concurrency, collection)))
+
+    security.auth_cache = AuthCache(max_users=args.cache_users, ttl=args.ttl, max_tokens=args.cache_tokens)
+    result = await run_load("cached", get_current_user, tokens, order, args.concurrency, collection)
+    result.update(security.auth_cache.stats())
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la caché de autenticación")
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--sessions", type=int, default=2)
+    parser.add_argument("--zipf", type=float, default=1.2)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--db-latency-ms", type=float, default=1.0)
+    parser.add_argument("--cache-users", type=int, default=security.AUTH_CACHE_MAX_USERS)
+    parser.add_argument("--cache-tokens", type=int, default=security.AUTH_CACHE_MAX_TOKENS)
+    parser.add_argument("--ttl", type=int, default=security.AUTH_CACHE_TTL_SECONDS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
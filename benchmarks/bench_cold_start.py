@@ -0,0 +1,96 @@
+# benchmarks/bench_cold_start.py
+#
+# Arranque en frío de un worker: lanza procesos nuevos que importan la aplicación y
+# ejecutan su lifespan hasta quedar preparados, y mide desde que se lanza el proceso
+# (intérprete incluido) hasta entonces, con el desglose por fases. Por defecto usa
+# el backend en memoria; con --backend mongo se conecta al MONGO_URI configurado.
+#   python -m benchmarks.bench_cold_start --runs 10
+#   python -m benchmarks.bench_cold_start --runs 5 --backend mongo --top-imports 15
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+async def _start_and_stop() -> dict:
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        ready_at = time.time()
+        startup = dict(app.state.startup)
+    return {"ready_at": ready_at, "startup": startup, "sdk_modules": sorted(
+        name for name in ("google.generativeai", "openai", "fitz", "IPython") if name in sys.modules
+    )}
+
+
+def child() -> None:
+    """Proceso medido: importa la aplicación, la arranca y la para."""
+    print(json.dumps(asyncio.run(_start_and_stop())), flush=True)
+
+
+def run_once(env: dict) -> dict:
+    launched_at = time.time()
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_cold_start", "--child"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["process_to_ready"] = report.pop("ready_at") - launched_at
+    return report
+
+
+def top_imports(env: dict, count: int) -> list[dict]:
+    """Módulos que más tardan en importarse (acumulado), según `python -X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append({"module": parts[2].strip(), "cumulative_ms": round(int(parts[1]) / 1000, 1)})
+    return sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de arranque en frío de un worker")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--top-imports", type=int, default=0, help="Muestra los N módulos más lentos de importar")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    env = {**os.environ, "DATABASE_BACKEND": args.backend}
+    env.setdefault("SECRET_KEY", "benchmark-secret")
+    env.setdefault("LLM_PRIMARY", "fake")
+
+    reports = [run_once(env) for _ in range(args.runs)]
+    summary = {"backend": args.backend, "runs": args.runs, "sdk_modules_loaded": reports[-1]["sdk_modules"]}
+    phases = ["process_to_ready", *reports[-1]["startup"].keys()]
+    for phase in phases:
+        samples = [report["process_to_ready"] if phase == "process_to_ready" else report["startup"][phase]
+                   for report in reports]
+        summary[f"{phase}_p50_ms"] = round(percentile(samples, 0.5) * 1000, 1)
+        summary[f"{phase}_max_ms"] = round(max(samples) * 1000, 1)
+    print(json.dumps(summary))
+
+    for row in top_imports(env, args.top_imports) if args.top_imports else []:
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# benchmarks/bench_condensation.py
+#
+# Coste de la condensación extractiva (TF-IDF con NumPy) sobre documentos largos
+# y cobertura de páginas del resultado frente a cortar un prefijo.
+#   python -m benchmarks.bench_condensation --pages 1000
+
+import json
+import time
+import argparse
+
+from app.services.condensation import condense, split_sentences, score_sentences
+from benchmarks.bench_map_reduce import make_pages
+
+
+def page_coverage(selected: str, pages: list[str]) -> float:
+    """Fracción de páginas de las que se ha conservado al menos una frase."""
+    kept = set(selected.split("\n"))
+    covered = sum(1 for page in pages if kept.intersection(split_sentences(page)))
+    return covered / len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la condensación extractiva")
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--chars-per-page", type=int, default=2500)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[8000, 48000])
+    args = parser.parse_args()
+
+    for page_count in args.pages:
+        pages = make_pages(page_count, args.chars_per_page)
+        text = "".join(pages)
+
+        start = time.perf_counter()
+        sentences = split_sentences(text)
+        score_sentences(sentences)
+        ranking_seconds = time.perf_counter() - start
+
+        for budget in args.budgets:
+            start = time.perf_counter()
+            condensed = condense(text, budget)
+            elapsed = time.perf_counter() - start
+            print(json.dumps({
+                "pages": page_count,
+                "input_chars": len(text),
+                "sentences": len(sentences),
+                "budget_chars": budget,
+                "output_chars": len(condensed),
+                "ranking_seconds": round(ranking_seconds, 3),
+                "condense_seconds": round(elapsed, 3),
+                "page_coverage": round(page_coverage(condensed, pages), 3),
+                "prefix_page_coverage": round(min(1.0, budget / len(text)), 3),
+            }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/bench_list_documents.py
+#
+# Latencia del listado de documentos por página: paginación por clave (cursor sobre el
+# índice owner_id, created_at, _id) frente a skip/limit. Necesita un MongoDB real
+# (MONGO_URI); los documentos se insertan en una base aparte que se borra al final.
+#   python -m benchmarks.bench_list_documents --documents 200000 --pages 1 10 100 1000 10000
+
+import os
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.services import document_listing
+from app.services.document_listing import LIST_INDEX, LIST_SORT, encode_cursor, list_owner_documents
+
+OWNER_ID = "bench-owner"
+INSERT_BATCH = 10_000
+
+
+def make_documents(start: int, count: int, summary_words: int) -> list[dict]:
+    base = datetime(2024, 1, 1)
+    summary = " ".join(["resumen"] * summary_words)
+    return [
+        {
+            "filename": f"documento-{number}.pdf",
+            "analysis": {"title": f"Documento {number}", "summary": summary, "keywords": ["uno", "dos", "tres"]},
+            "owner_id": OWNER_ID,
+            # Varios documentos por segundo: el cursor tiene que desempatar por _id
+            "created_at": base + timedelta(seconds=number // 4),
+        }
+        for number in range(start, start + count)
+    ]
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+async def timed_ms(coroutine_factory, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await coroutine_factory()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+async def run(args) -> None:
+    client = AsyncIOMotorClient(os.getenv("MONGO_URI"), serverSelectionTimeoutMS=5000)
+    collection = client[args.database].get_collection("documents")
+    document_listing.document_collection = collection
+    try:
+        await collection.drop()
+        for start in range(0, args.documents, INSERT_BATCH):
+            await collection.insert_many(make_documents(start, min(INSERT_BATCH, args.documents - start), args.summary_words))
+        await collection.create_index(LIST_INDEX)
+        fields = args.fields.split(",") if args.fields else None
+        projection = document_listing.projection_for(fields)
+        query = {"owner_id": OWNER_ID}
+
+        for page in args.pages:
+            skip = (page - 1) * args.limit
+            if skip >= args.documents:
+                continue
+            # Cursor de la página: posición del último documento de la anterior (sin medir)
+            cursor = None
+            if skip:
+                previous = await collection.find(query, {"created_at": 1}).sort(LIST_SORT).skip(skip - 1).limit(1).to_list(1)
+                cursor = encode_cursor(previous[0])
+
+            keyset = await timed_ms(lambda: list_owner_documents(OWNER_ID, args.limit, cursor, fields), args.repeat)
+            offset = await timed_ms(
+                lambda: collection.find(query, projection).sort(LIST_SORT).skip(skip).limit(args.limit).to_list(args.limit),
+                args.repeat,
+            )
+            plan = await collection.find(query, projection).sort(LIST_SORT).skip(skip).limit(args.limit).explain()
+            print(json.dumps({
+                "page": page,
+                "keyset_p50_ms": round(percentile(keyset, 0.5), 2),
+                "keyset_p95_ms": round(percentile(keyset, 0.95), 2),
+                "skip_p50_ms": round(percentile(offset, 0.5), 2),
+                "skip_p95_ms": round(percentile(offset, 0.95), 2),
+                "skip_keys_examined": plan.get("executionStats", {}).get("totalKeysExamined"),
+            }))
+    finally:
+        if not args.keep:
+            await client.drop_database(args.database)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del listado paginado de documentos")
+    parser.add_argument("--documents", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000, 10_000])
+    parser.add_argument("--fields", default="title", help="Proyección del listado (vacío = documento completo)")
+    parser.add_argument("--summary-words", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--database", default="intellidocs_bench")
+    parser.add_argument("--keep", action="store_true", help="No borrar la base de datos al terminar")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
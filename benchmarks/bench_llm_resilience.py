@@ -0,0 +1,78 @@
+# benchmarks/bench_llm_resilience.py
+#
+# Latencia de cola de la capa de proveedores con proveedores simulados:
+# un principal con cola larga (o en "brownout", con errores) y un secundario,
+# con y sin cobertura (hedging).
+#   python -m benchmarks.bench_llm_resilience --requests 400
+
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+from app.services.llm_providers import FakeProvider, ResilientLLM
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+async def run_scenario(name: str, hedging: bool, error_rate: float, args) -> dict:
+    primary = FakeProvider(latency=args.latency, latency_sigma=args.sigma, error_rate=error_rate,
+                           timeout=args.timeout, seed=1, name="primary")
+    secondary = FakeProvider(latency=args.latency * 1.5, latency_sigma=0.3, timeout=args.timeout,
+                             seed=2, name="secondary")
+    llm = ResilientLLM([primary, secondary], max_retries=1, backoff_base=0.05, hedging=hedging)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one() -> tuple[float, bool]:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await llm.generate("prompt de prueba " * 50)
+                ok = True
+            except Exception:
+                ok = False
+            return time.perf_counter() - start, ok
+
+    results = await asyncio.gather(*(one() for _ in range(args.requests)))
+    latencies = [seconds for seconds, ok in results if ok]
+    return {
+        "scenario": name,
+        "hedging": hedging,
+        "primary_error_rate": error_rate,
+        "succeeded": len(latencies),
+        "failed": len(results) - len(latencies),
+        "mean": round(statistics.mean(latencies), 3),
+        "p50": round(percentile(latencies, 0.50), 3),
+        "p95": round(percentile(latencies, 0.95), 3),
+        "p99": round(percentile(latencies, 0.99), 3),
+        "hedges": llm.hedges,
+        "hedge_wins": llm.hedge_wins,
+        "fallbacks": llm.fallbacks,
+        "primary_circuit": primary.breaker.state,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la capa de proveedores de IA")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--sigma", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    for name, hedging, error_rate in [
+        ("long_tail", False, 0.0),
+        ("long_tail", True, 0.0),
+        ("brownout", False, 0.3),
+        ("brownout", True, 0.3),
+    ]:
+        print(json.dumps(await run_scenario(name, hedging, error_rate, args)))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+# benchmarks/bench_llm_scheduler.py
+#
+# Un usuario sube un lote grande y, justo después, varios usuarios piden
+# pocos análisis. Compara la latencia de los usuarios "ligeros" con una cola
+# FIFO (un semáforo global) y con el planificador por turnos. El proveedor
+# simulado devuelve 429 si se supera su capacidad real de llamadas simultáneas.
+#   python -m benchmarks.bench_llm_scheduler --bulk 200 --light-users 5
+
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from functools import partial
+
+from app.services.llm_providers import FakeProvider, RateLimitError, ResilientLLM
+from app.services.llm_scheduler import LLMScheduler, estimate_tokens
+
+PROMPT = "prompt de prueba " * 200
+
+
+class QuotaProvider(FakeProvider):
+    """Proveedor simulado que rechaza con 429 las llamadas por encima de `capacity` simultáneas."""
+
+    def __init__(self, capacity: int, **kwargs):
+        super().__init__(**kwargs)
+        self.capacity = capacity
+        self.active = 0
+
+    async def _generate(self, prompt: str) -> str:
+        if self.active >= self.capacity:
+            await asyncio.sleep(0.01)
+            raise RateLimitError("cuota superada")
+        self.active += 1
+        try:
+            return await super()._generate(prompt)
+        finally:
+            self.active -= 1
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+async def run_scenario(mode: str, args) -> dict:
+    provider = QuotaProvider(args.capacity, latency=args.latency, timeout=30, seed=1)
+    scheduler = LLMScheduler(max_concurrency=args.concurrency, tokens_per_minute=0,
+                             rate_limit_cooldown=args.cooldown)
+    llm = ResilientLLM([provider], max_retries=3, backoff_base=0.05,
+                       on_rate_limit=scheduler.record_rate_limit if mode == "fair" else None)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(owner: str) -> tuple[str, float, bool]:
+        start = time.perf_counter()
+        try:
+            if mode == "fair":
+                await llm.generate(PROMPT, gate=partial(scheduler.run, owner, estimate_tokens(PROMPT)))
+            else:
+                async with semaphore:
+                    await llm.generate(PROMPT)
+            ok = True
+        except Exception:
+            ok = False
+        return owner, time.perf_counter() - start, ok
+
+    async def light_users() -> list:
+        await asyncio.sleep(0.05)
+        return await asyncio.gather(*(
+            one(f"light-{user}") for user in range(args.light_users) for _ in range(args.light_calls)
+        ))
+
+    start = time.perf_counter()
+    bulk, light = await asyncio.gather(
+        asyncio.gather(*(one("bulk") for _ in range(args.bulk))),
+        light_users(),
+    )
+    elapsed = time.perf_counter() - start
+
+    results = [*bulk, *light]
+    light_latencies = [seconds for _, seconds, ok in light if ok]
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 2),
+        "failed": sum(1 for *_, ok in results if not ok),
+        "rate_limited": provider.rate_limited,
+        "light_p50": round(percentile(light_latencies, 0.50), 3) if light_latencies else None,
+        "light_max": round(max(light_latencies), 3) if light_latencies else None,
+        "bulk_mean": round(statistics.mean(s for _, s, ok in bulk if ok), 3),
+        "final_concurrency_limit": round(scheduler.limit, 2) if mode == "fair" else args.concurrency,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark del planificador de llamadas al modelo")
+    parser.add_argument("--bulk", type=int, default=200)
+    parser.add_argument("--light-users", type=int, default=5)
+    parser.add_argument("--light-calls", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--cooldown", type=float, default=0.2)
+    args = parser.parse_args()
+
+    for mode in ("fifo", "fair"):
+        print(json.dumps(await run_scenario(mode, args)))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+# benchmarks/bench_map_reduce.py
+#
+# Latencia del análisis en función de la longitud del documento, con un LLM local
+# simulado: análisis de un solo prompt (prefijo truncado) frente a map-reduce, y
+# coste de reanalizar tras editar una página gracias a la caché de fragmentos.
+#   python -m benchmarks.bench_map_reduce --pages 10 100 500
+
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from app.services.analysis_cache import AnalysisCache
+from app.services.prompts import build_analysis_prompt, MAX_PROMPT_CHARS, parse_analysis
+from app.services.map_reduce import MapReduceAnalyzer
+from app.services.llm_providers import FakeProvider
+from benchmarks.synthetic_pdfs import WORDS
+
+
+def make_pages(count: int, chars_per_page: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    pages = []
+    for number in range(count):
+        paragraphs = []
+        while sum(len(p) for p in paragraphs) < chars_per_page:
+            paragraphs.append(" ".join(rng.choices(WORDS, k=40)) + ".\n")
+        pages.append(f"Página {number + 1}\n" + "\n".join(paragraphs))
+    return pages
+
+
+def offsets_of(pages: list[str]) -> list[int]:
+    offsets, position = [], 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page)
+    return offsets
+
+
+async def timed(coro) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = await coro
+    return time.perf_counter() - start, result
+
+
+async def bench(page_count: int, args) -> dict:
+    pages = make_pages(page_count, args.chars_per_page)
+    text = "".join(pages)
+
+    single_llm = FakeProvider(args.base_latency, args.per_kchar_latency)
+    single_seconds, _ = await timed(single_llm.generate(build_analysis_prompt(text)))
+
+    llm = FakeProvider(args.base_latency, args.per_kchar_latency)
+    analyzer = MapReduceAnalyzer(llm.generate, cache=AnalysisCache(None, maxsize=100_000),
+                                 concurrency=args.concurrency)
+    map_reduce_seconds, analysis = await timed(analyzer.analyze(text, offsets_of(pages)))
+    first_calls = llm.calls
+
+    # Se edita una página en mitad del documento y se vuelve a analizar
+    pages[page_count // 2] = pages[page_count // 2].replace("Página", "Página editada", 1)
+    llm.calls = 0
+    reanalysis_seconds, _ = await timed(analyzer.analyze("".join(pages), offsets_of(pages)))
+
+    return {
+        "pages": page_count,
+        "chars": len(text),
+        "single_pass_seconds": round(single_seconds, 3),
+        "single_pass_coverage": round(min(1.0, MAX_PROMPT_CHARS / len(text)), 3),
+        "map_reduce_seconds": round(map_reduce_seconds, 3),
+        "map_reduce_llm_calls": first_calls,
+        "reanalysis_seconds": round(reanalysis_seconds, 3),
+        "reanalysis_llm_calls": llm.calls,
+        "valid": parse_analysis(json.dumps(analysis)) is not None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark del análisis map-reduce")
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 20, 100, 300])
+    parser.add_argument("--chars-per-page", type=int, default=2500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--base-latency", type=float, default=0.3)
+    parser.add_argument("--per-kchar-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    for page_count in args.pages:
+        print(json.dumps(await bench(page_count, args)))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
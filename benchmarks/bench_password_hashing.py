@@ -0,0 +1,98 @@
+# benchmarks/bench_password_hashing.py
+#
+# Efecto de Argon2 sobre el resto de peticiones durante una avalancha de logins.
+# Mientras varios clientes verifican contraseñas, otro simula peticiones normales
+# (cada `--tick-ms`) y mide cuánto tardan en ser atendidas por el event loop.
+# - inline: verificación síncrona dentro del handler, como antes.
+# - pool: verificación en el pool de hashing; si está saturado responde 503 y el
+#   cliente reintenta.
+#   python -m benchmarks.bench_password_hashing --logins 60 --login-concurrency 30
+
+import os
+import json
+import time
+import asyncio
+import argparse
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+
+from app.security import PasswordHasher, PasswordHashingOverloaded, pwd_context, PASSWORD_HASH_WORKERS
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+async def run(mode: str, args, hashed: str) -> dict:
+    hasher = PasswordHasher(max_workers=args.workers, max_pending=args.max_pending)
+    login_ms: list[float] = []
+    request_ms: list[float] = []
+    rejected = 0
+    logins = iter(range(args.logins))
+    done = asyncio.Event()
+
+    async def login_client():
+        nonlocal rejected
+        for _ in logins:
+            start = time.perf_counter()
+            while True:
+                if mode == "inline":
+                    pwd_context.verify_and_update(args.password, hashed)
+                    break
+                try:
+                    await hasher.verify_and_update(args.password, hashed)
+                    break
+                except PasswordHashingOverloaded:
+                    # 503: el cliente reintenta pasado un momento
+                    rejected += 1
+                    await asyncio.sleep(args.retry_ms / 1000)
+            login_ms.append((time.perf_counter() - start) * 1000)
+
+    async def other_requests():
+        # Petición ligera cada tick: se mide el retraso entre que debería atenderse y que el loop la atiende
+        while not done.is_set():
+            due = time.perf_counter() + args.tick_ms / 1000
+            await asyncio.sleep(args.tick_ms / 1000)
+            request_ms.append((time.perf_counter() - due) * 1000)
+
+    ticker = asyncio.create_task(other_requests())
+    start = time.perf_counter()
+    await asyncio.gather(*(login_client() for _ in range(args.login_concurrency)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker
+    hasher.shutdown()
+
+    return {
+        "mode": mode,
+        "logins": len(login_ms),
+        "logins_per_second": round(len(login_ms) / elapsed, 1),
+        "login_p50_ms": round(percentile(login_ms, 0.5), 1),
+        "login_p95_ms": round(percentile(login_ms, 0.95), 1),
+        "retries_after_503": rejected,
+        "other_requests": len(request_ms),
+        "other_p50_ms": round(percentile(request_ms, 0.5), 2),
+        "other_p99_ms": round(percentile(request_ms, 0.99), 2),
+        "other_max_ms": round(max(request_ms), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del hashing de contraseñas fuera del event loop")
+    parser.add_argument("--logins", type=int, default=60)
+    parser.add_argument("--login-concurrency", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS)
+    parser.add_argument("--max-pending", type=int, default=PASSWORD_HASH_WORKERS * 8)
+    parser.add_argument("--tick-ms", type=float, default=5)
+    parser.add_argument("--retry-ms", type=float, default=200)
+    parser.add_argument("--password", default="correct horse battery staple")
+    args = parser.parse_args()
+
+    hashed = pwd_context.hash(args.password)
+    for mode in ("inline", "pool"):
+        print(json.dumps(asyncio.run(run(mode, args, hashed))))
+
+
+if __name__ == "__main__":
+    main()
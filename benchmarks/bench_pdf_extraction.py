@@ -0,0 +1,56 @@
+# benchmarks/bench_pdf_extraction.py
+#
+# Mide el rendimiento del motor de extracción en función del número de procesos.
+#   python -m benchmarks.bench_pdf_extraction --pages 300 --documents 8
+
+import os
+import time
+import json
+import asyncio
+import argparse
+
+from app.services.pdf_extraction import PdfExtractor
+from benchmarks.synthetic_pdfs import make_pdf
+
+
+async def run(workers: int, pdfs: list[bytes], pages_per_task: int) -> dict:
+    extractor = PdfExtractor(max_workers=workers, pages_per_task=pages_per_task, max_pages=100_000, timeout=600)
+    # Calentamiento: arranca los procesos del pool antes de medir
+    await asyncio.gather(*(extractor.extract(pdfs[0]) for _ in range(workers)))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(extractor.extract(pdf) for pdf in pdfs))
+    elapsed = time.perf_counter() - start
+    extractor.shutdown()
+
+    pages = sum(result.page_count for result in results)
+    return {
+        "workers": workers,
+        "documents": len(pdfs),
+        "pages": pages,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 1),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark del motor de extracción de PDF")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--pages-per-task", type=int, default=50)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    pdfs = [make_pdf(args.pages, seed=i) for i in range(args.documents)]
+
+    worker_counts = sorted({1, 2, 4, 8, 16, args.max_workers} & set(range(1, args.max_workers + 1)))
+    baseline = None
+    for workers in worker_counts:
+        result = await run(workers, pdfs, args.pages_per_task)
+        baseline = baseline or result["pages_per_second"]
+        result["speedup"] = round(result["pages_per_second"] / baseline, 2)
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+# benchmarks/bench_search.py
+#
+# Latencia de la búsqueda BM25 en memoria para un usuario con muchos documentos.
+# Genera documentos sintéticos con un vocabulario de distribución Zipf (como el
+# lenguaje real) y mide la carga del índice desde las entradas guardadas, su
+# memoria y consultas de términos raros, frecuentes y de varias palabras.
+#   python -m benchmarks.bench_search --documents 100000
+
+import gc
+import os
+import json
+import time
+import random
+import argparse
+
+import numpy as np
+
+from benchmarks.synthetic_pdfs import WORDS
+from app.services.search import OwnerIndex, count_terms, tokenize, _add_entries
+
+
+def make_vocabulary(size: int, rng: random.Random) -> list[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = set(WORDS)
+    while len(vocabulary) < size:
+        vocabulary.add("".join(rng.choices(letters, k=rng.randint(4, 10))))
+    return sorted(vocabulary)
+
+
+def make_entries(documents: int, words_per_doc: int, vocabulary: list[str], seed: int) -> list[dict]:
+    """Entradas como las de la colección `search_index`: análisis y frecuencias del texto."""
+    np_rng = np.random.default_rng(seed)
+    entries = []
+    for number in range(documents):
+        # Rango de Zipf acotado al vocabulario
+        ranks = np.minimum(np_rng.zipf(1.1, size=words_per_doc), len(vocabulary)) - 1
+        words = [vocabulary[rank] for rank in ranks]
+        analysis = {"title": " ".join(words[:5]), "summary": " ".join(words[5:40]), "keywords": words[40:45]}
+        entries.append({"_id": str(number), "analysis": analysis, "text_terms": count_terms(" ".join(words))})
+    return entries
+
+
+def current_rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        return None
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la búsqueda BM25")
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--words-per-doc", type=int, default=400)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+
+    entries = make_entries(args.documents, args.words_per_doc, vocabulary, args.seed)
+
+    gc.collect()
+    rss_before = current_rss_mb()
+    index = OwnerIndex()
+    start = time.perf_counter()
+    _add_entries(index, entries)
+    build_seconds = time.perf_counter() - start
+    del entries
+    gc.collect()
+    rss_after = current_rss_mb()
+
+    postings = sorted(index.postings, key=lambda term: len(index.postings[term].slots))
+    kinds = {
+        "rare_term": lambda: [rng.choice(postings[: len(postings) // 2])],
+        "common_term": lambda: [rng.choice(postings[-50:])],
+        "three_terms": lambda: [rng.choice(postings) for _ in range(3)],
+    }
+    print(json.dumps({
+        "documents": len(index),
+        "terms": len(index.postings),
+        "postings": sum(len(p.slots) for p in index.postings.values()),
+        "build_seconds": round(build_seconds, 1),
+        "index_rss_mb": round(rss_after - rss_before, 1) if rss_before else None,
+    }))
+
+    for kind, make_query in kinds.items():
+        latencies = []
+        for _ in range(args.queries):
+            terms = tokenize(" ".join(make_query()))
+            start = time.perf_counter()
+            index.search(terms, 20)
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(json.dumps({
+            "query": kind,
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "max_ms": round(max(latencies), 2),
+        }))
+
+    # Bajas y compactación
+    start = time.perf_counter()
+    for number in range(0, args.documents, 2):
+        index.remove(str(number))
+    print(json.dumps({"removed": args.documents // 2, "remove_seconds": round(time.perf_counter() - start, 2)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/bench_serialization.py
+#
+# Coste de servir documentos de la base de datos: el camino de Pydantic (un modelo por
+# documento, validación del response_model, jsonable + json.dumps) frente a la serialización
+# directa con orjson del listado, y memoria de pico de la exportación NDJSON en streaming
+# frente a construir la respuesta entera. No necesita MongoDB (usa el backend en memoria).
+#   python -m benchmarks.bench_serialization --documents 500 --repeat 200
+#   python -m benchmarks.bench_serialization --documents 500 --export-documents 20000
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_BACKEND", "memory")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+from app.database import document_collection
+from app.models.document import DocumentListItem
+from app.serialization import dumps
+from app.services.document_listing import LIST_PROJECTION, export_owner_documents
+
+OWNER_ID = "bench-owner"
+
+
+def make_documents(count: int, summary_words: int) -> list[dict]:
+    base = datetime(2024, 1, 1)
+    summary = " ".join(["resumen"] * summary_words)
+    return [
+        {
+            "_id": ObjectId(),
+            "filename": f"documento-{number}.pdf",
+            "analysis": {"title": f"Documento {number}", "summary": summary, "keywords": ["uno", "dos", "tres"]},
+            "owner_id": OWNER_ID,
+            "created_at": base + timedelta(seconds=number),
+            "analysis_version": "bench",
+        }
+        for number in range(count)
+    ]
+
+
+def pydantic_path(adapter: TypeAdapter, documents: list[dict]) -> bytes:
+    """Lo que hacía el listado: modelos por documento, validación del response_model y json.dumps."""
+    items = [DocumentListItem(**doc) for doc in documents]
+    content = adapter.dump_python(adapter.validate_python(items), mode="json", by_alias=True, exclude_unset=True)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def orjson_path(documents: list[dict]) -> bytes:
+    return dumps(documents)
+
+
+def per_call_ms(func, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+async def export_peak(count: int, summary_words: int) -> dict:
+    """Memoria de pico (sin contar los datos ya en la base) de exportar `count` documentos."""
+    await document_collection.insert_many(make_documents(count, summary_words))
+
+    tracemalloc.start()
+    materialized = await document_collection.find({"owner_id": OWNER_ID}, LIST_PROJECTION).to_list(None)
+    body = dumps(materialized)
+    _, materialized_peak = tracemalloc.get_traced_memory()
+    del materialized, body
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    exported = 0
+    async for chunk in export_owner_documents(OWNER_ID):
+        exported += chunk.count(b"\n")
+    elapsed = time.perf_counter() - started
+    _, streaming_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "export_documents": exported,
+        "export_docs_per_second": round(exported / elapsed),
+        "materialized_peak_mb": round(materialized_peak / 2**20, 1),
+        "streaming_peak_mb": round(streaming_peak / 2**20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialización de documentos: Pydantic frente a orjson")
+    parser.add_argument("--documents", type=int, default=500, help="Documentos por respuesta del listado")
+    parser.add_argument("--summary-words", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--export-documents", type=int, default=0, help="Mide también la exportación NDJSON")
+    args = parser.parse_args()
+
+    documents = make_documents(args.documents, args.summary_words)
+    projected = [{key: value for key, value in doc.items() if key != "analysis_version"} for doc in documents]
+    adapter = TypeAdapter(list[DocumentListItem])
+
+    if json.loads(pydantic_path(adapter, projected)) != json.loads(orjson_path(projected)):
+        raise SystemExit("Las dos serializaciones no producen el mismo JSON")
+
+    pydantic_ms = per_call_ms(lambda: pydantic_path(adapter, projected), args.repeat)
+    orjson_ms = per_call_ms(lambda: orjson_path(projected), args.repeat)
+    print(json.dumps({
+        "documents": args.documents,
+        "pydantic_ms": round(pydantic_ms, 3),
+        "orjson_ms": round(orjson_ms, 3),
+        "speedup": round(pydantic_ms / orjson_ms, 1),
+    }))
+
+    if args.export_documents:
+        print(json.dumps(asyncio.run(export_peak(args.export_documents, args.summary_words))))
+
+
+if __name__ == "__main__":
+    main()
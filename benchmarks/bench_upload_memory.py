@@ -0,0 +1,137 @@
+# benchmarks/bench_upload_memory.py
+#
+# Compara la memoria pico (VmHWM, solo Linux) de un servidor uvicorn que recibe
+# N subidas concurrentes de un PDF grande, leyendo el cuerpo entero en memoria
+# ("buffered", como antes) o volcándolo por bloques a disco ("spooled").
+#   python -m benchmarks.bench_upload_memory --size-mb 100 --concurrency 8
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import fitz  # PyMuPDF
+import httpx
+from fastapi import FastAPI, UploadFile, File
+
+from app.uploads import UploadSizeLimitMiddleware, spool_upload
+
+
+def make_app(mode: str) -> FastAPI:
+    app = FastAPI()
+
+    if mode == "buffered":
+        @app.post("/upload")
+        async def upload_buffered(file: UploadFile = File(...)):
+            pdf_bytes = await file.read()
+            with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+                return {"pages": doc.page_count}
+    else:
+        app.add_middleware(UploadSizeLimitMiddleware, max_body_bytes=2 * 1024 ** 3)
+
+        @app.post("/upload")
+        async def upload_spooled(file: UploadFile = File(...)):
+            async with spool_upload(file, max_bytes=2 * 1024 ** 3) as upload:
+                with fitz.open(upload.path, filetype="pdf") as doc:
+                    return {"pages": doc.page_count}
+
+    return app
+
+
+def make_large_pdf(path: str, size_mb: int) -> None:
+    """PDF de una página con un adjunto aleatorio para alcanzar el tamaño pedido."""
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Documento de prueba")
+    doc.embfile_add("relleno.bin", os.urandom(size_mb * 1024 * 1024))
+    doc.save(path)
+    doc.close()
+
+
+def read_proc_status(pid: int, field: str) -> int | None:
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+async def wait_until_ready(url: str) -> None:
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("El servidor no arrancó a tiempo.")
+
+
+async def upload(client: httpx.AsyncClient, url: str, path: str) -> int:
+    with open(path, "rb") as pdf:
+        response = await client.post(url, files={"file": ("big.pdf", pdf, "application/pdf")})
+    return response.status_code
+
+
+async def run_mode(mode: str, pdf_path: str, concurrency: int, port: int) -> dict:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_upload_memory", "--serve", mode, "--port", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_until_ready(base_url + "/docs")
+        idle_rss = read_proc_status(server.pid, "VmRSS")
+
+        start = time.perf_counter()
+        async with httpx.AsyncClient(timeout=600) as client:
+            statuses = await asyncio.gather(
+                *(upload(client, base_url + "/upload", pdf_path) for _ in range(concurrency))
+            )
+        elapsed = time.perf_counter() - start
+
+        peak_rss = read_proc_status(server.pid, "VmHWM")
+    finally:
+        server.terminate()
+        server.wait()
+
+    mb = 1024 * 1024
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "statuses": sorted(set(statuses)),
+        "seconds": round(elapsed, 2),
+        "idle_rss_mb": round(idle_rss / mb, 1) if idle_rss else None,
+        "peak_rss_mb": round(peak_rss / mb, 1) if peak_rss else None,
+    }
+
+
+async def main(args) -> None:
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = os.path.join(workdir, "big.pdf")
+        make_large_pdf(pdf_path, args.size_mb)
+        for offset, mode in enumerate(("buffered", "spooled")):
+            result = await run_mode(mode, pdf_path, args.concurrency, args.port + offset)
+            result["upload_mb"] = args.size_mb
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de memoria de subidas concurrentes")
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", choices=["buffered", "spooled"])
+    args = parser.parse_args()
+
+    if args.serve:
+        import uvicorn
+        uvicorn.run(make_app(args.serve), host="127.0.0.1", port=args.port, log_level="warning")
+    else:
+        asyncio.run(main(args))
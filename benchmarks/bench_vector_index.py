@@ -0,0 +1,101 @@
+# benchmarks/bench_vector_index.py
+#
+# Latencia y recall del índice vectorial (coseno exacto frente a preselección por
+# códigos binarios + reordenación) con 10k, 100k y 1M vectores abiertos con memmap.
+# Los vectores se agrupan en temas, como los embeddings de documentos reales.
+#   python -m benchmarks.bench_vector_index --sizes 10000 100000 1000000
+
+import os
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from app.services import vector_index
+from app.services.vector_index import OwnerVectors, binary_codes, EMBEDDING_DIM
+
+CHUNK_ROWS = 65536
+
+
+def build_snapshot(path: str, rows: int, dim: int, topics: int, noise: float, seed: int) -> OwnerVectors:
+    """Escribe por bloques una instantánea sintética y la abre con memmap."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = np.lib.format.open_memmap(os.path.join(path, "vectors.npy"), mode="w+",
+                                        dtype=np.float32, shape=(rows, dim))
+    codes = np.lib.format.open_memmap(os.path.join(path, "codes.npy"), mode="w+",
+                                      dtype=np.uint64, shape=(dim // 64, rows))
+    for start in range(0, rows, CHUNK_ROWS):
+        count = min(CHUNK_ROWS, rows - start)
+        chunk = centers[rng.integers(0, topics, count)] + noise * rng.standard_normal((count, dim), dtype=np.float32)
+        chunk /= np.linalg.norm(chunk, axis=1, keepdims=True)
+        vectors[start:start + count] = chunk
+        codes[:, start:start + count] = binary_codes(chunk).T
+    vectors.flush()
+    codes.flush()
+    del vectors, codes
+
+    return OwnerVectors(
+        dim,
+        np.load(os.path.join(path, "vectors.npy"), mmap_mode="r"),
+        np.load(os.path.join(path, "codes.npy"), mmap_mode="r"),
+        [str(row) for row in range(rows)],
+    )
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del índice vectorial")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--topics", type=int, default=2000)
+    parser.add_argument("--noise", type=float, default=0.8)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--rerank-factor", type=int, default=vector_index.VECTOR_RERANK_FACTOR)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    vector_index.VECTOR_RERANK_FACTOR = args.rerank_factor
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as path:
+            owner_vectors = build_snapshot(path, size, args.dim, args.topics, args.noise, args.seed)
+            rng = np.random.default_rng(args.seed + 1)
+            exact_ms, approximate_ms, recalls = [], [], []
+            for doc_id in rng.integers(0, size, args.queries):
+                query = owner_vectors.vector(str(doc_id))
+                exact, elapsed = timed(owner_vectors.search, query, args.limit, exclude=str(doc_id), approximate=False)
+                exact_ms.append(elapsed)
+                approximate, elapsed = timed(owner_vectors.search, query, args.limit, exclude=str(doc_id), approximate=True)
+                approximate_ms.append(elapsed)
+                expected = {hit for hit, _ in exact}
+                recalls.append(len(expected & {hit for hit, _ in approximate}) / max(len(expected), 1))
+
+            print(json.dumps({
+                "vectors": size,
+                "dim": args.dim,
+                "matrix_mb": round(size * args.dim * 4 / 1024 ** 2),
+                "rerank_factor": args.rerank_factor,
+                "exact_p50_ms": round(percentile(exact_ms, 0.5), 2),
+                "exact_p95_ms": round(percentile(exact_ms, 0.95), 2),
+                "approximate_p50_ms": round(percentile(approximate_ms, 0.5), 2),
+                "approximate_p95_ms": round(percentile(approximate_ms, 0.95), 2),
+                f"recall_at_{args.limit}": round(float(np.mean(recalls)), 3),
+            }))
+            del owner_vectors
+
+
+if __name__ == "__main__":
+    main()
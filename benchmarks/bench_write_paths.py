@@ -0,0 +1,106 @@
+# benchmarks/bench_write_paths.py
+#
+# Operaciones de base de datos y latencia por petición en las rutas de escritura
+# (registro, edición, borrado) y en la lectura de un documento, a través de la API
+# completa con el backend en memoria y una latencia simulada por operación.
+#   python -m benchmarks.bench_write_paths --documents 200 --db-latency-ms 1
+
+import os
+import sys
+import json
+import time
+import argparse
+
+# La base de datos en memoria se elige al importar la aplicación
+os.environ.setdefault("DATABASE_BACKEND", "memory")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+# Argon2 barato: aquí se cuentan viajes a la base de datos, no el coste del hash
+os.environ.setdefault("ARGON2_TIME_COST", "1")
+os.environ.setdefault("ARGON2_MEMORY_COST", "8192")
+os.environ.setdefault("ARGON2_PARALLELISM", "1")
+
+from fastapi.testclient import TestClient
+
+from app import database
+from app.main import app
+from app.repositories import document_repository, user_repository
+from app.models.document import DocumentModel
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+def measure(name: str, requests) -> dict:
+    """Ejecuta las peticiones y devuelve operaciones de base de datos por petición y latencias."""
+    latencies = []
+    before = database.db.calls().copy()
+    for request in requests:
+        start = time.perf_counter()
+        response = request()
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise SystemExit(f"{name}: {response.status_code} {response.text}")
+    calls = database.db.calls() - before
+    return {
+        "endpoint": name,
+        "requests": len(latencies),
+        "db_ops_per_request": round(sum(calls.values()) / len(latencies), 2),
+        "db_ops": {operation: round(count / len(latencies), 2) for operation, count in sorted(calls.items())},
+        "p50_ms": round(percentile(latencies, 0.5), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Viajes a la base de datos por petición en las rutas de escritura")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--db-latency-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if database.DATABASE_BACKEND != "memory":
+        sys.exit("Este benchmark usa DATABASE_BACKEND=memory.")
+
+    with TestClient(app) as client:
+        users = [f"user{number}@example.com" for number in range(20)]
+        for collection in database.db._collections.values():
+            collection.latency = args.db_latency_ms / 1000
+        # La latencia se aplica también a las colecciones creadas después
+        database.db.latency = args.db_latency_ms / 1000
+
+        results = [measure("POST /auth/register", [
+            lambda email=email: client.post("/api/v1/auth/register", json={"email": email, "password": "pw"})
+            for email in users
+        ])]
+
+        token = client.post("/api/v1/auth/login", data={"username": users[0], "password": "pw"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        # Documentos sembrados directamente: el análisis con IA no es lo que se mide
+        me = client.portal.call(user_repository.get_by_email, users[0])
+        ids = []
+        for number in range(args.documents):
+            document = DocumentModel(
+                filename=f"doc{number}.pdf",
+                analysis={"title": f"Documento {number}", "summary": "Resumen", "keywords": ["uno", "dos"]},
+                owner_id=str(me["_id"]),
+            ).model_dump()
+            ids.append(str(client.portal.call(document_repository.create, document)["_id"]))
+
+        results.append(measure("GET /documents/{id}", [
+            lambda doc_id=doc_id: client.get(f"/api/v1/documents/{doc_id}", headers=headers) for doc_id in ids
+        ]))
+        results.append(measure("PUT /documents/{id}", [
+            lambda doc_id=doc_id: client.put(f"/api/v1/documents/{doc_id}", headers=headers, json={"title": "Editado"})
+            for doc_id in ids
+        ]))
+        results.append(measure("DELETE /documents/{id}", [
+            lambda doc_id=doc_id: client.delete(f"/api/v1/documents/{doc_id}", headers=headers) for doc_id in ids
+        ]))
+
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
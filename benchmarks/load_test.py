@@ -0,0 +1,266 @@
+# benchmarks/load_test.py
+#
+# Prueba de carga de la API completa sin servicios externos: la aplicación corre en este
+# mismo proceso con el proveedor de IA simulado (latencia log-normal y tasas de error
+# configurables) y la base de datos en memoria (o un mongod local desechable con
+# --backend mongo y MONGO_URI). Cada usuario virtual se registra, inicia sesión y repite
+# el ciclo subir PDF sintético -> listar -> leer -> editar -> borrar; al final imprime una
+# línea JSON por endpoint (peticiones, errores, rps y latencias p50/p95/p99) y un resumen.
+# Con --output guarda el informe como línea base y con --compare lo contrasta con una
+# anterior (sale con código 1 si algún p95 empeora más de --tolerance).
+#   python -m benchmarks.load_test --users 20 --iterations 5 --pages 1 5 20
+#   python -m benchmarks.load_test --duration 60 --llm-error-rate 0.05 --output base.json
+#   python -m benchmarks.load_test --duration 60 --compare base.json --tolerance 0.2
+# Con --base-url se ataca un servidor ya arrancado (los sustitutos se configuran en su entorno).
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import itertools
+from collections import defaultdict
+
+import httpx
+
+API = "/api/v1"
+
+
+def percentile(samples: list[float], quantile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+def configure_environment(args) -> None:
+    """Sustitutos locales: se eligen por variables de entorno, antes de importar la aplicación."""
+    os.environ["DATABASE_BACKEND"] = args.backend
+    os.environ["MEMORY_DB_LATENCY_MS"] = str(args.db_latency_ms)
+    os.environ["LLM_PRIMARY"] = "fake"
+    os.environ["LLM_SECONDARY"] = ""
+    os.environ["FAKE_LLM_LATENCY"] = str(args.llm_latency)
+    os.environ["FAKE_LLM_LATENCY_SIGMA"] = str(args.llm_sigma)
+    os.environ["FAKE_LLM_PER_KCHAR_LATENCY"] = str(args.llm_per_kchar_latency)
+    os.environ["FAKE_LLM_ERROR_RATE"] = str(args.llm_error_rate)
+    os.environ["FAKE_LLM_RATE_LIMIT_RATE"] = str(args.llm_rate_limit_rate)
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    os.environ.setdefault("EMBEDDINGS_DIR", tempfile.mkdtemp(prefix="intellidocs-load-"))
+    if args.cheap_hashing:
+        # Argon2 barato: con pocos núcleos el hash del registro y el login taparía todo lo demás
+        os.environ.setdefault("ARGON2_TIME_COST", "1")
+        os.environ.setdefault("ARGON2_MEMORY_COST", "8192")
+        os.environ.setdefault("ARGON2_PARALLELISM", "1")
+
+
+class PdfPool:
+    """
+    PDFs sintéticos de los tamaños pedidos, generados una vez. Cada subida lleva un sufijo
+    distinto tras el %EOF (el PDF sigue siendo válido), así que su sha256 es nuevo y no
+    acierta en la caché de análisis: cada subida llama al modelo simulado.
+    """
+
+    def __init__(self, page_counts: list[int], variants: int, seed: int):
+        from benchmarks.synthetic_pdfs import make_pdf
+
+        self.pdfs = [
+            (pages, make_pdf(pages, seed=seed * 1000 + pages * 10 + variant))
+            for pages in page_counts for variant in range(variants)
+        ]
+        self._counter = itertools.count()
+
+    def next(self, rng: random.Random) -> tuple[int, bytes]:
+        pages, data = rng.choice(self.pdfs)
+        return pages, data + b"\n%load-test " + str(next(self._counter)).encode() + b"\n"
+
+
+class Recorder:
+    """Latencias y códigos de estado por endpoint."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.transport_errors: dict[str, int] = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str,
+                      **kwargs) -> httpx.Response | None:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.transport_errors[endpoint] += 1
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        self.statuses[endpoint][response.status_code] += 1
+        return response
+
+    def report(self, elapsed: float) -> list[dict]:
+        rows = []
+        for endpoint in sorted(self.latencies.keys() | self.transport_errors.keys()):
+            samples = self.latencies.get(endpoint, [])
+            statuses = self.statuses.get(endpoint, {})
+            errors = sum(count for code, count in statuses.items() if code >= 400) + self.transport_errors[endpoint]
+            row = {
+                "endpoint": endpoint,
+                "requests": len(samples) + self.transport_errors[endpoint],
+                "errors": errors,
+                "statuses": {str(code): count for code, count in sorted(statuses.items())},
+                "rps": round(len(samples) / elapsed, 2),
+            }
+            if samples:
+                row.update({
+                    "p50_ms": round(percentile(samples, 0.50) * 1000, 1),
+                    "p95_ms": round(percentile(samples, 0.95) * 1000, 1),
+                    "p99_ms": round(percentile(samples, 0.99) * 1000, 1),
+                    "max_ms": round(max(samples) * 1000, 1),
+                })
+            rows.append(row)
+        return rows
+
+
+async def virtual_user(number: int, client: httpx.AsyncClient, recorder: Recorder, pdfs: PdfPool,
+                       args, deadline: float | None) -> None:
+    rng = random.Random(args.seed * 100_000 + number)
+    credentials = {"email": f"load-{args.seed}-{number}@example.com", "password": f"password-{number}"}
+
+    await recorder.request(client, "POST /auth/register", "POST", f"{API}/auth/register", json=credentials)
+    response = await recorder.request(client, "POST /auth/login", "POST", f"{API}/auth/login",
+                                      data={"username": credentials["email"], "password": credentials["password"]})
+    if response is None or response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    for iteration in itertools.count():
+        if (deadline is None and iteration >= args.iterations) or (deadline is not None and time.monotonic() >= deadline):
+            return
+        pages, pdf = pdfs.next(rng)
+        response = await recorder.request(
+            client, "POST /documents", "POST", f"{API}/documents/", headers=headers,
+            files={"file": (f"sintetico-{pages}p.pdf", pdf, "application/pdf")},
+        )
+        await recorder.request(client, "GET /documents", "GET", f"{API}/documents/", headers=headers,
+                               params={"limit": args.list_limit})
+        if response is None or response.status_code != 201:
+            continue
+
+        document_url = f"{API}/documents/{response.json()['_id']}"
+        await recorder.request(client, "GET /documents/{id}", "GET", document_url, headers=headers)
+        await recorder.request(client, "PUT /documents/{id}", "PUT", document_url, headers=headers,
+                               json={"title": f"Documento {number}-{iteration}", "keywords": ["carga", "prueba"]})
+        if rng.random() < args.delete_ratio:
+            await recorder.request(client, "DELETE /documents/{id}", "DELETE", document_url, headers=headers)
+
+
+async def run(args) -> tuple[list[dict], dict]:
+    pdfs = PdfPool(args.pages, args.pdf_variants, args.seed)
+    recorder = Recorder()
+    timeout = httpx.Timeout(args.request_timeout)
+
+    async def drive(client: httpx.AsyncClient) -> float:
+        deadline = time.monotonic() + args.duration if args.duration else None
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def limited(number: int) -> None:
+            async with semaphore:
+                await virtual_user(number, client, recorder, pdfs, args, deadline)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(limited(number) for number in range(args.users)))
+        return time.perf_counter() - start
+
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as client:
+            elapsed = await drive(client)
+    else:
+        from app.main import app
+
+        # La aplicación en este proceso, con su arranque y parada, sin pasar por la red
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=timeout) as client:
+                elapsed = await drive(client)
+
+    rows = recorder.report(elapsed)
+    total = sum(row["requests"] for row in rows)
+    summary = {
+        "summary": True,
+        "target": args.base_url or "in-process",
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "pages": args.pages,
+    }
+    if not args.base_url:
+        # Contra un servidor externo los sustitutos dependen de su entorno, no de estos argumentos
+        summary.update(backend=args.backend, db_latency_ms=args.db_latency_ms, llm_latency=args.llm_latency,
+                       llm_sigma=args.llm_sigma, llm_error_rate=args.llm_error_rate)
+    summary.update({
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "errors": sum(row["errors"] for row in rows),
+        "throughput_rps": round(total / elapsed, 2),
+    })
+    return rows, summary
+
+
+def compare(rows: list[dict], baseline_path: str, tolerance: float) -> list[dict]:
+    """Endpoints cuyo p95 supera el de la línea base en más de `tolerance` (fracción)."""
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = {row["endpoint"]: row for row in json.load(baseline_file)["endpoints"]}
+    regressions = []
+    for row in rows:
+        before = baseline.get(row["endpoint"], {}).get("p95_ms")
+        if before and "p95_ms" in row and row["p95_ms"] > before * (1 + tolerance):
+            regressions.append({"regression": row["endpoint"], "baseline_p95_ms": before, "p95_ms": row["p95_ms"],
+                                "change": round(row["p95_ms"] / before - 1, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API con sustitutos locales de la IA y MongoDB")
+    parser.add_argument("--users", type=int, default=20, help="Usuarios virtuales")
+    parser.add_argument("--concurrency", type=int, default=20, help="Usuarios virtuales activos a la vez")
+    parser.add_argument("--iterations", type=int, default=5, help="Ciclos por usuario (si no se da --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Segundos de carga; cada usuario repite ciclos hasta entonces")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 5, 20], help="Páginas de los PDFs sintéticos")
+    parser.add_argument("--pdf-variants", type=int, default=3, help="PDFs distintos por tamaño")
+    parser.add_argument("--list-limit", type=int, default=20)
+    parser.add_argument("--delete-ratio", type=float, default=1.0, help="Fracción de documentos que se borran al final del ciclo")
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--db-latency-ms", type=float, default=1.0, help="Latencia simulada por operación (backend en memoria)")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Mediana de la latencia del modelo simulado (s)")
+    parser.add_argument("--llm-sigma", type=float, default=0.5, help="Dispersión log-normal de esa latencia (0 = fija)")
+    parser.add_argument("--llm-per-kchar-latency", type=float, default=0.0, help="Latencia extra por cada 1000 caracteres del prompt")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--cheap-hashing", action="store_true", help="Argon2 con coste mínimo")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--base-url", default=None, help="Servidor ya arrancado en vez de la aplicación en proceso")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Guarda el informe (JSON) para usarlo como línea base")
+    parser.add_argument("--compare", default=None, help="Informe de una ejecución anterior con el que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento admitido del p95 al comparar")
+    args = parser.parse_args()
+
+    if not args.base_url:
+        configure_environment(args)
+    rows, summary = asyncio.run(run(args))
+
+    for row in rows:
+        print(json.dumps(row))
+    print(json.dumps(summary))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump({"summary": summary, "endpoints": rows}, output, indent=2)
+
+    if args.compare:
+        regressions = compare(rows, args.compare, args.tolerance)
+        for regression in regressions:
+            print(json.dumps(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# benchmarks/synthetic_pdfs.py
+
+import random
+import fitz  # PyMuPDF
+
+WORDS = (
+    "contrato informe análisis documento cláusula empresa cliente proveedor factura "
+    "pago plazo servicio acuerdo anexo revisión riesgo auditoría presupuesto proyecto "
+    "report analysis agreement invoice payment schedule service review budget project "
+    "data model system result summary objective requirement delivery quality"
+).split()
+
+
+def make_pdf(pages: int, lines_per_page: int = 40, seed: int = 0) -> bytes:
+    """Genera con PyMuPDF un PDF sintético de `pages` páginas con texto pseudoaleatorio."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        lines = [f"Página {number + 1}"]
+        lines += [" ".join(rng.choices(WORDS, k=12)) for _ in range(lines_per_page)]
+        page.insert_text((40, 40), "\n".join(lines), fontsize=8)
+    data = doc.tobytes(garbage=0)
+    doc.close()
+    return data
@@ -0,0 +1,33 @@
+# tests/test_condensation.py
+
+from app.services.condensation import condense, split_sentences
+
+
+def test_texto_corto_sin_cambios():
+    assert condense("Una frase. Otra frase.", 100) == "Una frase. Otra frase."
+
+
+def test_texto_sin_puntuacion():
+    text = "palabra " * 2000
+    result = condense(text, 4000)
+    assert result.strip()
+    assert len(result) <= 4000
+
+
+def test_una_frase_enorme():
+    text = "Introducción breve del documento. " + "x" * 10000 + "."
+    result = condense(text, 4000)
+    assert "x" * 500 in result
+    assert len(result) <= 4000
+
+
+def test_texto_cjk():
+    sentence = "契約の条件について説明します。"
+    assert split_sentences(sentence * 3) == [sentence] * 3
+    result = condense(sentence * 1000, 4000)
+    assert sentence in result
+    assert len(result) <= 4000
+
+
+def test_presupuesto_minimo():
+    assert condense("abc " * 100, 1) == "a"